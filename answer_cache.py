@@ -0,0 +1,133 @@
+# answer_cache.py
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Cosine similarity above which a past question counts as the same question
+DEFAULT_SIMILARITY_THRESHOLD = float(os.getenv("DOCTALK_ANSWER_CACHE_THRESHOLD", "0.95"))
+# Seconds a cached answer stays valid
+DEFAULT_ANSWER_TTL = int(os.getenv("DOCTALK_ANSWER_CACHE_TTL", "3600"))
+DEFAULT_MAX_ANSWERS_PER_SET = 256
+DEFAULT_MAX_DOC_SETS = 64
+DEFAULT_MAX_QUERY_EMBEDDINGS = 4096
+
+
+class QueryEmbeddingCache:
+    """
+    Exact-match LRU cache of normalized query embeddings, keyed by (model, query).
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_QUERY_EMBEDDINGS):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str, query: str):
+        key = (model_name, query)
+        with self._lock:
+            emb = self._entries.get(key)
+            if emb is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return emb
+
+    def put(self, model_name: str, query: str, embedding):
+        # Cached arrays are shared between callers, so they are made read-only
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[(model_name, query)] = embedding
+            self._entries.move_to_end((model_name, query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def history_signature(chat_history) -> str:
+    """
+    Hash of the previous questions that go into the prompt. Answers to the same
+    question with a different conversation behind it are cached separately.
+    """
+    questions = [turn.get("user", "") for turn in (chat_history or [])[-4:]]
+    return hashlib.sha256("\n".join(questions).encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Cache of LLM answers keyed by document set, matched by cosine similarity of
+    the question embeddings. Each document set keeps its own matrix of past
+    question embeddings, so a lookup is one matrix-vector product.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SIMILARITY_THRESHOLD, ttl: int = DEFAULT_ANSWER_TTL,
+                 max_answers_per_set: int = DEFAULT_MAX_ANSWERS_PER_SET, max_doc_sets: int = DEFAULT_MAX_DOC_SETS):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_answers_per_set = max_answers_per_set
+        self.max_doc_sets = max_doc_sets
+        self.hits = 0
+        self.misses = 0
+        # (doc set key, history signature) -> list of (embedding, question, answer, chunks, created)
+        self._sets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live_entries(self, key):
+        entries = self._sets.get(key, [])
+        cutoff = time.time() - self.ttl
+        entries = [e for e in entries if e[4] >= cutoff]
+        if entries:
+            self._sets[key] = entries
+        else:
+            self._sets.pop(key, None)
+        return entries
+
+    def lookup(self, doc_set_key: str, history_sig: str, q_emb):
+        """
+        Return (answer, chunks) of the most similar past question, or None.
+        q_emb must be L2-normalized, shape (d,) or (1, d).
+        """
+        key = (doc_set_key, history_sig)
+        with self._lock:
+            entries = self._live_entries(key)
+            if not entries:
+                self.misses += 1
+                return None
+            matrix = np.stack([e[0] for e in entries])
+            scores = matrix @ np.asarray(q_emb, dtype=np.float32).reshape(-1)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._sets.move_to_end(key)
+            self.hits += 1
+            return entries[best][2], entries[best][3]
+
+    def store(self, doc_set_key: str, history_sig: str, q_emb, question: str, answer: str, chunks=None):
+        key = (doc_set_key, history_sig)
+        emb = np.asarray(q_emb, dtype=np.float32).reshape(-1)
+        with self._lock:
+            entries = self._live_entries(key)
+            entries.append((emb, question, answer, list(chunks or []), time.time()))
+            self._sets[key] = entries[-self.max_answers_per_set:]
+            self._sets.move_to_end(key)
+            while len(self._sets) > self.max_doc_sets:
+                self._sets.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": sum(len(entries) for entries in self._sets.values()),
+            }
@@ -0,0 +1,447 @@
+# api.py
+"""
+Headless HTTP API over the same pipeline as the Streamlit app.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+    python api.py --port 8000
+
+Endpoints (JSON unless noted):
+    POST   /sessions                              create a session -> {"session_id"}; {"bundle": name}
+                                                  serves a prebuilt index bundle (see batch_ingest.py)
+    GET    /bundles                               bundles mounted from DOCTALK_BUNDLE_DIR
+    DELETE /sessions/{sid}                        drop a session, its index and uploads
+    POST   /sessions/{sid}/documents              multipart upload of PDF/DOCX files; starts indexing
+    DELETE /sessions/{sid}/documents/{doc_id}     remove one document
+    GET    /sessions/{sid}/documents              indexed documents and indexing progress
+    POST   /sessions/{sid}/retrieve               {"query", "k"} -> matching chunks
+    POST   /sessions/{sid}/answer                 {"question", "top_k", "chat_history", "stream"}
+                                                  stream=true answers as Server-Sent Events
+    GET    /healthz, /metrics                     liveness and scheduler queues, Prometheus metrics
+
+The event loop only does I/O. Extraction and embedding run in the background
+ingestion threads, and retrieval and LLM calls run in a thread pool, so one
+process serves many concurrent chats. Sessions live in the process that
+created them, so load balancers must route by session id (sticky sessions).
+Built indexes go to the shared on-disk cache (DOCTALK_CACHE_DIR), which lets a
+session that moves to another node reload its index there. Sessions unused for
+DOCTALK_SESSION_TTL_S (default: an hour, like idle stores in the store pool) are
+closed with their uploads and index.
+
+Indexing, retrieval and LLM calls are admitted by the scheduler (scheduler.py).
+When a queue is full the request is rejected with 503 and a Retry-After header
+instead of piling up; a streamed answer is only started once it has its LLM slot.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+import chatbot
+from index_bundle import BundleError, bundles
+from pdf_reader import iter_file_section
+from scheduler import Overloaded, pool, snapshot
+from store_manager import DEFAULT_IDLE_FORGET_SECONDS, StoreEvicted
+from telemetry import prometheus_text
+
+# Threads for blocking calls (retrieval, LLM requests, file hashing)
+API_WORKERS = int(os.getenv("DOCTALK_API_WORKERS", "32"))
+MAX_UPLOAD_MB = int(os.getenv("DOCTALK_MAX_UPLOAD_MB", "200"))
+UPLOAD_DIR = os.getenv("DOCTALK_UPLOAD_DIR") or None
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+# Uploads are copied to the session's directory this many bytes at a time
+COPY_BUFFER_BYTES = 1024 * 1024
+SESSION_TTL_SECONDS = float(os.getenv("DOCTALK_SESSION_TTL_S", str(DEFAULT_IDLE_FORGET_SECONDS)))
+# Expired sessions are looked for at most this often
+SESSION_SWEEP_SECONDS = 60
+
+executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="doctalk-api")
+app = FastAPI(title="DocTalk API")
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request, e: Overloaded):
+    return JSONResponse(status_code=503, content={"detail": str(e), "pool": e.pool},
+                        headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+
+@app.exception_handler(StoreEvicted)
+async def store_evicted(request, e: StoreEvicted):
+    # The session's index is gone from the cache; the client uploads its documents again
+    return JSONResponse(status_code=410, content={"detail": str(e)})
+
+
+class ApiSession:
+    """Uploaded files (kept on disk until the session is deleted) and the current ingestion job."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.directory = tempfile.mkdtemp(prefix=f"doctalk-{session_id}-", dir=UPLOAD_DIR)
+        self.files = {}  # doc id (content hash) -> (name, path)
+        self.job = None
+        self.bundle = None  # Manifest of the index bundle the session serves, if any
+        self.bundle_name = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def expired(self, now: float) -> bool:
+        """Unused for SESSION_TTL_SECONDS and not indexing."""
+        return now - self.last_used > SESSION_TTL_SECONDS and (self.job is None or self.job.done)
+
+    def documents(self):
+        """The documents mapping expected by VectorStore.sync_documents."""
+        return {
+            doc_id: (name, lambda path=path, name=name: _iter_upload(path, name))
+            for doc_id, (name, path) in self.files.items()
+        }
+
+    def start_ingestion(self):
+        """Sync the store with the current files, replacing any running job."""
+        previous = self.job
+        if previous is not None and not previous.done:
+            previous.cancel()
+            previous.wait()
+        self.job = chatbot.start_ingestion(self.documents(), session_id=self.session_id)
+
+    def close(self):
+        if self.job is not None:
+            self.job.cancel()
+        chatbot.release_vector_store(self.session_id)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _open_upload(path: str, name: str):
+    raw = io.FileIO(path, "rb")
+    raw.name = name  # Used for the file type and the end-of-file separator
+    return io.BufferedReader(raw)
+
+
+def _iter_upload(path: str, name: str):
+    with _open_upload(path, name) as file:
+        yield from iter_file_section(file)
+
+
+class _HashingWriter:
+    """Writes to a file and hashes what it writes (the doc id, as index_cache.hash_file computes it)."""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_last_sweep = time.monotonic()
+
+
+def _expire_sessions():
+    """Close sessions that have expired; checked at most every SESSION_SWEEP_SECONDS."""
+    global _last_sweep
+    now = time.monotonic()
+    with _sessions_lock:
+        if now - _last_sweep < SESSION_SWEEP_SECONDS:
+            return
+        _last_sweep = now
+        expired = [sid for sid, session in _sessions.items() if session.expired(now)]
+        closing = [_sessions.pop(sid) for sid in expired]
+    for session in closing:
+        executor.submit(session.close)  # Deletes files: not on the event loop
+
+
+def _session(session_id: str) -> ApiSession:
+    _expire_sessions()
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session '{session_id}'")
+    return session
+
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, lambda: fn(*args, **kwargs))
+
+
+def _job_status(session: ApiSession) -> dict:
+    job = session.job
+    if job is None:
+        return {"state": "idle"}
+    state = "failed" if job.error is not None else "done" if job.done else "queued" if job.queue_position else "indexing"
+    return {
+        "state": state,
+        "message": job.status_text(),
+        "queue_position": job.queue_position,
+        "docs_done": job.docs_done,
+        "docs_total": job.docs_total,
+        "chunks_indexed": job.chunks_indexed,
+        "summary": job.summary,
+    }
+
+
+# -------------------------------
+# Request bodies
+# -------------------------------
+class CreateSessionRequest(BaseModel):
+    bundle: Optional[str] = None
+
+
+class RetrieveRequest(BaseModel):
+    query: str
+    k: int = 3
+
+
+class AnswerRequest(BaseModel):
+    question: str
+    top_k: int = 3
+    chat_history: Optional[List[dict]] = None
+    stream: bool = True
+
+
+# -------------------------------
+# Sessions and documents
+# -------------------------------
+@app.post("/sessions", status_code=201)
+async def create_session(body: Optional[CreateSessionRequest] = None):
+    """Create a session; with a bundle name, the session answers from that bundle's documents."""
+    _expire_sessions()
+    session_id = uuid.uuid4().hex
+    path = None
+    if body is not None and body.bundle:
+        path = bundles.path(body.bundle)
+        if path is None:
+            raise HTTPException(status_code=404, detail=f"Unknown bundle '{body.bundle}'")
+    session = await run_blocking(ApiSession, session_id)
+    if path is not None:
+        try:
+            session.bundle = await run_blocking(chatbot.open_bundle, path, session_id=session_id)
+            session.bundle_name = body.bundle
+        except BundleError as e:
+            await run_blocking(session.close)
+            raise HTTPException(status_code=422, detail=str(e))
+    with _sessions_lock:
+        _sessions[session_id] = session
+    return {"session_id": session_id}
+
+
+@app.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    session = _session(session_id)
+    with _sessions_lock:
+        _sessions.pop(session_id, None)
+    await run_blocking(session.close)
+
+
+@app.post("/sessions/{session_id}/documents", status_code=202)
+async def upload_documents(session_id: str, files: List[UploadFile] = File(...)):
+    """Store the uploaded files and start indexing them in the background."""
+    session = _session(session_id)
+    if session.bundle is not None:
+        raise HTTPException(status_code=409, detail="This session serves an index bundle; its documents are fixed")
+    for upload in files:
+        if not upload.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=415, detail=f"{upload.filename}: only PDF and DOCX files are supported")
+    pool("ingest").check()  # Shed before storing files that could not be indexed
+
+    def save():
+        # Each upload is streamed to disk and hashed on the way, never held in memory whole
+        temporary = []
+        try:
+            stored = []  # (name, doc id, temporary path)
+            total = sum(os.path.getsize(path) for _, path in session.files.values())
+            for upload in files:
+                fd, tmp = tempfile.mkstemp(suffix=".upload", dir=session.directory)
+                temporary.append(tmp)
+                with os.fdopen(fd, "wb") as f:
+                    writer = _HashingWriter(f)
+                    upload.file.seek(0)
+                    shutil.copyfileobj(upload.file, writer, COPY_BUFFER_BYTES)
+                total += writer.size
+                if total > MAX_UPLOAD_MB * 1024 * 1024:
+                    raise HTTPException(status_code=413, detail=f"Total upload size must stay under {MAX_UPLOAD_MB}MB")
+                stored.append((upload.filename, writer.sha256.hexdigest(), tmp))
+            added = []
+            with session.lock:
+                for name, doc_id, tmp in stored:
+                    if doc_id not in session.files:
+                        path = os.path.join(session.directory, doc_id)
+                        os.replace(tmp, path)
+                        session.files[doc_id] = (name, path)
+                    added.append({"doc_id": doc_id, "name": name})
+                session.start_ingestion()
+            return added
+        finally:
+            for tmp in temporary:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    added = await run_blocking(save)
+    return {"documents": added, "ingest": _job_status(session)}
+
+
+@app.delete("/sessions/{session_id}/documents/{doc_id}")
+async def delete_document(session_id: str, doc_id: str):
+    session = _session(session_id)
+
+    def remove():
+        with session.lock:
+            entry = session.files.pop(doc_id, None)
+            if entry is None:
+                raise HTTPException(status_code=404, detail=f"Unknown document '{doc_id}'")
+            os.remove(entry[1])
+            session.start_ingestion()
+
+    await run_blocking(remove)
+    return {"ingest": _job_status(session)}
+
+
+@app.get("/sessions/{session_id}/documents")
+async def list_documents(session_id: str):
+    session = _session(session_id)
+    if session.bundle is not None:
+        return {
+            "documents": [{"doc_id": f["doc_id"], "name": f["name"], "chunks": f.get("chunks")}
+                          for f in session.bundle.get("files", [])],
+            "ingest": {"state": "done", "bundle": session.bundle_name},
+        }
+    return {
+        "documents": [{"doc_id": doc_id, "name": name} for doc_id, (name, _) in session.files.items()],
+        "ingest": _job_status(session),
+        # Chunks stored vs. vectors embedded: what duplicate elimination saved
+        "dedup": await run_blocking(lambda: chatbot.stores.get(session_id).dedup_report()),
+    }
+
+
+# -------------------------------
+# Retrieval and answers
+# -------------------------------
+@app.post("/sessions/{session_id}/retrieve")
+async def retrieve(session_id: str, body: RetrieveRequest):
+    _session(session_id)
+
+    def search():
+        store = chatbot.stores.get(session_id)
+        with pool("query").slot(session_id):
+            ids = store.retrieve_ids(body.query, k=body.k)
+        return [{"id": cid, "doc_id": doc_id, "page": store.page_of(cid), "sources": list(sources), "text": text}
+                for cid, doc_id, text, sources in store.chunk_records(ids)]
+
+    return {"chunks": await run_blocking(search)}
+
+
+def _sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/sessions/{session_id}/answer")
+async def answer(session_id: str, body: AnswerRequest):
+    """
+    Answer a question. With stream=true (the default) the answer is sent as
+    Server-Sent Events: {"text": ...} per delta, then an "end" event. A client
+    that disconnects cancels the LLM request. Rejected with 503 when the
+    query or LLM queue is full.
+    """
+    _session(session_id)
+    if not body.stream:
+        result = await run_blocking(
+            chatbot.answer_with_rag, body.question, top_k=body.top_k, return_chunks=True,
+            chat_history=body.chat_history, session_id=session_id,
+        )
+        answer_text, chunks = result if isinstance(result, tuple) else (result, [])
+        return {"answer": answer_text, "chunks": chunks}
+
+    stream = await run_blocking(
+        chatbot.answer_with_rag, body.question, top_k=body.top_k, stream=True,
+        chat_history=body.chat_history, session_id=session_id,
+    )
+    if isinstance(stream, str):  # Nothing to stream (e.g. no relevant chunks)
+        stream = iter([stream])
+
+    done = object()
+    step_lock = threading.Lock()  # A generator cannot be closed while another thread advances it
+
+    def step():
+        with step_lock:
+            return next(stream, done)
+
+    # The first delta waits for an LLM slot; getting it before the response
+    # starts lets a full queue still be answered with 503
+    first = await run_blocking(step)
+
+    def close():
+        with step_lock:
+            if hasattr(stream, "close"):
+                stream.close()
+
+    async def events():
+        try:
+            delta = first
+            while delta is not done:
+                yield _sse({"text": delta})
+                delta = await run_blocking(step)
+            yield _sse({}, event="end")
+        finally:
+            # Runs on completion and when the client disconnects; closing the
+            # generator releases the LLM connection
+            await run_blocking(close)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# -------------------------------
+# Operations
+# -------------------------------
+@app.get("/bundles")
+async def list_bundles():
+    return {"bundles": await run_blocking(bundles.names)}
+
+
+@app.get("/healthz")
+async def healthz():
+    _expire_sessions()
+    with _sessions_lock:
+        sessions = len(_sessions)
+    # resident_bytes() takes the store pool's lock: not on the event loop
+    return {"status": "ok", "sessions": sessions, "resident_bytes": await run_blocking(chatbot.stores.resident_bytes),
+            "scheduler": snapshot()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return prometheus_text()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the DocTalk HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,22 @@
 import streamlit as st
-from pdf_reader import extract_text_from_file, extract_text_from_files, PDFProcessError
-from chatbot import build_vector_store_from_text, answer_with_rag
-from st_ui import configure_page, render_sidebar_header, render_about_section, export_chat_history_to_pdf
-import re
+import os
+import time
+from pdf_reader import iter_file_section
+from chatbot import start_ingestion, release_vector_store, answer_with_rag
+from index_cache import hash_file
+from st_ui import configure_page, render_sidebar_header, render_about_section, render_debug_panel
+from chat_export import export_chat_history_to_pdf, history_key
+from chat_render import StreamRenderer, render_markdown_with_codeblocks
+from scheduler import Overloaded
+from store_manager import StoreEvicted
+from telemetry import record
+import uuid
 
+# Total upload size. Chunk text is kept on disk (see chunk_store.py), so memory
+# grows with the number of chunks rather than the amount of text
+MAX_UPLOAD_MB = int(os.getenv("DOCTALK_MAX_UPLOAD_MB", "200"))
+
+rerun_start = time.perf_counter()
 configure_page()
 render_sidebar_header("assets/logo.png") 
 
@@ -12,6 +25,18 @@ render_sidebar_header("assets/logo.png")
 # -------------------------------
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+# Each browser session gets its own vector store in the shared pool
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+session_id = st.session_state.session_id
+
+def reset_session():
+    """Clear the session state and free this session's vector store."""
+    job = st.session_state.get("ingest_job")
+    if job is not None:
+        job.cancel()
+    release_vector_store(session_id)
+    st.session_state.clear()
 
 # Hide header/subheader if chat has started
 show_headers = len(st.session_state.chat_history) == 0 and "bot" not in st.session_state.chat_history[-1] if st.session_state.chat_history else True
@@ -22,24 +47,24 @@ if len(st.session_state.chat_history) == 0:
 # ---------------------------------------
 # STEP 1: Upload PDF & Build Vector Store
 # ---------------------------------------
-st.sidebar.header("📄 Upload PDF or DOCX (multiple, max 50MB total)")
+st.sidebar.header(f"📄 Upload PDF or DOCX (multiple, max {MAX_UPLOAD_MB}MB total)")
 uploaded_files = st.sidebar.file_uploader(
     "Choose PDF or DOCX files",
     type=["pdf", "docx"],
     accept_multiple_files=True,
-    help="You can upload multiple files, but the total size must be under 50MB."
+    help=f"You can upload multiple files, but the total size must be under {MAX_UPLOAD_MB}MB."
 )
 
 if not uploaded_files:
-    st.session_state.clear()
+    reset_session()
     st.info("👈 Upload one or more PDF/DOCX files in the sidebar to get started.")
     st.stop()
 
-# Enforce total size limit (50MB)
+# Enforce total size limit
 total_size = sum(getattr(f, 'size', 0) for f in uploaded_files)
-if total_size > 50 * 1024 * 1024:
-    st.error(f"⚠️ Total upload size is {total_size/1024/1024:.2f} MB. Please keep all files under 50MB combined.")
-    st.session_state.clear()
+if total_size > MAX_UPLOAD_MB * 1024 * 1024:
+    st.error(f"⚠️ Total upload size is {total_size/1024/1024:.2f} MB. Please keep all files under {MAX_UPLOAD_MB}MB combined.")
+    reset_session()
     st.stop()
 
 # Build a unique key for the current set of files (filenames + sizes)
@@ -50,50 +75,93 @@ if (
     or st.session_state.get("last_file_key") != file_key
 ):
     try:
-        with st.spinner("Processing your files..."):
-            full_text = extract_text_from_files(uploaded_files)
-        if full_text:
-            build_vector_store_from_text(full_text)
-            st.session_state["vector_store_built"] = True
-            st.session_state["last_file_key"] = file_key
-            st.sidebar.success("✅ Vector store ready! You can now ask questions.")
-    except PDFProcessError as e:
-        st.error(f"⚠️ {str(e)}")
-        st.session_state.clear()
+        # Content hashes are only computed when the file set changes, not on every rerun.
+        # Only files that are not indexed yet get extracted and embedded.
+        documents = {
+            hash_file(f): (getattr(f, 'name', 'UnknownFile'), lambda f=f: iter_file_section(f))
+            for f in uploaded_files
+        }
+        previous_job = st.session_state.get("ingest_job")
+        if previous_job is not None and not previous_job.done:
+            previous_job.cancel()
+            previous_job.wait()
+        # Index in the background; the chat is usable while chunks are still being added
+        st.session_state["ingest_job"] = start_ingestion(documents, session_id=session_id)
+        st.session_state["vector_store_built"] = True
+        st.session_state["last_file_key"] = file_key
+    except Overloaded as e:
+        # Nothing is recorded as indexed, so the next rerun tries again
+        st.warning(f"⏳ Too many documents are being indexed right now. Please try again in {e.retry_after:.0f}s.")
         st.stop()
     except Exception as e:
         st.error("⚠️ An unexpected error occurred while processing the files. Please try again with different files.")
-        st.session_state.clear()
+        reset_session()
         st.stop()
 
+@st.fragment(run_every=1.0)
+def render_ingest_progress(job):
+    """
+    Poll the background ingestion job and show how many chunks are searchable.
+    Triggers one full rerun when the job finishes, after which it is no longer polled.
+    """
+    if job.done:
+        st.rerun()
+    st.info(f"⏳ {job.status_text()} You can already ask questions.")
+
+ingest_job = st.session_state.get("ingest_job")
+if ingest_job is not None:
+    if not ingest_job.done:
+        with st.sidebar:
+            render_ingest_progress(ingest_job)
+    elif isinstance(ingest_job.error, Overloaded):
+        # Waited too long for an indexing slot; index again on the next rerun
+        st.sidebar.warning(f"⏳ {ingest_job.status_text()}")
+        st.session_state.pop("last_file_key", None)
+    elif ingest_job.error is not None:
+        st.error("⚠️ An unexpected error occurred while processing the files. Please try again with different files.")
+        reset_session()
+        st.stop()
+    else:
+        st.sidebar.success(f"✅ {ingest_job.status_text()} You can now ask questions.")
+
 # ---------------------------------------
 # STEP 2: Render Chat History (smartly)
 # ---------------------------------------
 st.subheader("Chat")
 
-def render_markdown_with_codeblocks(text):
+def stream_answer(chunks, placeholder):
     """
-    Render markdown text with code blocks using st.code for code and st.markdown for other text.
-    This ensures the copy button works for full code blocks.
+    Render a streamed answer into placeholder as it arrives and return the full text.
+    Redraws are batched and only touch the unfinished tail (see chat_render.py).
+    The time spent re-rendering is recorded separately from the time spent waiting.
     """
-    code_block_pattern = re.compile(r"```([\w\+\-]*)\n([\s\S]*?)```", re.MULTILINE)
-    pos = 0
-    for match in code_block_pattern.finditer(text):
-        start, end = match.span()
-        # Render any markdown before the code block
-        if start > pos:
-            md = text[pos:start]
-            if md.strip():
-                st.markdown(md)
-        lang = match.group(1) or None
-        code = match.group(2)
-        st.code(code, language=lang)
-        pos = end
-    # Render any remaining markdown after the last code block
-    if pos < len(text):
-        md = text[pos:]
-        if md.strip():
-            st.markdown(md)
+    renderer = StreamRenderer(placeholder)
+    for chunk in chunks:
+        renderer.add(chunk)
+    full_answer = renderer.finish()
+    record("ui.stream_render", renderer.render_s, chars=len(full_answer), renders=renderer.renders)
+    return full_answer
+
+def queue_notice(status):
+    """on_queue callback for answer_with_rag: show the place in line while the server is busy."""
+    steps = {"query": "search", "llm": "answer"}
+
+    def on_queue(resource, position):
+        if position:
+            status.info(f"⏳ The server is busy: your {steps.get(resource, resource)} is #{position} in line...")
+        else:
+            status.empty()
+    return on_queue
+
+def busy_notice(status, error):
+    status.warning(f"⚠️ The server is busy right now. Please ask again in {error.retry_after:.0f}s.")
+
+def reindex_evicted(status):
+    """The session's index was evicted from the cache: index the uploaded files again, then answer."""
+    status.warning("⚠️ Your documents were unloaded from the server's cache. Indexing them again...")
+    st.session_state.pop("last_file_key", None)
+    time.sleep(1)
+    st.rerun()
 
 # Show all completed messages
 for turn in st.session_state.chat_history[:-1]:
@@ -112,13 +180,21 @@ if st.session_state.chat_history:
         with st.chat_message("assistant"):
             render_markdown_with_codeblocks(last_turn["bot"])
     else:
-        full_answer = ""
         with st.chat_message("assistant"):
+            status = st.empty()
             placeholder = st.empty()
-            with st.spinner("Searching for the answer…"):
-                for chunk in answer_with_rag(last_turn["user"], top_k=3, stream=True, chat_history=st.session_state.chat_history[:-1]):
-                    full_answer += chunk
-                    placeholder.markdown(full_answer)
+            try:
+                with st.spinner("Searching for the answer…"):
+                    full_answer = stream_answer(
+                        answer_with_rag(last_turn["user"], top_k=3, stream=True, chat_history=st.session_state.chat_history[:-1], session_id=session_id, on_queue=queue_notice(status)),
+                        placeholder,
+                    )
+            except Overloaded as e:
+                # The turn stays unanswered and is retried on the next rerun
+                full_answer = ""
+                busy_notice(status, e)
+            except StoreEvicted:
+                reindex_evicted(status)  # The turn stays unanswered and is answered after re-indexing
         st.session_state.chat_history[-1]["bot"] = full_answer
 
 # ---------------------------------
@@ -152,14 +228,21 @@ if user_question:
     time.sleep(0.1)
     
     # Stream the answer in a new assistant message
-    full_answer = ""
     with st.chat_message("assistant"):
+        status = st.empty()
         placeholder = st.empty()
-        with st.spinner("Searching for the answer..."):
-            for chunk in answer_with_rag(user_question, top_k=3, stream=True, chat_history=st.session_state.chat_history):
-                full_answer += chunk
-                # Use the custom renderer for streaming as well
-                placeholder.markdown(full_answer)
+        try:
+            with st.spinner("Searching for the answer..."):
+                full_answer = stream_answer(
+                    answer_with_rag(user_question, top_k=3, stream=True, chat_history=st.session_state.chat_history, session_id=session_id, on_queue=queue_notice(status)),
+                    placeholder,
+                )
+        except Overloaded as e:
+            busy_notice(status, e)
+            st.stop()
+        except StoreEvicted:
+            st.session_state.chat_history.append({"user": user_question, "bot": ""})
+            reindex_evicted(status)
     # Only after we have the complete answer, add both to history
     st.session_state.chat_history.append({
         "user": user_question,
@@ -174,18 +257,29 @@ if len(st.session_state.chat_history) > 0:
     num_questions = len([turn for turn in st.session_state.chat_history if turn.get("bot")])
     st.sidebar.markdown(f"**Questions used:** {num_questions} / 50")
 
-    # PDF download button
-    pdf_bytes = export_chat_history_to_pdf(st.session_state.chat_history)
-    st.sidebar.download_button(
-        label="📄 Download Chat (PDF)",
-        data=pdf_bytes,
-        file_name="chat_history.pdf",
-        mime="application/pdf"
-    )
+    # PDF download button. The PDF is only built once asked for, and again
+    # only after the chat has changed (unchanged chats hit the export cache)
+    export_key = history_key(st.session_state.chat_history)
+    export_ready = st.session_state.get("pdf_export_key") == export_key
+    if not export_ready and st.sidebar.button("📄 Export Chat (PDF)"):
+        st.session_state["pdf_export_key"] = export_key
+        export_ready = True
+    if export_ready:
+        st.sidebar.download_button(
+            label="📄 Download Chat (PDF)",
+            data=export_chat_history_to_pdf(st.session_state.chat_history),
+            file_name="chat_history.pdf",
+            mime="application/pdf"
+        )
     if st.sidebar.button("🧹 Clear Chat"):
         st.session_state.chat_history = []
         st.rerun()
 
+# Stage timings, for diagnosing slowness (DOCTALK_DEBUG_PANEL=1 or ?debug=1)
+if os.getenv("DOCTALK_DEBUG_PANEL") == "1" or st.query_params.get("debug") == "1":
+    render_debug_panel()
+
 # --------------------------------------------
 # Render About section at the very bottom of sidebar when there is chat history
-render_about_section()
\ No newline at end of file
+render_about_section()
+record("ui.rerun", time.perf_counter() - rerun_start)
\ No newline at end of file
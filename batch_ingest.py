@@ -0,0 +1,186 @@
+# batch_ingest.py
+"""
+Offline batch ingestion: index a directory of PDF/DOCX files into a portable
+index bundle (see index_bundle.py).
+
+    python batch_ingest.py manuals/ --output bundles/manuals
+    python batch_ingest.py manuals/ --output bundles/manuals --workers 8 --rebuild
+
+Files are extracted and sanitized across a pool of worker processes while
+the main process chunks and embeds the files that are already extracted.
+Embedding goes through the shared embedding worker, whose model spreads each
+batch over every core with torch's (or ONNX Runtime's) own threads.
+
+If the output bundle exists and was built with the same settings, unchanged
+files (by content hash) are kept as they are: only new files are extracted and
+embedded, and files that are gone are removed. Serving nodes mount the output
+directory with DOCTALK_BUNDLE_DIR, or open a bundle through the API.
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_reader import PDF_WORKERS, iter_file_section
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+# Files extracted ahead of the embedding, per worker (bounds the text held in memory)
+PREFETCH_PER_WORKER = 2
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def find_files(root: str):
+    """PDF/DOCX files under root, as sorted paths relative to root."""
+    found = []
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in files:
+            if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith("."):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(found)
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's contents; the same document id an upload of the file gets."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_file(path: str, workers: int = 1):
+    """
+    Sanitized text batches of one file, exactly as an upload of it would be
+    ingested (including the end-of-file separator and any extraction error).
+    Runs in a worker process.
+    """
+    with open(path, "rb") as f:
+        file = io.BytesIO(f.read())
+    file.name = os.path.basename(path)  # Used for the file type and the end-of-file separator
+    start = time.perf_counter()
+    batches = list(iter_file_section(file, workers=workers))
+    return batches, time.perf_counter() - start
+
+
+def _extracted(paths, workers: int):
+    """Yield (path, (batches, seconds)) in order, extracting up to a few files ahead."""
+    if workers <= 1:
+        for path in paths:
+            # A single process still extracts the pages of a large PDF in parallel
+            yield path, extract_file(path, workers=PDF_WORKERS)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        remaining = iter(paths)
+        for path in remaining:
+            pending.append((path, pool.submit(extract_file, path)))
+            if len(pending) >= workers * PREFETCH_PER_WORKER:
+                break
+        while pending:
+            path, future = pending.popleft()
+            result = future.result()
+            following = next(remaining, None)
+            if following is not None:
+                pending.append((following, pool.submit(extract_file, following)))
+            yield path, result
+
+
+def _error_of(batches):
+    """The extraction error recorded in a file's text, if any."""
+    first = batches[0][0][1] if batches and batches[0] else ""
+    if first.startswith("[Error extracting"):
+        return first.strip()[1:].split("]")[0]
+    return None
+
+
+def build_bundle(source: str, output: str, workers: int = PDF_WORKERS, rebuild: bool = False,
+                 log=print) -> dict:
+    """
+    Index the PDF/DOCX files under source and write a bundle to output.
+    Returns the bundle's manifest.
+    """
+    from index_bundle import BundleError
+    from vector_store import VectorStore
+
+    started = time.perf_counter()
+    store = VectorStore()
+    previous = {}
+    if not rebuild and os.path.isdir(output):
+        try:
+            manifest = store.load_bundle(output)
+            previous = {f["doc_id"]: f for f in manifest.get("files", [])}
+            log(f"Updating {output}: {len(previous)} files indexed")
+        except BundleError as e:
+            log(f"Rebuilding {output}: {e}")
+            store.reset()
+
+    # Document ids are content hashes; a file copied under two names is indexed once
+    files = {}
+    for rel in find_files(source):
+        path = os.path.join(source, rel)
+        doc_id = file_hash(path)
+        if doc_id in files:
+            log(f"  {rel}: same content as {files[doc_id]['path']}, skipped")
+            continue
+        stat = os.stat(path)
+        files[doc_id] = {"doc_id": doc_id, "name": os.path.basename(rel), "path": rel,
+                         "bytes": stat.st_size, "mtime": stat.st_mtime}
+    if not files:
+        raise SystemExit(f"No PDF or DOCX files found under {source}")
+
+    removed = [doc_id for doc_id in store.documents() if doc_id not in files]
+    for doc_id in removed:
+        store.remove_document(doc_id)
+    for doc_id, entry in previous.items():
+        if doc_id in files and "error" in entry:
+            files[doc_id]["error"] = entry["error"]
+    new = [doc_id for doc_id in files if doc_id not in store.doc_chunks]
+    log(f"{len(files)} files: {len(files) - len(new)} unchanged, {len(new)} to index, {len(removed)} removed")
+
+    by_path = {os.path.join(source, files[doc_id]["path"]): doc_id for doc_id in new}
+    for i, (path, (batches, extract_s)) in enumerate(_extracted(list(by_path), workers), start=1):
+        doc_id = by_path[path]
+        entry = files[doc_id]
+        start = time.perf_counter()
+        chunks = store.add_document_batches(doc_id, batches, name=entry["name"])
+        error = _error_of(batches)
+        if error:
+            entry["error"] = error
+        log(f"  [{i}/{len(new)}] {entry['path']}: {chunks} chunks "
+            f"(extract {extract_s:.1f}s, embed {time.perf_counter() - start:.1f}s)"
+            + (f" - {error}" if error else ""))
+
+    store.optimize_index()
+    for doc_id, entry in files.items():
+        entry["chunks"] = len(store.doc_chunks.get(doc_id, []))
+        store.doc_names[doc_id] = entry["name"]  # Unchanged files may have been renamed
+    manifest = store.save_bundle(output, files=sorted(files.values(), key=lambda f: f["path"]),
+                                 source=os.path.abspath(source))
+    log(f"Wrote {output}: {manifest['num_docs']} files, {manifest['num_chunks']} chunks, "
+        f"index {manifest['index_spec']}, {time.perf_counter() - started:.1f}s")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a directory of PDF/DOCX files into an index bundle.")
+    parser.add_argument("source", help="directory with the PDF/DOCX files (searched recursively)")
+    parser.add_argument("--output", "-o", required=True, help="bundle directory to write")
+    parser.add_argument("--workers", type=int, default=PDF_WORKERS,
+                        help="extraction processes (default: number of CPU cores)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="index every file again instead of updating an existing bundle")
+    args = parser.parse_args()
+    if not os.path.isdir(args.source):
+        parser.error(f"{args.source} is not a directory")
+    build_bundle(args.source, args.output, workers=args.workers, rebuild=args.rebuild,
+                 log=lambda message: print(message, file=sys.stderr))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,651 @@
+# benchmark.py
+"""
+Benchmark the ingestion, retrieval and answering pipeline and emit the results
+as JSON, so runs can be compared across commits.
+
+Per corpus it measures extraction MB/s, chunking rate, embedding chunks/s,
+index build time, query embedding and search latency (p50/p99), time to first
+token against a local stub LLM, and the process's peak RSS after each stage.
+It also compares the text normalizer and chunker with the previous
+sanitize_text + LangChain splitter path on a large document.
+It also times the chat PDF export per turn of a growing chat: the old
+full rebuild on every rerun against the lazy, cached export.
+Per corpus, a 50-turn chat of follow-up questions compares fresh retrieval per
+turn with the conversation-aware path (blended query, working set): per-turn
+retrieval cost and how much of each turn's context the next turn keeps.
+
+Corpora are synthetic PDF and DOCX files of several sizes, plus any real files
+passed with --files.
+
+Usage:
+    python benchmark.py                                 # synthetic corpora, JSON to stdout
+    python benchmark.py --sizes small --files book.pdf  # add a real document
+    python benchmark.py --output run.json --compare baseline.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The benchmark measures cold paths itself; no background model warm-up
+os.environ.setdefault("DOCTALK_WARMUP", "0")
+
+import numpy as np
+
+# Synthetic corpus sizes, in pages
+CORPUS_SIZES = {"small": 10, "medium": 100, "large": 500}
+CHARS_PER_PAGE = 3000
+LINES_PER_PAGE = 50
+NUM_QUERIES = 100
+QUERY_WORDS = 6
+# Stub LLM answer: tokens streamed after an optional first-token delay
+STUB_TOKENS = 32
+APP_TOP_K = 3  # top_k used by app.py
+# Pages of the document used to compare text normalization and chunking paths
+TEXT_BENCH_PAGES = 2000
+TEXT_BENCH_REPEATS = 3
+# Turns of the synthetic chat used to measure the PDF export
+CHAT_BENCH_TURNS = 50
+# Metrics shown by --compare (higher is better for rates, lower for times)
+COMPARE_METRICS = [
+    ("extraction", "mb_per_s"),
+    ("chunking", "chunks_per_s"),
+    ("embedding", "chunks_per_s"),
+    ("index_build", "seconds"),
+    ("search", "p50_ms"),
+    ("search", "p99_ms"),
+    ("ttft", "p50_ms"),
+    ("ttft", "p99_ms"),
+    ("conversation", "conversation_p50_ms"),
+]
+
+_WORDS = (
+    "vector index chunk query answer model token document page section figure table "
+    "method result analysis system memory latency throughput cache search retrieval "
+    "embedding batch network layer gradient training dataset student teacher chapter "
+    "example theorem proof definition lemma function variable parameter value error"
+).split()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(samples_s) -> dict:
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    if ms.size == 0:
+        return {"count": 0}
+    return {
+        "count": int(ms.size),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+# -----------------
+# Synthetic corpora
+# -----------------
+def synthetic_pages(num_pages: int, seed: int = 0):
+    """Deterministic pseudo-text, one string per page, with a few identifiers mixed in."""
+    rng = np.random.default_rng(seed)
+    pages = []
+    for page in range(num_pages):
+        sentences = []
+        length = 0
+        while length < CHARS_PER_PAGE:
+            words = list(rng.choice(_WORDS, size=int(rng.integers(6, 18))))
+            if rng.random() < 0.1:
+                words.append(f"ERR_{int(rng.integers(1000, 9999))}")
+            sentence = " ".join(words).capitalize() + "."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        pages.append(f"Section {page + 1}\n" + " ".join(sentences))
+    return pages
+
+
+def _wrap(text: str, width: int = 95):
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + 1 + len(word) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+
+def write_pdf(pages, path: str):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(path, pagesize=A4)
+    _, height = A4
+    for page in pages:
+        text = c.beginText(40, height - 40)
+        text.setFont("Helvetica", 8)
+        for line in _wrap(page)[:LINES_PER_PAGE * 2]:
+            text.textLine(line)
+        c.drawText(text)
+        c.showPage()
+    c.save()
+
+
+def write_docx(pages, path: str):
+    from docx import Document
+
+    doc = Document()
+    for page in pages:
+        for paragraph in page.split("\n"):
+            doc.add_paragraph(paragraph)
+    doc.save(path)
+
+
+def synthetic_corpora(sizes, directory: str):
+    """Write one PDF and one DOCX per size; returns [(name, path)]."""
+    corpora = []
+    for size in sizes:
+        pages = synthetic_pages(CORPUS_SIZES[size])
+        pdf_path = os.path.join(directory, f"synthetic-{size}.pdf")
+        docx_path = os.path.join(directory, f"synthetic-{size}.docx")
+        if not os.path.exists(pdf_path):
+            write_pdf(pages, pdf_path)
+        if not os.path.exists(docx_path):
+            write_docx(pages, docx_path)
+        corpora += [(f"pdf-{size}", pdf_path), (f"docx-{size}", docx_path)]
+    return corpora
+
+
+def with_running_heads(pages, title: str = "DocTalk Benchmark Manual"):
+    """Add a running header and page footers, as most real PDFs have."""
+    total = len(pages)
+    return [
+        f"{title}\n{text}\nPage {i} of {total}\nConfidential - Chapter {i // 20 + 1}"
+        for i, text in enumerate(pages, start=1)
+    ]
+
+
+def sample_queries(text: str, n: int = NUM_QUERIES, seed: int = 1):
+    """Short word spans taken from the corpus, like a reader quoting the document."""
+    words = text.split()
+    if len(words) <= QUERY_WORDS:
+        return [text] * min(n, 1)
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, len(words) - QUERY_WORDS, size=n)
+    return [" ".join(words[s:s + QUERY_WORDS]) for s in starts]
+
+
+# --------
+# Stub LLM
+# --------
+class _StubLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat completions endpoint with a canned answer."""
+
+    first_token_delay = 0.0
+    token_delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.first_token_delay)
+        tokens = [f"token{i} " for i in range(STUB_TOKENS)]
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(self.token_delay)
+                chunk = {"choices": [{"delta": {"content": token}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        else:
+            payload = json.dumps({"choices": [{"message": {"content": "".join(tokens)}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+
+def start_stub_llm(first_token_delay_ms: float = 0.0, token_delay_ms: float = 0.0, base=_StubLLMHandler, **attrs):
+    """Serve the stub LLM on a free local port; returns (server, chat completions URL)."""
+    handler = type("StubLLMHandler", (base,), dict(attrs, first_token_delay=first_token_delay_ms / 1000.0,
+                                                   token_delay=token_delay_ms / 1000.0))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+
+# ------------------------
+# Text normalize and chunk
+# ------------------------
+def _legacy_sanitize_text(text):
+    """The line-by-line sanitize_text that text_pipeline.normalize_pages replaced (baseline)."""
+    lines = text.splitlines()
+    cleaned_lines = []
+    header_footer_candidates = {}
+    for line in lines:
+        l = line.strip()
+        if not l:
+            continue
+        if re.fullmatch(r"\d+", l):
+            continue
+        if re.match(r"^Page \d+( of \d+)?$", l, re.IGNORECASE):
+            continue
+        header_footer_candidates[l] = header_footer_candidates.get(l, 0) + 1
+        cleaned_lines.append(l)
+    threshold = max(2, len(lines) // 10)
+    filtered_lines = [l for l in cleaned_lines if header_footer_candidates[l] <= threshold]
+    filtered_text = "\n".join(filtered_lines)
+    filtered_text = re.sub(r"[ \t]+", " ", filtered_text)
+    filtered_text = re.sub(r"\n{2,}", "\n", filtered_text)
+    return filtered_text
+
+
+def _best_of(fn, repeats: int):
+    best, result = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_text_pipeline(num_pages: int = TEXT_BENCH_PAGES, repeats: int = TEXT_BENCH_REPEATS) -> dict:
+    """
+    Normalize and chunk one large document with the previous path (sanitize_text
+    over the joined pages, then LangChain's RecursiveCharacterTextSplitter) and
+    with text_pipeline (per-page normalization, offset-based chunks). Chunk
+    strings are materialized in both, so the comparison is like for like.
+    """
+    from text_pipeline import chunk_spans, normalize_pages
+    from vector_store import CHUNK_OVERLAP, CHUNK_SIZE
+
+    pages = list(enumerate(with_running_heads(synthetic_pages(num_pages)), start=1))
+    joined = "".join(text + "\n" for _, text in pages)
+    mb = len(joined.encode("utf-8")) / 1e6
+    result = {"pages": num_pages, "input_mb": mb}
+
+    normalize_s, text = _best_of(lambda: _legacy_sanitize_text(joined), repeats)
+    legacy = {"normalize_s": normalize_s, "output_chars": len(text)}
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        splitter = RecursiveCharacterTextSplitter(
+            separators=["\n\n", "\n", ".", "!", "?", " ", ""],
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len,
+        )
+        chunk_s, chunks = _best_of(lambda: splitter.split_text(text), repeats)
+        legacy.update(chunk_s=chunk_s, chunks=len(chunks), mb_per_s=mb / (normalize_s + chunk_s))
+    except ImportError:
+        legacy["chunk_error"] = "langchain is not installed (see requirements-dev.txt)"
+    result["legacy"] = legacy
+
+    normalize_s, normalized = _best_of(lambda: normalize_pages(pages), repeats)
+    buffer = normalized.text
+    chunk_s, chunks = _best_of(
+        lambda: [buffer[s:e] for s, e in chunk_spans(buffer, CHUNK_SIZE, CHUNK_OVERLAP)], repeats
+    )
+    result["pipeline"] = {
+        "normalize_s": normalize_s,
+        "chunk_s": chunk_s,
+        "chunks": len(chunks),
+        "output_chars": len(buffer),
+        "mb_per_s": mb / (normalize_s + chunk_s),
+    }
+    if "mb_per_s" in legacy:
+        result["speedup"] = result["pipeline"]["mb_per_s"] / legacy["mb_per_s"]
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+# -----------
+# Chat export
+# -----------
+def synthetic_chat(turns: int, seed: int = 2):
+    """A chat history of prose answers, every third one with a code block."""
+    import random
+
+    rng = random.Random(seed)
+    words = lambda n: " ".join(rng.choice(_WORDS) for _ in range(n))
+    history = []
+    for i in range(turns):
+        answer = "\n\n".join(words(60).capitalize() + "." for _ in range(3))
+        if i % 3 == 0:
+            answer += "\n\n```python\n" + "\n".join(f"value_{j} = {j} * {i}" for j in range(12)) + "\n```\n"
+        history.append({"user": words(QUERY_WORDS) + "?", "bot": answer})
+    return history
+
+
+def bench_chat_export(turns: int = CHAT_BENCH_TURNS) -> dict:
+    """
+    Cost per chat turn of the PDF export as a chat grows to turns turns:
+    - rebuild: the previous behaviour, a full PDF build on every rerun;
+    - rerun: what a rerun costs now when nobody asks for the PDF;
+    - incremental: an export after each new turn, with earlier turns cached;
+    - repeat: asking again for an unchanged chat (memoized bytes).
+    """
+    from chat_export import clear_caches, export_chat_history_to_pdf, history_key
+
+    history = synthetic_chat(turns)
+    clear_caches()
+    samples = {"rebuild": [], "rerun": [], "incremental": [], "repeat": []}
+    for n in range(1, turns + 1):
+        partial = history[:n]
+        start = time.perf_counter()
+        history_key(partial)
+        samples["rerun"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        export_chat_history_to_pdf(partial)
+        samples["incremental"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        export_chat_history_to_pdf(partial)
+        samples["repeat"].append(time.perf_counter() - start)
+
+    for n in range(1, turns + 1):
+        clear_caches()
+        start = time.perf_counter()
+        export_chat_history_to_pdf(history[:n])
+        samples["rebuild"].append(time.perf_counter() - start)
+    clear_caches()
+
+    result = {"turns": turns}
+    for name, values in samples.items():
+        result[name] = {
+            "mean_ms": 1000 * sum(values) / len(values),
+            "last_turn_ms": 1000 * values[-1],
+        }
+    return result
+
+
+# ------
+# Stages
+# ------
+def bench_corpus(name: str, path: str, top_k: int, num_queries: int) -> dict:
+    import chatbot
+    from answer_cache import SemanticAnswerCache
+    from index_builder import build_index, choose_index_spec, export_vectors
+    from pdf_reader import extract_text_from_file
+    from vector_store import chunk_text
+
+    with open(path, "rb") as f:
+        data = f.read()
+    result = {"name": name, "path": path, "bytes": len(data)}
+
+    file = io.BytesIO(data)
+    file.name = os.path.basename(path)
+    start = time.perf_counter()
+    text = extract_text_from_file(file)
+    elapsed = time.perf_counter() - start
+    result["extraction"] = {
+        "seconds": elapsed,
+        "mb_per_s": len(data) / 1e6 / elapsed,
+        "text_chars": len(text),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    start = time.perf_counter()
+    chunks = chunk_text(text)
+    elapsed = time.perf_counter() - start
+    result["chunking"] = {
+        "seconds": elapsed,
+        "chunks": len(chunks),
+        "chunks_per_s": len(chunks) / elapsed,
+        "mb_per_s": len(text) / 1e6 / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    # Ingest through the app's own path: split, embed in slices, add to the live index
+    session_id = f"benchmark-{name}"
+    chatbot.release_vector_store(session_id)
+    store = chatbot.stores.get(session_id)
+    store.embedder  # Model load is not part of the embedding rate
+    start = time.perf_counter()
+    n = store.add_document(f"benchmark-{name}", text, name=name)
+    elapsed = time.perf_counter() - start
+    result["embedding"] = {
+        "seconds": elapsed,
+        "chunks": n,
+        "chunks_per_s": n / elapsed,
+        "backend": store.embedding_id,
+        "dedup": store.dedup_report(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    ids = store._vector_ids()  # Duplicate chunks have no vector of their own
+    vectors = export_vectors(store.index, ids)
+    spec = choose_index_spec(len(ids), vectors.shape[1])
+    start = time.perf_counter()
+    build_index(vectors, ids, spec)
+    result["index_build"] = {
+        "seconds": time.perf_counter() - start,
+        "spec": spec,
+        "vectors": len(ids),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    store.optimize_index()  # Search the index the app would use at this size
+
+    queries = sample_queries(text, num_queries)
+    embed_times, search_times, q_embs = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        q_embs.append(store.embed_query(query))
+        embed_times.append(time.perf_counter() - start)
+    for query, q_emb in zip(queries, q_embs):
+        start = time.perf_counter()
+        store.retrieve_ids(query, k=top_k * 4, q_emb=q_emb)
+        search_times.append(time.perf_counter() - start)
+    result["query_embedding"] = percentiles(embed_times)
+    result["search"] = dict(percentiles(search_times), index_spec=store.index_spec, k=top_k * 4,
+                            peak_rss_mb=peak_rss_mb())
+
+    # Time to first token: retrieval, packing and the LLM round trip, with every
+    # question reaching the (stub) LLM rather than the answer cache
+    ttft, totals = [], []
+    for query in queries[:max(1, num_queries // 4)]:
+        chatbot.answer_cache = SemanticAnswerCache()
+        start = time.perf_counter()
+        first = None
+        for chunk in chatbot.answer_with_rag(query, top_k=top_k, stream=True, session_id=session_id):
+            if first is None and chunk:
+                first = time.perf_counter() - start
+        totals.append(time.perf_counter() - start)
+        ttft.append(first if first is not None else totals[-1])
+    result["ttft"] = percentiles(ttft)
+    result["end_to_end"] = percentiles(totals)
+    result["conversation"] = bench_conversation(store, text, top_k)
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    chatbot.release_vector_store(session_id)
+    return result
+
+
+def follow_up_chat(text: str, turns: int = CHAT_BENCH_TURNS, per_topic: int = 5, seed: int = 3):
+    """Questions in runs of per_topic about the same passage, like a reader asking follow-ups."""
+    rng = np.random.default_rng(seed)
+    questions = []
+    for topic in range((turns + per_topic - 1) // per_topic):
+        start = int(rng.integers(0, max(1, len(text) - CHARS_PER_PAGE)))
+        questions += sample_queries(text[start:start + CHARS_PER_PAGE], per_topic, seed=seed + topic)
+    return questions[:turns]
+
+
+def bench_conversation(store, text: str, top_k: int, turns: int = CHAT_BENCH_TURNS) -> dict:
+    """
+    Retrieval and packing per turn of a follow-up chat:
+    - fresh: the previous behaviour, the bare question searched and every chunk read from the store;
+    - conversation: history-blended query, previous context carried over, working-set reuse.
+    "context_kept_pct" is the share of a turn's context chunks already in the previous turn's.
+    """
+    from context_packer import pack_context
+    from conversation import Conversation
+
+    questions = follow_up_chat(text, turns)
+    q_embs = [store.embed_query(q) for q in questions]  # Query embedding is the same on both paths
+    result = {"turns": len(questions)}
+
+    def kept(contexts):
+        shares = [len(set(a) & set(b)) / len(b) for a, b in zip(contexts, contexts[1:]) if b]
+        return 100.0 * sum(shares) / len(shares) if shares else 0.0
+
+    times, contexts = [], []
+    for question, q_emb in zip(questions, q_embs):
+        start = time.perf_counter()
+        ids = store.retrieve_ids(question, k=top_k * 4, q_emb=q_emb)
+        candidates = store.chunk_records(ids)
+        _, chunks = pack_context(candidates, q_emb, store.chunk_vectors([c[0] for c in candidates]))
+        times.append(time.perf_counter() - start)
+        used = set(chunks)
+        contexts.append([c[0] for c in candidates if c[2] in used])
+    result["fresh_p50_ms"] = percentiles(times).get("p50_ms")
+    result["fresh_context_kept_pct"] = kept(contexts)
+
+    conversation = Conversation(store.doc_set_key())
+    times, contexts = [], []
+    for question, q_emb in zip(questions, q_embs):
+        start = time.perf_counter()
+        search_emb = conversation.query_vector(q_emb)
+        ids = store.retrieve_ids(question, k=top_k * 4, q_emb=search_emb)
+        retrieved = set(ids)
+        ids += [cid for cid in conversation.carry_over() if cid not in retrieved]
+        candidates, vectors = conversation.fetch(store, ids)
+        _, chunks = pack_context(candidates, search_emb, vectors)
+        used = set(chunks)
+        context_ids = [c[0] for c in candidates if c[2] in used]
+        conversation.record(question, q_emb, context_ids)
+        times.append(time.perf_counter() - start)
+        contexts.append(context_ids)
+    result["conversation_p50_ms"] = percentiles(times).get("p50_ms")
+    result["conversation_context_kept_pct"] = kept(contexts)
+    result["chunks_reused_pct"] = 100.0 * conversation.reused / max(1, conversation.reused + conversation.fetched)
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(corpora, top_k: int = APP_TOP_K, num_queries: int = NUM_QUERIES, llm_delay_ms: float = 0.0,
+        text_pages: int = TEXT_BENCH_PAGES, chat_turns: int = CHAT_BENCH_TURNS) -> dict:
+    import chatbot
+    from context_packer import CONTEXT_TOKEN_BUDGET
+    from llm_client import HTTPLLMClient
+    from pdf_reader import PDF_WORKERS
+    from vector_store import CHUNK_OVERLAP, CHUNK_SIZE
+
+    text_pipeline = bench_text_pipeline(text_pages) if text_pages > 0 else None
+    chat_export = bench_chat_export(chat_turns) if chat_turns > 0 else None
+    server, url = start_stub_llm(llm_delay_ms)
+    chatbot.set_llm_client(HTTPLLMClient("benchmark", api_url=url))
+    try:
+        results = [bench_corpus(name, path, top_k, num_queries) for name, path in corpora]
+    finally:
+        server.shutdown()
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "top_k": top_k,
+            "context_tokens": CONTEXT_TOKEN_BUDGET,
+            "pdf_workers": PDF_WORKERS,
+            "stub_llm_first_token_delay_ms": llm_delay_ms,
+        },
+        "text_pipeline": text_pipeline,
+        "chat_export": chat_export,
+        "corpora": results,
+    }
+
+
+def compare(baseline: dict, current: dict):
+    """Rows of (corpus, metric, baseline value, current value, current / baseline)."""
+    old = {c["name"]: c for c in baseline.get("corpora", [])}
+    rows = []
+    for corpus in current.get("corpora", []):
+        before = old.get(corpus["name"])
+        if before is None:
+            continue
+        for stage, metric in COMPARE_METRICS:
+            a = before.get(stage, {}).get(metric)
+            b = corpus.get(stage, {}).get(metric)
+            if a and b is not None:
+                rows.append((corpus["name"], f"{stage}.{metric}", a, b, b / a))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and answering.")
+    parser.add_argument("--sizes", default=",".join(CORPUS_SIZES),
+                        help=f"synthetic corpus sizes to run ({', '.join(CORPUS_SIZES)}); empty for none")
+    parser.add_argument("--files", nargs="*", default=[], help="real PDF/DOCX files, one corpus each")
+    parser.add_argument("--corpus-dir", help="keep generated corpora here instead of a temporary directory")
+    parser.add_argument("--top-k", type=int, default=APP_TOP_K)
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES)
+    parser.add_argument("--llm-delay-ms", type=float, default=0.0, help="stub LLM delay before the first token")
+    parser.add_argument("--text-pages", type=int, default=TEXT_BENCH_PAGES,
+                        help="pages of the document for the normalize/chunk comparison (0 to skip)")
+    parser.add_argument("--chat-turns", type=int, default=CHAT_BENCH_TURNS,
+                        help="turns of the synthetic chat for the PDF export benchmark (0 to skip)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="print changes against an earlier JSON report")
+    args = parser.parse_args()
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    unknown = [s for s in sizes if s not in CORPUS_SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.corpus_dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        corpora = synthetic_corpora(sizes, directory)
+        corpora += [(os.path.basename(path), path) for path in args.files]
+        report = run(corpora, top_k=args.top_k, num_queries=args.queries, llm_delay_ms=args.llm_delay_ms,
+                     text_pages=args.text_pages, chat_turns=args.chat_turns)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nchanges vs {baseline.get('commit') or args.compare}:", file=sys.stderr)
+        for name, metric, a, b, ratio in compare(baseline, report):
+            print(f"{name:>16} {metric:<26} {a:>12.3f} -> {b:>12.3f}  ({ratio:.2f}x)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# bm25.py
+
+import math
+import re
+import time
+from collections import Counter
+
+# Words, numbers and identifiers such as "ISO-9001", "3.2.1", "A/B" or "x86_64"
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[._\-/][A-Za-z0-9]+)*")
+# Query tokens that look like exact identifiers: contain a digit, or are ALL-CAPS acronyms
+IDENTIFIER_PATTERN = re.compile(r"^(?=.*\d)[A-Za-z0-9._\-/]+$|^[A-Z]{2,}$")
+
+def tokenize(text: str):
+    """Lowercased tokens; compound identifiers are kept whole and also split into parts."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group(0).lower()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[._\-/]", token) if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring. Documents are keyed by
+    the same integer chunk ids as the FAISS index and can be added or removed
+    one at a time.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {chunk id: term frequency}
+        self.doc_lens = {}  # chunk id -> number of tokens
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    def __contains__(self, chunk_id) -> bool:
+        return chunk_id in self.doc_lens
+
+    def add(self, chunk_id: int, text: str):
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        length = sum(counts.values())
+        self.doc_lens[chunk_id] = length
+        self.total_len += length
+
+    def remove(self, chunk_id: int, text: str):
+        length = self.doc_lens.pop(chunk_id, None)
+        if length is None:
+            return
+        self.total_len -= length
+        for term in set(tokenize(text)):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(chunk_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int = 10, deadline: float = None):
+        """
+        Return up to k (chunk_id, score) pairs, best first.
+        If deadline (a time.perf_counter() value) passes, scoring stops after the
+        current term and the partial ranking is returned.
+        """
+        n = len(self.doc_lens)
+        if n == 0:
+            return []
+        avg_len = self.total_len / n
+        scores = {}
+        # Rare terms first, so a cut-off by the deadline keeps the most selective ones
+        terms = sorted(set(tokenize(query)), key=lambda t: len(self.postings.get(t, ())))
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for chunk_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lens[chunk_id] / avg_len)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def has_identifier(query: str) -> bool:
+    """True if the query contains part numbers, section ids or acronyms."""
+    return any(IDENTIFIER_PATTERN.match(token) for token in TOKEN_PATTERN.findall(query))
+
+
+def reciprocal_rank_fusion(rankings, weights, k: int = 60):
+    """
+    Fuse several ranked lists of ids. Each id scores sum(weight / (k + rank)).
+    Returns ids ordered by fused score.
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + weight / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
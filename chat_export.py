@@ -0,0 +1,104 @@
+# chat_export.py
+"""
+Export of the chat history to PDF (ReportLab).
+
+Building a PDF means parsing every answer into flowables and laying out the
+document. Both are reused where possible:
+- the flowables of a turn are cached by (turn number, question, answer), so
+  after a new turn only that turn is parsed;
+- the finished bytes are cached by the history's content, so asking again
+  for an unchanged chat costs a dictionary lookup.
+The app only calls this when the user asks for the PDF, not on every rerun.
+"""
+
+import copy
+import time
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from chat_render import parse_segments
+from telemetry import record
+
+# Turns whose flowables are kept (a full 50-turn chat for several sessions)
+TURN_CACHE_SIZE = 256
+# Finished PDFs kept, keyed by history content
+PDF_CACHE_SIZE = 8
+
+
+@lru_cache(maxsize=1)
+def _styles() -> dict:
+    from reportlab.lib import colors
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    styles = getSampleStyleSheet()
+    normal = ParagraphStyle(name="ChatNormal", parent=styles["Normal"], fontName="Times-Roman", fontSize=12)
+    return {
+        "title": styles["Title"],
+        "normal": normal,
+        "bold": ParagraphStyle(name="ChatBold", parent=normal, fontName="Times-Bold"),
+        "code": ParagraphStyle(name="ChatCode", parent=normal, fontName="Courier", fontSize=10,
+                               backColor=colors.whitesmoke, leftIndent=12),
+    }
+
+
+def _markup(text: str) -> str:
+    return escape(text).replace("\n", "<br/>")
+
+
+@lru_cache(maxsize=TURN_CACHE_SIZE)
+def turn_flowables(number: int, question: str, answer: str) -> tuple:
+    """
+    Flowables of one Q&A turn: the question in bold, prose paragraphs and code
+    blocks. These are prototypes: a build lays out (and marks) the flowables
+    it is given, so it gets shallow copies that share the parsed text.
+    """
+    from reportlab.platypus import Paragraph, Spacer
+
+    styles = _styles()
+    elements = [Paragraph(f"<b>Q{number}:</b> {_markup(question)}", styles["bold"])]
+    for segment in parse_segments(answer):
+        if segment.code:
+            elements.append(Paragraph(f'<font face="Courier">{_markup(segment.text)}</font>', styles["code"]))
+        elif segment.text.strip():
+            elements.append(Paragraph(_markup(segment.text.strip()), styles["normal"]))
+    elements.append(Spacer(1, 8))
+    return tuple(elements)
+
+
+def history_key(chat_history) -> tuple:
+    """Hashable content of a chat history (list of dicts with 'user' and 'bot')."""
+    return tuple((turn["user"], turn.get("bot") or "") for turn in chat_history)
+
+
+@lru_cache(maxsize=PDF_CACHE_SIZE)
+def _build_pdf(key: tuple) -> bytes:
+    from io import BytesIO
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+    start = time.perf_counter()
+    misses = turn_flowables.cache_info().misses
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, leftMargin=0.75*inch, rightMargin=0.75*inch,
+                            topMargin=0.75*inch, bottomMargin=0.75*inch)
+    elements = [Paragraph("<b>DocTalk Chat History</b>", _styles()["title"]), Spacer(1, 12)]
+    for number, (question, answer) in enumerate(key, start=1):
+        elements.extend(copy.copy(f) for f in turn_flowables(number, question, answer))
+    doc.build(elements)
+    record("export.pdf", time.perf_counter() - start, turns=len(key),
+           new_turns=turn_flowables.cache_info().misses - misses)
+    return buffer.getvalue()
+
+
+def export_chat_history_to_pdf(chat_history) -> bytes:
+    """
+    Export chat history (list of dicts with 'user' and 'bot') to a PDF and return bytes using ReportLab (full Unicode support).
+    """
+    return _build_pdf(history_key(chat_history))
+
+
+def clear_caches():
+    """Drop cached flowables and PDFs (the benchmark uses this to measure cold builds)."""
+    turn_flowables.cache_clear()
+    _build_pdf.cache_clear()
@@ -0,0 +1,149 @@
+# chat_render.py
+"""
+Rendering of chat answers in Streamlit.
+
+An answer is split into segments: markdown text, and fenced code blocks that
+are shown with st.code so their copy button copies the whole block. Parsing
+is cached per answer string, so a rerun does not run the regex over the
+whole history again.
+
+StreamRenderer shows an answer while it streams. It redraws the page in
+batches instead of on every token. Only the unfinished tail is redrawn:
+paragraphs and code blocks that are complete are written once and then left
+alone. Each redraw therefore costs about one paragraph, not the whole answer
+so far.
+"""
+
+import os
+import re
+import time
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import streamlit as st
+
+# A redraw happens when this much time has passed or this many deltas have arrived
+STREAM_RENDER_INTERVAL_MS = float(os.getenv("DOCTALK_STREAM_RENDER_MS", "80"))
+STREAM_RENDER_TOKENS = int(os.getenv("DOCTALK_STREAM_RENDER_TOKENS", "24"))
+# Parsed answers kept in memory (a full 50-turn history fits several times over)
+SEGMENT_CACHE_SIZE = 512
+
+CODE_BLOCK_PATTERN = re.compile(r"```([\w\+\-]*)\n([\s\S]*?)```", re.MULTILINE)
+_FENCE = "```"
+
+
+class Segment(NamedTuple):
+    text: str
+    language: Optional[str] = None  # Set for code blocks
+    code: bool = False
+
+
+@lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def parse_segments(text: str) -> tuple:
+    """Split text into markdown and code-block segments; blank markdown is dropped."""
+    segments = []
+    pos = 0
+    for match in CODE_BLOCK_PATTERN.finditer(text):
+        start, end = match.span()
+        if start > pos and text[pos:start].strip():
+            segments.append(Segment(text[pos:start]))
+        segments.append(Segment(match.group(2), match.group(1) or None, code=True))
+        pos = end
+    if pos < len(text) and text[pos:].strip():
+        segments.append(Segment(text[pos:]))
+    return tuple(segments)
+
+
+def render_segments(segments, container=st):
+    for segment in segments:
+        if segment.code:
+            container.code(segment.text, language=segment.language)
+        else:
+            container.markdown(segment.text)
+
+
+def render_markdown_with_codeblocks(text: str, container=st):
+    """
+    Render markdown text with code blocks using st.code for code and st.markdown for other text.
+    This ensures the copy button works for full code blocks.
+    """
+    render_segments(parse_segments(text), container)
+
+
+def stable_prefix(text: str) -> int:
+    """
+    Length of the leading part of a partial answer that will not change as more
+    text arrives: everything up to the last finished code block or the last
+    paragraph break outside a code block.
+    """
+    done = 0
+    for match in CODE_BLOCK_PATTERN.finditer(text):
+        done = match.end()
+    limit = text.find(_FENCE, done)  # An open (unfinished) code block
+    if limit == -1:
+        limit = len(text)
+    brk = text.rfind("\n\n", done, limit)
+    return brk + 2 if brk != -1 else done
+
+
+class StreamRenderer:
+    """
+    Incremental renderer for a streamed answer in a st.empty() placeholder.
+
+        renderer = StreamRenderer(placeholder)
+        for delta in stream:
+            renderer.add(delta)
+        text = renderer.finish()
+    """
+
+    def __init__(self, placeholder, interval_ms: float = STREAM_RENDER_INTERVAL_MS,
+                 max_tokens: int = STREAM_RENDER_TOKENS):
+        self._container = placeholder.container()
+        self._tail = self._container.empty()
+        self._parts = []
+        self._frozen = 0  # Characters already written for good
+        self._interval = interval_ms / 1000.0
+        self._max_tokens = max_tokens
+        self._pending = 0  # Deltas since the last redraw
+        self._last = time.perf_counter()
+        self.renders = 0
+        self.render_s = 0.0
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def add(self, delta: str):
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._pending += 1
+        if self._pending >= self._max_tokens or time.perf_counter() - self._last >= self._interval:
+            self.flush()
+
+    def flush(self, final: bool = False):
+        start = time.perf_counter()
+        text = self.text
+        tail = text[self._frozen:]
+        cut = len(tail) if final else stable_prefix(tail)
+        if cut:
+            # Write the finished part in place of the tail, then start a new tail after it.
+            # Partial answers are parsed uncached so they do not push history out of the cache.
+            render_segments(parse_segments.__wrapped__(tail[:cut]), self._tail.container())
+            self._frozen += cut
+            tail = tail[cut:]
+            if not final:
+                self._tail = self._container.empty()
+        if tail.strip():
+            self._tail.markdown(tail)
+        self._pending = 0
+        self._last = time.perf_counter()
+        self.renders += 1
+        self.render_s += self._last - start
+
+    def finish(self) -> str:
+        """Render whatever is left and return the full answer."""
+        self.flush(final=True)
+        return self.text
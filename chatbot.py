@@ -1,40 +1,189 @@
 import os
+import time
 import requests
-import json
-from vector_store import VectorStore
+import streamlit as st
+from store_manager import StoreManager
+from ingest import IngestJob
+from answer_cache import SemanticAnswerCache, history_signature
+from context_packer import pack_context
+from conversation import ConversationCache
+from llm_client import HTTPLLMClient, LLMClient, LLMError, LLMResponseParseError, parse_delta
+from scheduler import pool
+from telemetry import METRICS_PORT, observe_rate, record, span, start_metrics_server
 from dotenv import load_dotenv
 
 # Load Groq API key
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 GROQ_MODEL = "llama3-70b-8192"
 
-# 1) Initialize Vector Store
-vs = VectorStore(model_name="all-MiniLM-L6-v2")
+# Pooled, retrying HTTP client for the LLM backend (replaceable with set_llm_client)
+llm = HTTPLLMClient(GROQ_API_KEY, api_url=GROQ_API_URL)
 
-def build_vector_store_from_text(full_text: str):
+def set_llm_client(client: LLMClient):
+    """Swap the LLM backend, e.g. for a local fake OpenAI-compatible server."""
+    global llm
+    llm = client
+
+# 1) Initialize the per-session Vector Store pool (one shared embedder)
+stores = StoreManager(model_name="all-MiniLM-L6-v2")
+DEFAULT_SESSION = "default"
+# The embedder loads lazily; warming it up in the background hides that cost
+if os.getenv("DOCTALK_WARMUP", "1") == "1":
+    stores.warm_up()
+
+# 2) Answers to (near-)repeated questions about the same documents skip the LLM call
+answer_cache = SemanticAnswerCache()
+
+# 3) Follow-up questions search with the conversation's history and reuse its chunks
+conversations = ConversationCache()
+
+# 4) Stage timings are exported on /metrics when DOCTALK_METRICS_PORT is set
+if METRICS_PORT:
+    start_metrics_server()
+
+def sync_vector_store(documents, session_id: str = DEFAULT_SESSION) -> dict:
+    """
+    Make a session's index hold exactly the given documents, embedding only new ones.
+    documents maps file hash -> (file name, load_batches); see VectorStore.sync_documents.
+    Blocks until done, showing a progress bar with the real chunk count.
+    """
+    progress_bar = st.progress(0, "Initializing...")
+
+    def on_progress(chunks_indexed, docs_done, docs_total, name):
+        progress_bar.progress(
+            docs_done / max(1, docs_total),
+            f"Indexing {name}: {chunks_indexed} chunks embedded...",
+        )
+
+    try:
+        summary = stores.get(session_id, replace_evicted=True).sync_documents(documents, on_progress=on_progress)
+    except Exception as e:
+        progress_bar.empty()
+        raise e  # Re-raise to be caught by the app
+    progress_bar.progress(1.0, "Vector store ready!")
+    stores.enforce_budget(keep=session_id)
+    return summary
+
+def start_ingestion(documents, session_id: str = DEFAULT_SESSION) -> IngestJob:
+    """
+    Streaming version of sync_vector_store: ingest in a background thread and
+    return immediately. Questions can be asked while the job runs; they search
+    whatever has been indexed so far.
+    Raises scheduler.Overloaded if the ingest queue is full; otherwise the job
+    waits for a free ingest slot (see IngestJob.queue_position).
+    """
+    pool("ingest").check()
+    return IngestJob(stores.get(session_id, replace_evicted=True), documents, session_id=session_id).start()
+
+def build_vector_store_from_text(full_text: str, session_id: str = DEFAULT_SESSION):
     """
     Build FAISS index over the PDF's full text.
     Call this after you extract text from the PDF.
     """
-    vs.create_index(full_text)
+    stores.get(session_id, replace_evicted=True).create_index(full_text)
+    stores.enforce_budget(keep=session_id)
+
+def open_bundle(path: str, session_id: str = DEFAULT_SESSION) -> dict:
+    """
+    Serve a session from a prebuilt index bundle (see batch_ingest.py) instead of
+    uploaded files. Returns the bundle's manifest.
+    """
+    manifest = stores.get(session_id, replace_evicted=True).load_bundle(path)
+    stores.enforce_budget(keep=session_id)
+    return manifest
+
+def release_vector_store(session_id: str = DEFAULT_SESSION):
+    """
+    Drop a session's store from the pool (e.g. when the user clears their uploads).
+    """
+    stores.release(session_id)
+    conversations.forget(session_id)
+
+def cache_stats() -> dict:
+    """Hit/miss counters of the query-embedding LRU, the semantic answer cache and the conversation working sets."""
+    return {
+        "query_embeddings": stores.query_cache.stats(),
+        "answers": answer_cache.stats(),
+        "conversations": conversations.stats(),
+    }
 
-def answer_with_rag(question: str, top_k: int = 10, return_chunks: bool = False, stream: bool = False, chat_history=None):
+def replay_stream(answer: str):
+    """Yield a cached answer word by word, like a streamed LLM response."""
+    pos = 0
+    while pos < len(answer):
+        end = answer.find(" ", pos + 1)
+        end = len(answer) if end == -1 else end
+        yield answer[pos:end]
+        pos = end
+
+def _queue_callback(on_queue, resource: str):
+    if on_queue is None:
+        return None
+    return lambda position: on_queue(resource, position)
+
+def answer_with_rag(question: str, top_k: int = 10, return_chunks: bool = False, stream: bool = False, chat_history=None, session_id: str = DEFAULT_SESSION, on_queue=None):
     """
-    1) Retrieve top_k relevant chunks via FAISS
-    2) Concatenate chunks into context
+    1) Retrieve top_k * 4 candidate chunks (hybrid FAISS + BM25); follow-ups are
+       searched with a vector blended from the earlier questions (see conversation.py)
+    2) Pack them, plus the previous turn's context chunks, into a deduplicated,
+       token-budgeted context
     3) Use Groq's LLaMA3 to answer via streaming or normal
-    4) Optionally include last 3 Q&A turns from chat_history for follow-up support
+    4) Optionally include the last 4 user questions (not the answers) from chat_history for follow-up support
+    Repeated or paraphrased questions about the same documents are answered from
+    the semantic answer cache without calling the LLM.
+    Stage timings (retrieval, packing, time to first token, tokens/s) go to telemetry.
+    Retrieval and the LLM call wait for slots in the scheduler's "query" and "llm"
+    pools; on_queue(resource, position) is called with the place in line while
+    waiting and with 0 once admitted. Raises scheduler.Overloaded (for a stream,
+    when it is first iterated) if a queue is full, and store_manager.StoreEvicted
+    if the session's documents have to be indexed again.
     """
-    chunks = vs.retrieve(question, k=top_k * 4)
-    if not chunks:
-        return ("No relevant information found.", []) if return_chunks else "No relevant information found."
+    started = time.perf_counter()
+    store = stores.get(session_id)
+    # Embedding, retrieval and packing hold a "query" slot; the LLM call a separate "llm" slot
+    with pool("query").slot(session_id, on_wait=_queue_callback(on_queue, "query")):
+        q_emb = store.embed_query(question)
+        doc_set_key = store.doc_set_key()
+        conversation = conversations.get(session_id, doc_set_key, chat_history)
+
+        # Only answers over a fully indexed document set are cached
+        use_cache = not store.ingesting and store.num_chunks() > 0
+        if use_cache:
+            history_sig = history_signature(chat_history)
+            cached = answer_cache.lookup(doc_set_key, history_sig, q_emb)
+            if cached is not None:
+                record("answer.prepare", time.perf_counter() - started, cached=True)
+                conversation.record(question, q_emb, conversation.carry_over())
+                answer, cached_chunks = cached
+                if stream:
+                    return replay_stream(answer)
+                return (answer, cached_chunks) if return_chunks else answer
+
+        # Cache miss: shed before any retrieval work if the answer could not get an LLM slot
+        pool("llm").check()
+        search_emb = conversation.query_vector(q_emb)
+        chunk_ids = store.retrieve_ids(question, k=top_k * 4, q_emb=search_emb)
+        # The previous turn's context stays in the running, so a follow-up can keep referring to it
+        retrieved = set(chunk_ids)
+        chunk_ids += [cid for cid in conversation.carry_over() if cid not in retrieved]
+        if not chunk_ids:
+            conversation.record(question, q_emb, [])
+            record("answer.prepare", time.perf_counter() - started, cached=False, results=0)
+            return ("No relevant information found.", []) if return_chunks else "No relevant information found."
 
-    # Combine context
-    context = "\n".join(chunks)
-    if len(context) > 6000:
-        context = context[:6000]
+        # Pack context: drop duplicates, prefer diverse chunks (MMR), merge neighbouring
+        # chunks so their overlap is sent once, and fill the prompt token budget.
+        # Chunks already fetched earlier in the conversation come from its working set
+        with span("pack", candidates=len(chunk_ids)) as s:
+            reused = conversation.reused
+            candidates, vectors = conversation.fetch(store, chunk_ids)
+            context, chunks = pack_context(candidates, search_emb, vectors)
+            used = set(chunks)
+            conversation.record(question, q_emb, [c[0] for c in candidates if c[2] in used])
+            s["chunks"] = len(chunks)
+            s["reused"] = conversation.reused - reused
 
     # Add last 4 user questions from chat_history if provided (no answers)
     history_str = ""
@@ -58,11 +207,6 @@ def answer_with_rag(question: str, top_k: int = 10, return_chunks: bool = False,
         f"Answer:"
     )
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
     data = {
         "model": GROQ_MODEL,
         "messages": [
@@ -72,42 +216,77 @@ def answer_with_rag(question: str, top_k: int = 10, return_chunks: bool = False,
         "max_tokens": 1024,
         "temperature": 0.3,
         "top_p": 0.8,
-        "stream": stream
     }
+    record("answer.prepare", time.perf_counter() - started, cached=False, results=len(chunk_ids))
 
     if stream:
         # STREAMING RESPONSE MODE
         def stream_generator():
-            response = requests.post(GROQ_API_URL, headers=headers, json=data, stream=True)
-            for line in response.iter_lines():
-                if line and line.strip().startswith(b"data:"):
-                    clean = line.decode().replace("data: ", "").strip()
-                    if clean == "[DONE]":
-                        break
+            # The slot is held until the stream ends or the generator is closed
+            with pool("llm").slot(session_id, on_wait=_queue_callback(on_queue, "llm")):
+                request_start = time.perf_counter()
+                try:
+                    llm_stream = llm.stream(data)
+                except LLMError as e:
+                    yield f"[Groq API error {e.status_code}] {e.body}"
+                    return
+                except requests.RequestException as e:
+                    yield f"[Groq API error: {e}]"
+                    return
+                parts = []
+                failed = False
+                first_token = None
+                # Leaving this block (finished, failed, or the generator was abandoned
+                # by a Streamlit rerun) closes the HTTP response
+                with llm_stream:
                     try:
-                        delta = json.loads(clean)["choices"][0]["delta"]
-                        yield delta.get("content", "")
-                    except Exception as e:
-                        yield f"\n[Error parsing stream chunk: {e}]"
+                        for payload in llm_stream:
+                            try:
+                                content = parse_delta(payload)
+                                parts.append(content)
+                                if first_token is None and content:
+                                    first_token = time.perf_counter()
+                                    record("llm.ttft", first_token - request_start)
+                                    record("answer.ttft", first_token - started)
+                                yield content
+                            except Exception as e:
+                                failed = True
+                                yield f"\n[Error parsing stream chunk: {e}]"
+                    except requests.RequestException as e:
+                        failed = True
+                        yield f"\n[Groq API error: connection lost: {e}]"
+                end = time.perf_counter()
+                record("llm.stream", end - request_start, deltas=len(parts), failed=failed)
+                if first_token is not None and len(parts) > 1 and end > first_token:
+                    # A streamed delta is about one token
+                    observe_rate("llm.tokens_per_s", (len(parts) - 1) / (end - first_token))
+                # Only complete, error-free answers are cached
+                answer = "".join(parts).strip()
+                if use_cache and not failed and answer:
+                    answer_cache.store(doc_set_key, history_sig, q_emb, question, answer, chunks)
         return stream_generator()
     
     else:
         # NON-STREAMED (normal) RESPONSE MODE
-        response = requests.post(GROQ_API_URL, headers=headers, json=data)
         try:
-            resp_json = response.json()
-        except Exception as e:
-            return f"[Groq API error: Could not parse response] {response.text}"
-
-        print("Groq API response:", resp_json)
+            with pool("llm").slot(session_id, on_wait=_queue_callback(on_queue, "llm")), span("llm.complete") as s:
+                resp_json = llm.complete(data)
+                # Token usage goes to the span (trace log, debug panel) instead of stdout
+                usage = resp_json.get("usage") or {}
+                s.update({k: usage[k] for k in ("prompt_tokens", "completion_tokens") if k in usage})
+        except LLMResponseParseError as e:
+            return f"[Groq API error: Could not parse response] {e.body}"
+        except LLMError as e:
+            return f"[Groq API error {e.status_code}] {e.body}"
+        except requests.RequestException as e:
+            return f"[Groq API error: {e}]"
 
-        if response.status_code == 200:
-            answer = resp_json.get("choices", [{}])[0].get("message", {}).get("content", "[No content in response]").strip()
+        answer = resp_json.get("choices", [{}])[0].get("message", {}).get("content", "[No content in response]").strip()
 
-            # Flag suspicious content (like if Groq returned an API key or something wrong)
-            if answer.startswith("gsk_") or len(answer) < 5:
-                return f"[Groq API suspicious response] {resp_json}"
-        else:
-            return f"[Groq API error {response.status_code}] {response.text}"
+        # Flag suspicious content (like if Groq returned an API key or something wrong)
+        if answer.startswith("gsk_") or len(answer) < 5:
+            return f"[Groq API suspicious response] {resp_json}"
+        if use_cache:
+            answer_cache.store(doc_set_key, history_sig, q_emb, question, answer, chunks)
 
         return (answer, chunks) if return_chunks else answer
@@ -0,0 +1,264 @@
+# chunk_store.py
+"""
+Chunk text on disk, indexed by a compact in-memory table.
+
+The text of every chunk is appended (UTF-8) to one file that is read through
+mmap. The table holds a few fixed-size columns per chunk id (byte offset,
+length, document, page, alive flag), about 21 bytes per chunk, instead of a
+Python string each. Looking up a chunk decodes only that chunk.
+Resident memory therefore grows with the number of chunks, not with the
+amount of text; the text itself lives in the OS page cache.
+"""
+
+import json
+import mmap
+import os
+import tempfile
+import threading
+from array import array
+
+CHUNK_TEXT_FILE = "chunks.txt"
+CHUNK_TABLE_FILE = "chunks.tbl"
+CHUNK_DOCS_FILE = "chunks.json"
+# Scratch directory for the text files of stores being built
+CHUNK_DIR = os.getenv("DOCTALK_CHUNK_DIR") or None
+# Compact the text file when removed chunks make up this share of it
+COMPACT_DEAD_SHARE = 0.5
+COMPACT_MIN_BYTES = 1024 * 1024
+# Bytes copied at a time when a read-only store becomes writable
+COPY_BLOCK_BYTES = 1024 * 1024
+
+# Table columns: (attribute, array typecode)
+_COLUMNS = (("_start", "q"), ("_length", "i"), ("_doc", "i"), ("_page", "i"), ("_alive", "b"))
+
+
+class ChunkStore:
+    """
+    Chunk ids are assigned in insertion order (0, 1, 2, ...). Removed chunks keep
+    their id; their text is dropped at the next compaction.
+    A store opened from a cache directory is read-only on disk and copies its
+    text file to a scratch file on the first write.
+    """
+
+    def __init__(self):
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array(typecode))
+        self._docs = []  # doc index -> doc id
+        self._doc_index = {}  # doc id -> doc index
+        self._count = 0  # Alive chunks
+        self._live_bytes = 0
+        self._file = None  # Writable scratch file, or None while empty / read-only
+        self._path = None  # Read-only backing file (cache entry)
+        self._size = 0  # Bytes in the text file
+        self._map = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, directory: str) -> "ChunkStore":
+        """Open a store saved with save(); the text is memory-mapped, not read."""
+        store = cls()
+        with open(os.path.join(directory, CHUNK_DOCS_FILE), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        with open(os.path.join(directory, CHUNK_TABLE_FILE), "rb") as f:
+            data = f.read()
+        offset = 0
+        n = header["count"]
+        for name, typecode in _COLUMNS:
+            column = array(typecode)
+            size = n * column.itemsize
+            column.frombytes(data[offset:offset + size])
+            setattr(store, name, column)
+            offset += size
+        store._docs = header["docs"]
+        store._doc_index = {doc: i for i, doc in enumerate(store._docs)}
+        store._count = sum(store._alive)
+        store._live_bytes = sum(l for l, alive in zip(store._length, store._alive) if alive)
+        store._path = os.path.join(directory, CHUNK_TEXT_FILE)
+        store._size = os.path.getsize(store._path)
+        store._view()  # Map now: the mapping outlives the cache entry being evicted
+        return store
+
+    # -------------------------------
+    # Text file
+    # -------------------------------
+    def _ensure_writable(self):
+        if self._file is not None:
+            return
+        view = self._view() if self._path is not None else None
+        self._file = tempfile.TemporaryFile(prefix="doctalk-chunks-", dir=CHUNK_DIR)
+        if view is not None:
+            # Copy from the mapping, not the path: the cache entry may have been evicted
+            for start in range(0, self._size, COPY_BLOCK_BYTES):
+                self._file.write(view[start:start + COPY_BLOCK_BYTES])
+        self._path = None
+        self._close_map()
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _view(self):
+        """The mmap of the text file, remapped if the file has grown."""
+        if self._map is None or len(self._map) < self._size:
+            self._close_map()
+            if self._size == 0:
+                return None
+            if self._file is not None:
+                self._file.flush()
+                self._map = mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+            else:
+                with open(self._path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), self._size, access=mmap.ACCESS_READ)
+        return self._map
+
+    def close(self):
+        """Release the mapping and delete the scratch file."""
+        with self._lock:
+            self._close_map()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    # -------------------------------
+    # Adding and removing
+    # -------------------------------
+    def add(self, doc_id: str, texts, pages=None) -> range:
+        """Append the chunks of one document; returns their ids."""
+        with self._lock:
+            self._ensure_writable()
+            doc = self._doc_index.get(doc_id)
+            if doc is None:
+                doc = self._doc_index[doc_id] = len(self._docs)
+                self._docs.append(doc_id)
+            first = len(self._start)
+            self._file.seek(self._size)
+            for i, text in enumerate(texts):
+                data = text.encode("utf-8")
+                self._file.write(data)
+                self._start.append(self._size)
+                self._length.append(len(data))
+                self._doc.append(doc)
+                self._page.append(pages[i] if pages is not None else 0)
+                self._alive.append(1)
+                self._size += len(data)
+                self._live_bytes += len(data)
+                self._count += 1
+            return range(first, len(self._start))
+
+    def remove(self, ids):
+        with self._lock:
+            for cid in ids:
+                if self._alive[cid]:
+                    self._alive[cid] = 0
+                    self._count -= 1
+                    self._live_bytes -= self._length[cid]
+            if self._size - self._live_bytes > max(COMPACT_MIN_BYTES, COMPACT_DEAD_SHARE * self._size):
+                self.compact()
+
+    def compact(self):
+        """Rewrite the text file without removed chunks. Ids do not change."""
+        with self._lock:
+            view = self._view()
+            new = tempfile.TemporaryFile(prefix="doctalk-chunks-", dir=CHUNK_DIR)
+            size = 0
+            for cid in self:
+                start, length = self._start[cid], self._length[cid]
+                if length:
+                    new.write(view[start:start + length])
+                self._start[cid] = size
+                size += length
+            for cid, alive in enumerate(self._alive):
+                if not alive:
+                    self._start[cid] = 0
+                    self._length[cid] = 0
+            self.close()
+            self._file, self._path, self._size = new, None, size
+
+    # -------------------------------
+    # Lookups
+    # -------------------------------
+    @property
+    def next_id(self) -> int:
+        return len(self._start)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, cid) -> bool:
+        return 0 <= cid < len(self._alive) and self._alive[cid] == 1
+
+    def __iter__(self):
+        """Alive chunk ids, ascending."""
+        alive = self._alive
+        return (cid for cid in range(len(alive)) if alive[cid])
+
+    def ids(self):
+        return list(self)
+
+    def get(self, cid: int) -> str:
+        with self._lock:
+            start, length = self._start[cid], self._length[cid]
+            if length == 0:
+                return ""
+            return self._view()[start:start + length].decode("utf-8")
+
+    def __getitem__(self, cid: int) -> str:
+        if cid not in self:
+            raise KeyError(cid)
+        return self.get(cid)
+
+    def items(self):
+        """(chunk id, text) of every alive chunk, in id order."""
+        for cid in self:
+            yield cid, self.get(cid)
+
+    def doc_of(self, cid: int) -> str:
+        return self._docs[self._doc[cid]]
+
+    def page_of(self, cid: int) -> int:
+        return self._page[cid]
+
+    def doc_chunk_ids(self) -> dict:
+        """doc id -> array of its alive chunk ids."""
+        out = {}
+        for cid in self:
+            out.setdefault(self._docs[self._doc[cid]], array("q")).append(cid)
+        return out
+
+    def text_bytes(self) -> int:
+        """UTF-8 bytes of alive chunk text (on disk, not resident)."""
+        return self._live_bytes
+
+    def table_bytes(self) -> int:
+        """Resident size of the offset table."""
+        return sum(getattr(self, name).itemsize * len(self._start) for name, _ in _COLUMNS)
+
+    # -------------------------------
+    # Persistence
+    # -------------------------------
+    def save(self, directory: str):
+        """Write the alive chunks (text and table) to directory; open() reads them back."""
+        with self._lock:
+            view = self._view()
+            starts = array("q", [0] * len(self._start))
+            lengths = array("i", [0] * len(self._start))
+            with open(os.path.join(directory, CHUNK_TEXT_FILE), "wb") as f:
+                size = 0
+                for cid in self:
+                    start, length = self._start[cid], self._length[cid]
+                    if length:
+                        f.write(view[start:start + length])
+                    starts[cid], lengths[cid] = size, length
+                    size += length
+            with open(os.path.join(directory, CHUNK_TABLE_FILE), "wb") as f:
+                for column in (starts, lengths, self._doc, self._page, self._alive):
+                    column.tofile(f)
+            with open(os.path.join(directory, CHUNK_DOCS_FILE), "w", encoding="utf-8") as f:
+                json.dump({"count": len(self._start), "docs": self._docs}, f)
@@ -0,0 +1,150 @@
+# context_packer.py
+
+import hashlib
+import os
+
+import numpy as np
+
+# Prompt tokens available for document context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("DOCTALK_CONTEXT_TOKENS", "1500"))
+# Relevance vs. novelty trade-off of maximal marginal relevance (1.0 = relevance only)
+MMR_LAMBDA = 0.7
+# Longest chunk overlap searched for when merging neighbouring chunks
+MAX_OVERLAP_CHARS = 200
+
+# Hugging Face tokenizer of the answering model (name or local path, e.g. a Llama 3
+# tokenizer). Without one, token counts are estimated and part of the budget is kept free
+TOKENIZER = os.getenv("DOCTALK_TOKENIZER", "")
+# Characters per token assumed by the estimate (about right for English prose)
+CHARS_PER_TOKEN = 4
+# Share of the budget left unused when token counts are estimated
+ESTIMATE_MARGIN = 0.15
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+def _get_tokenizer():
+    """Load DOCTALK_TOKENIZER on first use; None if it is unset or cannot be loaded."""
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer = None
+        if TOKENIZER:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER)
+            except Exception:
+                _tokenizer = None
+        _tokenizer_loaded = True
+    return _tokenizer
+
+def counts_are_exact() -> bool:
+    """Whether count_tokens uses the model's tokenizer rather than an estimate."""
+    return _get_tokenizer() is not None
+
+def count_tokens(text: str) -> int:
+    """
+    Number of prompt tokens for text: exact with DOCTALK_TOKENIZER, otherwise
+    estimated at CHARS_PER_TOKEN characters per token.
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def usable_budget(budget: int) -> int:
+    """The budget itself with exact counts; with estimated counts, less ESTIMATE_MARGIN."""
+    return budget if counts_are_exact() else int(budget * (1 - ESTIMATE_MARGIN))
+
+def merge_overlap(first: str, second: str) -> str:
+    """
+    Join two neighbouring chunks, dropping the text the splitter repeated at the
+    start of the second one.
+    """
+    limit = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(limit, 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+def mmr_order(q_emb, vectors, lam: float = MMR_LAMBDA):
+    """
+    Order candidates by maximal marginal relevance: each pick maximizes
+    lam * sim(query) - (1 - lam) * max sim(already picked).
+    Vectors and q_emb must be L2-normalized. Returns candidate positions.
+    """
+    if len(vectors) == 0:
+        return []
+    vectors = np.asarray(vectors, dtype=np.float32)
+    relevance = vectors @ np.asarray(q_emb, dtype=np.float32).reshape(-1)
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    remaining = list(range(len(vectors)))
+    order = []
+    while remaining:
+        scores = [lam * relevance[i] - (1 - lam) * max(redundancy[i], 0.0) for i in remaining]
+        pick = remaining.pop(int(np.argmax(scores)))
+        order.append(pick)
+        redundancy = np.maximum(redundancy, vectors @ vectors[pick])
+    return order
+
+def pack_context(candidates, q_emb=None, vectors=None, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Build the prompt context from ranked retrieval candidates.
+
+    candidates: list of (chunk_id, doc_id, text, ...) records, as returned by
+    VectorStore.chunk_records, best first. Exact duplicates are
+    dropped, the rest are re-ordered by MMR (when vectors are given) and added
+    while the context still fits the token budget (see usable_budget). Neighbouring
+    chunks are merged into spans so their overlap is sent once; only the span a
+    chunk joins is counted again. Whole chunks are skipped rather than cut
+    mid-sentence.
+    Returns (context, texts of the chunks used).
+    """
+    seen = set()
+    unique = []
+    for position, (cid, doc_id, text, *_) in enumerate(candidates):
+        digest = hashlib.sha1(text.strip().encode("utf-8")).digest()
+        if digest not in seen:
+            seen.add(digest)
+            unique.append((position, cid, doc_id, text))
+
+    if vectors is not None and q_emb is not None and unique:
+        positions = [u[0] for u in unique]
+        order = mmr_order(q_emb, np.asarray(vectors)[positions])
+        unique = [unique[i] for i in order]
+
+    limit = usable_budget(budget)
+    separator = count_tokens("\n")
+    ending = {}  # (doc id, last chunk id) -> span
+    starting = {}  # (doc id, first chunk id) -> span
+    span_tokens = 0  # Tokens of all spans, without separators
+    selected = []
+    for rank, (_, cid, doc_id, text) in enumerate(unique):
+        before = ending.get((doc_id, cid - 1))
+        after = starting.get((doc_id, cid + 1))
+        joined = [span for span in (before, after) if span is not None]
+        merged = text
+        if before is not None:
+            merged = merge_overlap(before["text"], merged)
+        if after is not None:
+            merged = merge_overlap(merged, after["text"])
+        tokens = count_tokens(merged)
+        trial = span_tokens - sum(span["tokens"] for span in joined) + tokens
+        spans = len(starting) - len(joined) + 1
+        if trial + separator * (spans - 1) > limit:
+            continue  # Does not fit; a later, shorter chunk still might
+        for span in joined:
+            del ending[(doc_id, span["last_id"])]
+            del starting[(doc_id, span["first_id"])]
+        span = {
+            "first_id": before["first_id"] if before is not None else cid,
+            "last_id": after["last_id"] if after is not None else cid,
+            "rank": min([rank] + [s["rank"] for s in joined]),
+            "text": merged,
+            "tokens": tokens,
+        }
+        ending[(doc_id, span["last_id"])] = span
+        starting[(doc_id, span["first_id"])] = span
+        span_tokens = trial
+        selected.append((rank, text))
+    context = "\n".join(span["text"] for span in sorted(starting.values(), key=lambda span: span["rank"]))
+    return context, [text for _, text in sorted(selected)]
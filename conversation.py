@@ -0,0 +1,142 @@
+# conversation.py
+"""
+Retrieval state kept per conversation, for follow-up questions.
+
+A follow-up such as "what about the second one?" says little on its own, so its
+dense search uses a history-blended query vector: the question's embedding plus
+a decaying, weighted mix of the previous questions' embeddings. BM25 still
+searches the question's own words. The previous turn's context chunks remain
+candidates, so the packer can keep what the conversation is already about.
+
+Chunks retrieved earlier in the conversation stay in a small working set (their
+records and vectors). Turns about the same part of the documents reuse them
+instead of decoding chunk text and reconstructing vectors from the index again.
+
+The state belongs to one session and one document set. It is dropped when the
+documents change, or when the chat history no longer continues the recorded
+turns (the chat was cleared or is a different conversation).
+"""
+
+import os
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+
+# Weight of the earlier questions in the blended query vector (0 searches the bare question)
+HISTORY_WEIGHT = float(os.getenv("DOCTALK_HISTORY_WEIGHT", "0.35"))
+# Each older question counts this much less than the next newer one
+HISTORY_DECAY = 0.5
+# Previous questions blended in; the prompt also shows the last four
+HISTORY_TURNS = 4
+# Context chunks of the previous turn kept as candidates for the next one
+CARRY_OVER_CHUNKS = 4
+# Chunk records and vectors kept per conversation
+WORKING_SET_CHUNKS = int(os.getenv("DOCTALK_WORKING_SET_CHUNKS", "256"))
+DEFAULT_MAX_CONVERSATIONS = 512
+
+
+def _normalized(v):
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else v
+
+
+class Conversation:
+    """Previous turns (question, embedding, context chunk ids) and the working set of one conversation."""
+
+    def __init__(self, doc_set_key: str):
+        self.doc_set_key = doc_set_key
+        self.turns = deque(maxlen=HISTORY_TURNS)  # (question, embedding (d,), context chunk ids)
+        self._history = None  # Decayed, normalized mix of the turns' embeddings, (d,)
+        self._chunks = OrderedDict()  # chunk id -> (chunk record, vector), least recent first
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.fetched = 0
+
+    def continues(self, questions) -> bool:
+        """Whether the recorded turns are the last questions of this chat history."""
+        recorded = [turn[0] for turn in self.turns]
+        return len(questions) >= len(recorded) and questions[len(questions) - len(recorded):] == recorded
+
+    def query_vector(self, q_emb, weight: float = HISTORY_WEIGHT):
+        """The question's embedding blended with the previous questions'; L2-normalized, shape (1, d)."""
+        history = self._history
+        if history is None or weight <= 0:
+            return q_emb
+        blended = np.asarray(q_emb, dtype=np.float32).reshape(-1) + weight * history
+        return _normalized(blended).reshape(1, -1)
+
+    def carry_over(self):
+        """Context chunk ids of the previous turn, best first."""
+        with self._lock:
+            return list(self.turns[-1][2][:CARRY_OVER_CHUNKS]) if self.turns else []
+
+    def fetch(self, store, ids):
+        """
+        (candidates, vectors) for the chunk ids, like store.chunk_records() and
+        store.chunk_vectors(); chunks in the working set are not read from the store.
+        """
+        with self._lock:
+            missing = [cid for cid in ids if cid not in self._chunks]
+        records = store.chunk_records(missing) if missing else []
+        vectors = store.chunk_vectors([r[0] for r in records]) if records else ()
+        with self._lock:
+            for record, vector in zip(records, vectors):
+                self._chunks[record[0]] = (record, vector)
+            entries = []
+            for cid in ids:
+                entry = self._chunks.get(cid)
+                if entry is not None:
+                    self._chunks.move_to_end(cid)
+                    entries.append(entry)
+            while len(self._chunks) > WORKING_SET_CHUNKS:
+                self._chunks.popitem(last=False)
+            self.reused += len(ids) - len(missing)
+            self.fetched += len(missing)
+        if not entries:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        return [e[0] for e in entries], np.stack([e[1] for e in entries])
+
+    def record(self, question: str, q_emb, context_ids):
+        with self._lock:
+            self.turns.append((question, np.asarray(q_emb, dtype=np.float32).reshape(-1), list(context_ids)))
+            history = sum(HISTORY_DECAY ** age * emb for age, (_, emb, _) in enumerate(reversed(self.turns)))
+            self._history = _normalized(history).astype(np.float32)
+
+
+class ConversationCache:
+    """Conversation state per session, least recently used dropped first."""
+
+    def __init__(self, max_conversations: int = DEFAULT_MAX_CONVERSATIONS):
+        self.max_conversations = max_conversations
+        self._conversations = OrderedDict()  # session id -> Conversation
+        self._lock = threading.Lock()
+        self.resets = 0
+
+    def get(self, session_id: str, doc_set_key: str, chat_history) -> Conversation:
+        """The session's conversation, or a new one if the documents or the chat moved on."""
+        questions = [turn.get("user", "") for turn in (chat_history or [])]
+        with self._lock:
+            conversation = self._conversations.get(session_id)
+            if conversation is None or conversation.doc_set_key != doc_set_key or not conversation.continues(questions):
+                if conversation is not None:
+                    self.resets += 1
+                conversation = self._conversations[session_id] = Conversation(doc_set_key)
+            self._conversations.move_to_end(session_id)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+            return conversation
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._conversations.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            conversations = list(self._conversations.values())
+        return {
+            "conversations": len(conversations),
+            "resets": self.resets,
+            "chunks_reused": sum(c.reused for c in conversations),
+            "chunks_fetched": sum(c.fetched for c in conversations),
+        }
@@ -0,0 +1,103 @@
+# dedup.py
+
+import hashlib
+import os
+import re
+import zlib
+
+import numpy as np
+
+# Chunks whose estimated Jaccard similarity (word 3-grams) reaches this are near-duplicates;
+# 1.0 keeps only exact (whitespace- and case-insensitive) duplicate detection
+NEAR_DUP_THRESHOLD = float(os.getenv("DOCTALK_DEDUP_THRESHOLD", "0.8"))
+SHINGLE_WORDS = 3
+# MinHash signature length and its LSH banding. 8 bands of 4 rows make pairs at the
+# threshold candidates with ~98% probability; candidates are then checked on the full signature
+NUM_PERM = 32
+LSH_BANDS = 8
+_PRIME = (1 << 31) - 1
+
+_WORD = re.compile(r"\w+")
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def exact_key(text: str) -> bytes:
+    """Hash of the text with case and whitespace normalized."""
+    return hashlib.blake2b(" ".join(text.lower().split()).encode("utf-8"), digest_size=8).digest()
+
+
+def minhash(text: str):
+    """MinHash signature (uint32, NUM_PERM values) of the text's word 3-gram set, or None if it has no words."""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return None
+    n = max(1, len(words) - SHINGLE_WORDS + 1)
+    shingles = {zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8")) for i in range(n)}
+    x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    # (a * x + b) mod p stays below 2**63 for a, b < 2**31 and x < 2**32
+    return ((np.outer(_PERM_A, x) + _PERM_B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def fingerprint(text: str, near: bool = NEAR_DUP_THRESHOLD < 1.0):
+    """(exact key, MinHash signature or None); cheap enough to compute outside the store lock."""
+    return exact_key(text), minhash(text) if near else None
+
+
+class ChunkDeduplicator:
+    """
+    Finds chunks that repeat an already indexed chunk: exactly (after
+    normalizing case and whitespace) or nearly (MinHash over word 3-grams,
+    bucketed with locality-sensitive hashing).
+
+    Chunks are keyed by the store's chunk ids. Only canonical chunks (the ones
+    that get a vector) are added; duplicates point at them.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD):
+        self.threshold = threshold
+        self.exact = {}  # exact key -> chunk id
+        self.buckets = {}  # (band, band hash) -> [chunk id]
+        self.signatures = {}  # chunk id -> signature bytes (for verifying candidates)
+
+    @property
+    def near(self) -> bool:
+        return self.threshold < 1.0
+
+    def __len__(self):
+        return len(self.exact)
+
+    def _bands(self, signature):
+        rows = NUM_PERM // LSH_BANDS
+        for band in range(LSH_BANDS):
+            yield band, signature[band * rows:(band + 1) * rows].tobytes()
+
+    def find(self, fingerprint):
+        """Return (chunk id, "exact" | "near") of the chunk this one duplicates, or None."""
+        key, signature = fingerprint
+        cid = self.exact.get(key)
+        if cid is not None:
+            return cid, "exact"
+        if signature is None:
+            return None
+        best, best_sim = None, self.threshold
+        seen = set()
+        for band in self._bands(signature):
+            for cid in self.buckets.get(band, ()):
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                other = np.frombuffer(self.signatures[cid], dtype=np.uint32)
+                sim = np.count_nonzero(other == signature) / NUM_PERM
+                if sim >= best_sim:
+                    best, best_sim = cid, sim
+        return (best, "near") if best is not None else None
+
+    def add(self, cid: int, fingerprint):
+        key, signature = fingerprint
+        self.exact.setdefault(key, cid)
+        if signature is not None:
+            self.signatures[cid] = signature.tobytes()
+            for band in self._bands(signature):
+                self.buckets.setdefault(band, []).append(cid)
@@ -0,0 +1,275 @@
+# embedding_backends.py
+"""
+Pluggable embedding backends for VectorStore.
+
+Every backend exposes the subset of SentenceTransformer.encode that the app
+uses, so it is a drop-in embedder. Available backends:
+
+- torch       full-precision PyTorch sentence-transformers (the default)
+- torch-int8  the same model with its Linear layers dynamically quantized to int8
+- onnx        ONNX Runtime through sentence-transformers' ONNX backend
+- onnx-int8   ONNX Runtime with the model's pre-quantized int8 weights
+
+Run this module to compare a backend with the default one:
+    python embedding_backends.py --backend onnx-int8
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+EMBEDDING_BACKEND = os.getenv("DOCTALK_EMBEDDING_BACKEND", "torch").lower()
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+# Pre-quantized ONNX weights shipped with the sentence-transformers models on the Hub
+ONNX_INT8_FILE = os.getenv("DOCTALK_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+# Padded tokens per batch; short chunks get big batches, long chunks small ones
+TOKENS_PER_BATCH = int(os.getenv("DOCTALK_EMBED_TOKENS_PER_BATCH", "8192"))
+MIN_BATCH_SIZE = 8
+MAX_BATCH_SIZE = 256
+CHARS_PER_TOKEN = 4  # Cheap length estimate used for bucketing
+# Upper token lengths of the length buckets whose batch size and threads are tuned separately
+BUCKET_TOKENS = (32, 64, 128)
+# Measure candidate settings on real batches and keep the fastest per bucket (0 = fixed settings)
+AUTOTUNE = os.getenv("DOCTALK_EMBED_AUTOTUNE", "1") != "0"
+# Batches timed per candidate setting before a bucket settles
+TUNE_SAMPLES = 3
+
+
+def default_threads() -> int:
+    return int(os.getenv("DOCTALK_EMBED_THREADS", str(os.cpu_count() or 1)))
+
+
+class BucketTuner:
+    """
+    Picks a (tokens per batch, threads) setting for one length bucket. Each
+    candidate is timed on TUNE_SAMPLES real batches, in turn; after that the
+    one with the best median tokens/s is used for the bucket's batches.
+    """
+
+    def __init__(self, candidates):
+        self.candidates = list(candidates)
+        self.samples = {c: [] for c in self.candidates}  # Estimated tokens/s per timed batch
+        self.best = None
+        self._lock = threading.Lock()
+
+    def choose(self):
+        with self._lock:
+            if self.best is not None:
+                return self.best
+            return min(self.candidates, key=lambda c: len(self.samples[c]))
+
+    def record(self, setting, tokens: int, seconds: float):
+        with self._lock:
+            if self.best is not None or setting not in self.samples:
+                return
+            self.samples[setting].append(tokens / max(seconds, 1e-9))
+            if all(len(s) >= TUNE_SAMPLES for s in self.samples.values()):
+                self.best = max(self.candidates, key=lambda c: float(np.median(self.samples[c])))
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "tokens_per_batch": self.best[0] if self.best else None,
+                "threads": self.best[1] if self.best else None,
+                "tokens_per_s": {f"{t}x{n}": float(np.median(s)) for (t, n), s in self.samples.items() if s},
+            }
+
+
+class BucketedEncoder:
+    """
+    Wraps a SentenceTransformer and encodes inputs in length buckets.
+
+    Inputs are sorted by length so each batch holds texts of similar size and
+    little padding is computed. The batch size is derived per batch from a
+    padded-token budget instead of a fixed batch_size=32. Output order matches
+    the input order.
+
+    With AUTOTUNE, the budget and (for the torch backends) the thread count are
+    tuned per length bucket: short chunks often run best as large batches on
+    fewer threads, long ones as smaller batches on all cores. ONNX Runtime fixes
+    its threads when the model is loaded, so only its budget is tuned.
+    torch.set_num_threads is process-wide; the app encodes from one embedding
+    worker at a time (embedding_service.py).
+    """
+
+    def __init__(self, model, name: str, threads: int = None):
+        self.model = model
+        self.name = name
+        self.threads = threads or default_threads()
+        self._torch = None
+        self._current_threads = None
+        if name.startswith("torch"):
+            try:
+                import torch
+                self._torch = torch
+            except ImportError:
+                pass
+        self._set_threads(self.threads)
+        budgets = (TOKENS_PER_BATCH // 2, TOKENS_PER_BATCH, TOKENS_PER_BATCH * 2)
+        thread_counts = sorted({self.threads, max(1, self.threads // 2)}, reverse=True) if self._torch else [self.threads]
+        self._tuners = [
+            BucketTuner((budget, n) for budget in budgets for n in thread_counts)
+            for _ in range(len(BUCKET_TOKENS) + 1)
+        ]
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def _set_threads(self, threads: int):
+        if self._torch is not None and threads != self._current_threads:
+            self._torch.set_num_threads(threads)
+            self._current_threads = threads
+
+    @staticmethod
+    def _bucket(length: int) -> int:
+        tokens = length // CHARS_PER_TOKEN
+        for i, limit in enumerate(BUCKET_TOKENS):
+            if tokens <= limit:
+                return i
+        return len(BUCKET_TOKENS)
+
+    def _batches(self, lengths):
+        """Yield (indices, bucket, (tokens per batch, threads)) in order of length."""
+        order = np.argsort(lengths, kind="stable")
+        start = 0
+        while start < len(order):
+            bucket = self._bucket(lengths[order[start]])
+            setting = self._tuners[bucket].choose() if AUTOTUNE else (TOKENS_PER_BATCH, self.threads)
+            # Sorted ascending, so the batch's last text sets its padded length
+            size = MAX_BATCH_SIZE
+            while size > MIN_BATCH_SIZE:
+                longest = lengths[order[min(start + size, len(order)) - 1]]
+                if size * max(1, longest // CHARS_PER_TOKEN) <= setting[0]:
+                    break
+                size //= 2
+            yield order[start:start + size], bucket, setting
+            start += size
+
+    def tuning(self) -> dict:
+        """Chosen setting and measured throughput per length bucket (upper token length)."""
+        limits = [str(t) for t in BUCKET_TOKENS] + ["longer"]
+        return {limit: tuner.report() for limit, tuner in zip(limits, self._tuners)}
+
+    def encode(self, sentences, convert_to_numpy: bool = True, show_progress_bar: bool = False,
+               batch_size: int = None, **kwargs):
+        """Encode texts into a float32 array of shape (n, d). batch_size is ignored (auto-tuned)."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        dim = self.get_sentence_embedding_dimension()
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        if texts:
+            lengths = np.array([len(t) for t in texts])
+            for batch, bucket, (tokens, threads) in self._batches(lengths):
+                self._set_threads(threads)
+                start = time.perf_counter()
+                out[batch] = self.model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                )
+                # Small batches (queries, tails) say little about a setting's throughput
+                if AUTOTUNE and len(batch) >= MIN_BATCH_SIZE:
+                    self._tuners[bucket].record((tokens, threads), int(lengths[batch].sum()) // CHARS_PER_TOKEN,
+                                                time.perf_counter() - start)
+        return out[0] if single else out
+
+
+def create_embedder(model_name: str, backend: str = EMBEDDING_BACKEND, threads: int = None):
+    """Load model_name with the given backend and wrap it in a BucketedEncoder."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+    if backend == "torch":
+        model = SentenceTransformer(model_name, device="cpu")
+    elif backend == "torch-int8":
+        import torch
+        model = SentenceTransformer(model_name, device="cpu")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == "onnx":
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+    else:
+        model = SentenceTransformer(
+            model_name, device="cpu", backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE}
+        )
+    return BucketedEncoder(model, backend, threads=threads)
+
+
+def embedding_id(model_name: str, backend: str = EMBEDDING_BACKEND) -> str:
+    """
+    Identity of the vectors a backend produces, used in cache keys. The default
+    backend keeps the bare model name so existing caches stay valid.
+    """
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def parity_check(reference, candidate, texts, k: int = 10) -> dict:
+    """
+    Compare a candidate backend's vectors with the reference backend's:
+    per-text cosine similarity, and how much of the reference top-k
+    neighbourhood (each text against all others) the candidate reproduces.
+    """
+    ref = _normalize(reference.encode(texts))
+    cand = _normalize(candidate.encode(texts))
+    cosine = np.sum(ref * cand, axis=1)
+    k = min(k, len(texts))
+    ref_top = np.argsort(-(ref @ ref.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand @ cand.T), axis=1)[:, :k]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)])
+    return {
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        f"top{k}_overlap": float(overlap),
+    }
+
+
+def throughput(embedder, texts, repeats: int = 1) -> dict:
+    """Chunks per second for encoding texts (after one warm-up batch)."""
+    embedder.encode(texts[:MIN_BATCH_SIZE])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embedder.encode(texts)
+    elapsed = time.perf_counter() - start
+    return {"chunks": len(texts) * repeats, "seconds": elapsed, "chunks_per_s": len(texts) * repeats / elapsed}
+
+
+def _sample_texts(path: str = None, n: int = 512):
+    if path:
+        from vector_store import chunk_text
+        with open(path, "r", encoding="utf-8") as f:
+            return chunk_text(f.read())[:n]
+    rng = np.random.default_rng(0)
+    words = "the index stores vectors for every chunk of text in the uploaded document".split()
+    return [" ".join(rng.choice(words, size=rng.integers(5, 100))) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity and throughput of an embedding backend.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default="onnx-int8", choices=BACKENDS)
+    parser.add_argument("--reference", default="torch", choices=BACKENDS)
+    parser.add_argument("--texts-file", help="plain text file to chunk and embed (default: synthetic text)")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    texts = _sample_texts(args.texts_file)
+    reference = create_embedder(args.model, args.reference, threads=args.threads)
+    candidate = create_embedder(args.model, args.backend, threads=args.threads)
+    print(f"parity {args.backend} vs {args.reference}: {parity_check(reference, candidate, texts)}")
+    for name, embedder in ((args.reference, reference), (args.backend, candidate)):
+        stats = throughput(embedder, texts, repeats=3)  # The first passes also tune the batch settings
+        print(f"{name:>10}: {stats['chunks_per_s']:.1f} chunks/s ({stats['chunks']} chunks in {stats['seconds']:.2f}s)")
+        print(f"{'':>10}  tuning per length bucket: {embedder.tuning()}")
+
+
+if __name__ == "__main__":
+    main()
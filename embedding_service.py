@@ -0,0 +1,169 @@
+# embedding_service.py
+"""
+One embedding worker per model, shared by every session.
+
+Callers submit lists of texts to a lane and get a Future of the embeddings.
+The worker thread coalesces pending requests into micro-batches. It waits
+at most a few milliseconds for more work, so single-query requests from
+concurrent chats share one forward pass.
+
+There are two lanes:
+- "query": interactive query encoding. Always served first.
+- "bulk": chunk encoding during ingestion. Encoded in slices, and the
+  query lane is checked between slices, so a query waits for at most one
+  slice of an ingest, never for the whole document.
+
+Only the worker thread calls the model, so concurrent uploads no longer
+compete for cores with their own encode loops.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+from telemetry import record
+
+QUERY = "query"
+BULK = "bulk"
+# How long the worker waits for more requests before running a partial batch
+QUERY_MAX_WAIT_MS = float(os.getenv("DOCTALK_EMBED_QUERY_WAIT_MS", "2"))
+BULK_MAX_WAIT_MS = float(os.getenv("DOCTALK_EMBED_BULK_WAIT_MS", "10"))
+# Texts per forward pass in each lane; the bulk slice bounds how long a query can wait
+QUERY_MAX_BATCH = 64
+BULK_SLICE = int(os.getenv("DOCTALK_EMBED_BULK_SLICE", "128"))
+
+
+class _Request:
+    __slots__ = ("texts", "future", "offset", "parts", "done", "submitted")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.offset = 0  # Next text to hand to the worker
+        self.parts = []  # Encoded row blocks, in order
+        self.done = 0  # Texts encoded so far
+        self.submitted = time.perf_counter()
+
+    @property
+    def pending(self) -> int:
+        return len(self.texts) - self.offset
+
+
+class EmbeddingService:
+    """
+    Micro-batching front end for an embedder. load_embedder is called by the
+    worker on its first batch, so creating the service is cheap.
+    """
+
+    def __init__(self, load_embedder, name: str = "embedder"):
+        self._load_embedder = load_embedder
+        self._embedder = None
+        self.name = name
+        self._lanes = {QUERY: deque(), BULK: deque()}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {lane: {"batches": 0, "texts": 0} for lane in self._lanes}
+
+    def submit(self, texts, lane: str = BULK) -> Future:
+        """Queue texts for encoding; the Future resolves to a float32 array of shape (n, d)."""
+        request = _Request(list(texts))
+        if not request.texts:
+            request.future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return request.future
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"doctalk-embed-{self.name}", daemon=True)
+                self._thread.start()
+            self._lanes[lane].append(request)
+            self._cond.notify()
+        return request.future
+
+    def encode(self, texts, lane: str = BULK):
+        """Blocking submit(): return the embeddings of texts."""
+        return self.submit(texts, lane).result()
+
+    def queue_depth(self) -> dict:
+        with self._cond:
+            return {lane: sum(r.pending for r in queue) for lane, queue in self._lanes.items()}
+
+    # -------------------------------
+    # Worker
+    # -------------------------------
+    def _pending(self, lane: str) -> int:
+        return sum(r.pending for r in self._lanes[lane])
+
+    def _take(self, lane: str, limit: int):
+        """Pop up to limit texts from the lane as (request, start, end) slices."""
+        queue = self._lanes[lane]
+        work = []
+        room = limit
+        while queue and room > 0:
+            request = queue[0]
+            start = request.offset
+            end = min(len(request.texts), start + room)
+            request.offset = end
+            work.append((request, start, end))
+            room -= end - start
+            if request.pending == 0:
+                queue.popleft()
+        return work
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._lanes[QUERY] and not self._lanes[BULK]:
+                self._cond.wait()
+            lane = QUERY if self._lanes[QUERY] else BULK
+            limit = QUERY_MAX_BATCH if lane == QUERY else BULK_SLICE
+            wait_ms = QUERY_MAX_WAIT_MS if lane == QUERY else BULK_MAX_WAIT_MS
+            deadline = time.perf_counter() + wait_ms / 1000.0
+            # Give other sessions a moment to add to the batch (a query cuts a bulk wait short)
+            while self._pending(lane) < limit and not (lane == BULK and self._lanes[QUERY]):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if lane == BULK and self._lanes[QUERY]:
+                lane, limit = QUERY, QUERY_MAX_BATCH
+            return lane, self._take(lane, limit)
+
+    def _run(self):
+        while True:
+            lane, work = self._next_batch()
+            texts = [text for request, start, end in work for text in request.texts[start:end]]
+            start_time = time.perf_counter()
+            try:
+                if self._embedder is None:
+                    self._embedder = self._load_embedder()
+                embeddings = np.asarray(
+                    self._embedder.encode(texts, convert_to_numpy=True, show_progress_bar=False),
+                    dtype=np.float32,
+                )
+            except Exception as e:
+                self._fail(work, e)
+                continue
+            elapsed = time.perf_counter() - start_time
+            record("embed.batch", elapsed, lane=lane, texts=len(texts), requests=len(work))
+            self.stats[lane]["batches"] += 1
+            self.stats[lane]["texts"] += len(texts)
+
+            row = 0
+            for request, start, end in work:
+                request.parts.append(embeddings[row:row + end - start])
+                request.done += end - start
+                row += end - start
+                if request.done == len(request.texts):
+                    record("embed.queue_wait", start_time - request.submitted, lane=lane)
+                    parts = request.parts
+                    request.future.set_result(parts[0] if len(parts) == 1 else np.concatenate(parts))
+
+    def _fail(self, work, error: Exception):
+        with self._cond:
+            for request, _, _ in work:
+                if not request.future.done():
+                    request.future.set_exception(error)
+                for queue in self._lanes.values():
+                    if request in queue:
+                        queue.remove(request)
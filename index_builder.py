@@ -0,0 +1,161 @@
+# index_builder.py
+
+import math
+import os
+import time
+
+import numpy as np
+from lazy_import import lazy_module
+
+faiss = lazy_module("faiss")
+
+# Corpus sizes (in chunks) at which the index type changes
+HNSW_MIN_VECTORS = int(os.getenv("DOCTALK_HNSW_MIN_VECTORS", "20000"))
+IVF_MIN_VECTORS = int(os.getenv("DOCTALK_IVF_MIN_VECTORS", "200000"))
+# Vector compression for approximate indexes: none, sq8 (4x smaller) or pq (~16-32x smaller)
+QUANTIZATION = os.getenv("DOCTALK_INDEX_QUANTIZATION", "none").lower()
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE_FRACTION = 0.05  # Share of inverted lists probed per query
+RECALL_SAMPLE_QUERIES = 200
+
+
+def choose_index_spec(n: int, d: int, quantization: str = QUANTIZATION) -> str:
+    """
+    Pick a FAISS factory string for a corpus of n vectors of dimension d:
+    exact flat search for small corpora, HNSW for medium and IVF for large ones,
+    optionally with scalar (sq8) or product (pq) quantization.
+    """
+    if n < HNSW_MIN_VECTORS:
+        return "Flat"
+    if n < IVF_MIN_VECTORS:
+        # HNSW over product codes is a poor trade; use SQ8 for any compression
+        return f"HNSW{HNSW_M}" if quantization == "none" else f"HNSW{HNSW_M},SQ8"
+    nlist = int(4 * math.sqrt(n))
+    if quantization == "sq8":
+        return f"IVF{nlist},SQ8"
+    if quantization == "pq":
+        m = next(m for m in (d // 4, d // 8, d // 16, 1) if m >= 1 and d % m == 0)
+        return f"IVF{nlist},PQ{m}"
+    return f"IVF{nlist},Flat"
+
+
+def index_kind(spec: str) -> str:
+    return spec.split(",")[0].rstrip("0123456789")
+
+
+def tune_index(index, spec: str):
+    """Set the search-time parameters for the index type."""
+    kind = index_kind(spec)
+    if kind == "HNSW":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", HNSW_EF_SEARCH)
+    elif kind == "IVF":
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = max(1, int(ivf.nlist * IVF_NPROBE_FRACTION))
+
+
+def build_index(vectors, ids, spec: str):
+    """
+    Build an index holding vectors under the given int64 ids.
+
+    Flat and HNSW indexes are wrapped in IndexIDMap2. IVF indexes keep the ids
+    themselves and get a hashtable direct map, so they support both
+    reconstruct() and remove_ids(). Training uses the vectors themselves.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    d = vectors.shape[1]
+    kind = index_kind(spec)
+    if kind == "IVF":
+        index = faiss.index_factory(d, spec)
+        index.train(vectors)
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.add_with_ids(vectors, ids)
+    else:
+        inner = faiss.index_factory(d, spec)
+        if not inner.is_trained:
+            inner.train(vectors)
+        index = faiss.IndexIDMap2(inner)
+        index.add_with_ids(vectors, ids)
+    tune_index(index, spec)
+    return index
+
+
+def supports_removal(spec: str) -> bool:
+    return index_kind(spec) != "HNSW"
+
+
+def estimate_bytes(spec: str, n: int, d: int) -> int:
+    """Approximate resident size of n vectors in an index built from spec."""
+    parts = spec.split(",")
+    code = d * 4
+    if len(parts) > 1 and parts[1] == "SQ8":
+        code = d
+    elif len(parts) > 1 and parts[1].startswith("PQ"):
+        code = int(parts[1][2:])
+    overhead = 8  # id
+    if index_kind(spec) == "HNSW":
+        overhead += HNSW_M * 2 * 4  # level-0 neighbour lists
+    return n * (code + overhead)
+
+
+def export_vectors(index, ids):
+    """Reconstruct the stored vectors of the given ids (lossy for quantized indexes)."""
+    if isinstance(index, faiss.IndexIDMap2) or hasattr(index, "id_map"):
+        stored = faiss.vector_to_array(index.id_map)
+        inner = faiss.downcast_index(index.index)
+        if len(stored) == len(ids) and np.array_equal(stored, np.asarray(ids, dtype=np.int64)):
+            return inner.reconstruct_n(0, index.ntotal)
+    return np.stack([index.reconstruct(int(i)) for i in ids])
+
+
+def measure_recall(index, vectors, queries, k: int = 10, ids=None):
+    """
+    Recall@k of index against exact flat search over vectors, plus the mean
+    search latency per query. ids maps rows of vectors to the index's ids.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    ids = np.arange(len(vectors), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    elapsed = time.perf_counter() - start
+    hits = sum(len(set(ids[t[t >= 0]]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return {
+        "recall_at_k": hits / max(1, truth.size),
+        "search_ms_per_query": 1000.0 * elapsed / max(1, len(queries)),
+    }
+
+
+def evaluate_configs(vectors, specs=None, k: int = 10, num_queries: int = RECALL_SAMPLE_QUERIES):
+    """
+    Build every candidate configuration over vectors and report recall@k against
+    the flat baseline, search latency, estimated memory and build time, so
+    accuracy can be traded for speed and RAM deliberately.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+    if specs is None:
+        nlist = max(1, int(4 * math.sqrt(n)))
+        specs = ["Flat", f"HNSW{HNSW_M}", f"HNSW{HNSW_M},SQ8", f"IVF{nlist},Flat", f"IVF{nlist},SQ8"]
+        if d % 8 == 0:
+            specs.append(f"IVF{nlist},PQ{d // 8}")
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(n, size=min(num_queries, n), replace=False)]
+    ids = np.arange(n, dtype=np.int64)
+    report = []
+    for spec in specs:
+        start = time.perf_counter()
+        try:
+            index = build_index(vectors, ids, spec)
+        except RuntimeError as e:  # e.g. too few vectors to train this many lists
+            report.append({"spec": spec, "error": str(e)})
+            continue
+        build_s = time.perf_counter() - start
+        stats = measure_recall(index, vectors, queries, k=k, ids=ids)
+        stats.update(spec=spec, build_s=build_s, estimated_bytes=estimate_bytes(spec, n, d))
+        report.append(stats)
+    return report
@@ -0,0 +1,154 @@
+# index_bundle.py
+"""
+Portable index bundles: a prebuilt index for a set of documents, written by
+batch_ingest.py and loaded by VectorStore.load_bundle().
+
+A bundle is a directory with the same files as an index cache entry (chunk
+text and table, embeddings.npy, index.faiss) and a meta.json manifest that
+describes it:
+    bundle_version   layout version (BUNDLE_VERSION)
+    key              cache key of the document set (files, embedding model and
+                     backend, chunking), the same key the on-disk cache uses
+    embedding, model, chunk_size, chunk_overlap, dim, index_spec, index_stats
+    doc_names        doc id (content hash) -> display name
+    files            per-file metadata: doc id, path, size, mtime, chunks
+Loading memory-maps the files, so opening even a large bundle is instant.
+
+Bundles under the directories in DOCTALK_BUNDLE_DIR (separated by os.pathsep)
+are mounted: a store asked for a document set that a bundle holds loads the
+bundle instead of indexing the files again.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+
+from index_cache import META_FILE, read_entry, write_entry
+
+# Bump when the bundle layout changes; newer bundles are refused, older ones still load
+BUNDLE_VERSION = 1
+BUNDLE_DIRS = [d for d in os.getenv("DOCTALK_BUNDLE_DIR", "").split(os.pathsep) if d]
+
+
+class BundleError(Exception):
+    """A bundle that is missing, damaged, too new, or built for other settings"""
+    pass
+
+
+def read_manifest(path: str) -> dict:
+    try:
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"{path} is not an index bundle: {e}")
+    version = manifest.get("bundle_version")
+    if version is None:
+        raise BundleError(f"{path} is not an index bundle (no bundle_version in {META_FILE})")
+    if version > BUNDLE_VERSION:
+        raise BundleError(f"{path} has bundle version {version}; this version reads up to {BUNDLE_VERSION}")
+    return manifest
+
+
+def read_bundle(path: str):
+    """Open a bundle; returns (chunk store, embeddings, index, manifest), memory-mapped."""
+    read_manifest(path)
+    try:
+        return read_entry(path)
+    except Exception as e:
+        raise BundleError(f"Could not read index bundle {path}: {e}")
+
+
+def write_bundle(path: str, chunks, embeddings, index, manifest: dict):
+    """
+    Write a bundle to path, replacing any bundle already there. The bundle is
+    written next to path and renamed into place, so a serving node never sees a
+    half-written bundle; stores that still map the old files keep working.
+    """
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    stamp = f"{os.getpid()}-{int(time.time() * 1000)}"
+    tmp = f"{path}.tmp-{stamp}"
+    os.makedirs(tmp)
+    try:
+        write_entry(tmp, chunks, embeddings, index, dict(manifest, bundle_version=BUNDLE_VERSION, created=time.time()))
+        if os.path.exists(path):
+            old = f"{path}.old-{stamp}"
+            os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+class BundleRegistry:
+    """
+    The bundles under a list of directories, by name and by cache key.
+    A directory is rescanned when its modification time changes, i.e. when a
+    bundle is added, removed or replaced.
+    """
+
+    def __init__(self, directories=()):
+        self.directories = list(directories)
+        self._by_key = {}
+        self._by_name = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        stamp = []
+        for directory in self.directories:
+            try:
+                stamp.append(os.stat(directory).st_mtime_ns)
+            except OSError:
+                stamp.append(None)
+        stamp = tuple(stamp)
+        if stamp == self._stamp:
+            return
+        by_key, by_name = {}, {}
+        for directory in self.directories:
+            try:
+                names = sorted(os.listdir(directory))
+            except OSError:
+                continue
+            for name in names:
+                if ".tmp-" in name or ".old-" in name:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    manifest = read_manifest(path)
+                except BundleError:
+                    continue
+                by_name.setdefault(name, path)
+                if manifest.get("key"):
+                    by_key.setdefault(manifest["key"], path)
+        self._by_key, self._by_name, self._stamp = by_key, by_name, stamp
+
+    def find(self, key: str):
+        """Path of the bundle holding the document set with this cache key, or None."""
+        if not self.directories:
+            return None
+        with self._lock:
+            self._refresh()
+            return self._by_key.get(key)
+
+    def path(self, name: str):
+        """Path of the bundle with this directory name, or None."""
+        if not self.directories:
+            return None
+        with self._lock:
+            self._refresh()
+            return self._by_name.get(name)
+
+    def names(self):
+        with self._lock:
+            self._refresh()
+            return list(self._by_name)
+
+
+bundles = BundleRegistry(BUNDLE_DIRS)
@@ -0,0 +1,205 @@
+# index_cache.py
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from chunk_store import ChunkStore
+from index_builder import index_kind
+from lazy_import import lazy_module
+
+faiss = lazy_module("faiss")
+
+# Cache location and size budget can be overridden from the environment (.env)
+DEFAULT_CACHE_DIR = os.getenv(
+    "DOCTALK_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "doctalk")
+)
+DEFAULT_CACHE_MAX_BYTES = int(os.getenv("DOCTALK_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+EMBEDDINGS_FILE = "embeddings.npy"
+INDEX_FILE = "index.faiss"
+META_FILE = "meta.json"
+# Bump when the on-disk entry layout or the chunking changes so old entries are never misread
+CACHE_FORMAT = 6
+
+
+def hash_file(file) -> str:
+    """
+    Return the SHA-256 hex digest of an uploaded file's contents.
+    Works with Streamlit's UploadedFile and plain file-like objects.
+    """
+    if hasattr(file, "getvalue"):
+        data = file.getvalue()
+    else:
+        pos = file.tell()
+        file.seek(0)
+        data = file.read()
+        file.seek(pos)
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(file_hashes, model_name: str, chunk_size: int, chunk_overlap: int) -> str:
+    """
+    Build a cache key from the content hash of each file, the embedding model
+    and the chunking parameters. Any change to one of them gives a new key.
+    The order of the files does not matter. The index type is not part of the
+    key: it depends on the number of vectors, so a loaded index is checked
+    against the current index settings instead (VectorStore._reselect_index).
+    """
+    payload = json.dumps(
+        {
+            "format": CACHE_FORMAT,
+            "files": sorted(file_hashes),
+            "model": model_name,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def write_entry(directory: str, chunks: ChunkStore, embeddings, index, meta: dict):
+    """Write chunks, embeddings, FAISS index and meta into an existing directory."""
+    chunks.save(directory)
+    np.save(os.path.join(directory, EMBEDDINGS_FILE), np.ascontiguousarray(embeddings, dtype=np.float32))
+    faiss.write_index(index, os.path.join(directory, INDEX_FILE))
+    with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def read_entry(directory: str):
+    """
+    Open a directory written by write_entry. Chunk text, embeddings and the FAISS
+    index are memory-mapped, so only the pages that are actually used get read.
+    IVF indexes are the exception: memory-mapped, their inverted lists become
+    OnDiskInvertedLists, which can be neither copied nor edited, so they are read
+    into memory.
+    Returns (chunk store, embeddings, index, meta).
+    """
+    with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    chunks = ChunkStore.open(directory)
+    embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+    flags = 0 if index_kind(meta.get("index_spec", "Flat")) == "IVF" else faiss.IO_FLAG_MMAP
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE), flags)
+    return chunks, embeddings, index, meta
+
+
+class IndexCache:
+    """
+    Content-addressed on-disk cache of chunks, embeddings and FAISS indexes.
+    Each entry lives in its own directory named after the cache key. Entries
+    are evicted in least-recently-used order once the total size exceeds
+    max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _touch(self, key: str):
+        # The mtime of the meta file is the entry's last-used timestamp
+        meta_path = os.path.join(self._entry_dir(key), META_FILE)
+        now = time.time()
+        os.utime(meta_path, (now, now))
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self._entry_dir(key), META_FILE))
+
+    def get(self, key: str):
+        """
+        Load a cached entry. Chunk text, embeddings and the FAISS index are
+        memory-mapped, so a warm load only touches the pages that are actually used.
+        Returns (chunk store, embeddings, index, meta) or None on a miss.
+        """
+        if not self.contains(key):
+            return None
+        entry = self._entry_dir(key)
+        try:
+            cached = read_entry(entry)
+        except Exception:
+            # A broken entry is treated as a miss and removed
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        self._touch(key)
+        return cached
+
+    def put(self, key: str, chunks: ChunkStore, embeddings, index, meta=None, replace: bool = False):
+        """
+        Store an entry. Files are written to a temporary directory first and
+        renamed into place, so readers never see a half-written entry.
+        An existing entry is kept unless replace is set (e.g. its index was
+        rebuilt for the current index settings); stores that still map the old
+        files keep working.
+        """
+        entry = self._entry_dir(key)
+        if self.contains(key) and not replace:
+            self._touch(key)
+            return
+        stamp = f"{os.getpid()}-{int(time.time() * 1000)}"
+        tmp = f"{entry}.tmp-{stamp}"
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            write_entry(tmp, chunks, embeddings, index, dict(meta or {}, created=time.time()))
+            if os.path.exists(entry):
+                old = f"{entry}.old-{stamp}"
+                os.replace(entry, old)
+                os.replace(tmp, entry)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.replace(tmp, entry)
+        except OSError:
+            # Another process may have stored the same key concurrently
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not self.contains(key):
+                raise
+        self.evict(keep=key)
+
+    def _entry_size(self, key: str) -> int:
+        entry = self._entry_dir(key)
+        total = 0
+        for name in os.listdir(entry):
+            try:
+                total += os.path.getsize(os.path.join(entry, name))
+            except OSError:
+                pass
+        return total
+
+    def _entries(self):
+        """Return (last_used, key, size) for every complete entry."""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            if ".tmp-" in key or ".old-" in key or not self.contains(key):
+                continue
+            try:
+                last_used = os.path.getmtime(os.path.join(self._entry_dir(key), META_FILE))
+            except OSError:
+                continue
+            entries.append((last_used, key, self._entry_size(key)))
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self, keep: str = None):
+        """
+        Remove least-recently-used entries until the cache fits its budget.
+        The entry named by keep is never removed.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
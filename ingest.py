@@ -0,0 +1,103 @@
+# ingest.py
+
+import threading
+
+from scheduler import Overloaded, pool
+
+
+class IngestJob:
+    """
+    Runs VectorStore.sync_documents in a background thread.
+
+    Extraction, chunking and embedding are overlapped: PDF page batches are
+    extracted ahead in the process pool while earlier batches are embedded, and
+    each embedded slice is added to the live index right away. The UI polls the
+    job's counters and can answer questions against the partial index meanwhile.
+
+    Jobs take a slot in the "ingest" pool first; while all slots are busy the
+    job waits (queue_position > 0) and can still be cancelled.
+    """
+
+    def __init__(self, store, documents, session_id: str = "default"):
+        self.store = store
+        self.documents = documents
+        self.session_id = session_id
+        self.queue_position = 0
+        self.chunks_indexed = 0
+        self.docs_done = 0
+        self.docs_total = len(documents)
+        self.current_doc = None
+        self.summary = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _on_progress(self, chunks_indexed, docs_done, docs_total, name):
+        self.chunks_indexed = chunks_indexed
+        self.docs_done = docs_done
+        self.docs_total = docs_total
+        self.current_doc = name
+
+    def _on_queue(self, position):
+        self.queue_position = position
+
+    def _run(self):
+        ingest_pool = pool("ingest")
+        ticket = None
+        try:
+            ticket = ingest_pool.acquire(self.session_id, on_wait=self._on_queue, cancel=self._cancel)
+            if ticket is None:
+                self.summary = {"cached": False, "added": 0, "removed": 0, "cancelled": True, "duplicates": 0}
+                return
+            self.summary = self.store.sync_documents(
+                self.documents, on_progress=self._on_progress, cancel=self._cancel
+            )
+            self.docs_done = self.docs_total
+        except Exception as e:
+            self.error = e
+        finally:
+            ingest_pool.release(ticket)
+            self._done.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self):
+        """Ask the job to stop after the current batch."""
+        self._cancel.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _savings(self) -> str:
+        # What duplicate elimination saved over the whole document set (see VectorStore.dedup_report)
+        report = self.store.dedup_report()
+        if not report["duplicates"]:
+            return ""
+        return (f" ({report['duplicates']} duplicate chunks share an existing vector, "
+                f"{report['vector_bytes_saved'] / 1024:.0f} KB of index memory saved)")
+
+    def status_text(self) -> str:
+        if isinstance(self.error, Overloaded):
+            return f"Indexing is busy right now; try again in {self.error.retry_after:.0f}s."
+        if self.error is not None:
+            return f"Indexing failed: {self.error}"
+        if self.done:
+            if self.summary and self.summary["cancelled"]:
+                return "Indexing cancelled."
+            if self.summary and self.summary["cached"]:
+                return f"Vector store loaded from cache!{self._savings()}"
+            return f"Vector store ready! {self.store.num_chunks()} chunks indexed{self._savings()}."
+        if self.queue_position:
+            return f"Waiting to index: #{self.queue_position} in line..."
+        doc = f" ({self.current_doc})" if self.current_doc else ""
+        return (
+            f"Indexing file {min(self.docs_done + 1, self.docs_total)} of {self.docs_total}{doc}: "
+            f"{self.chunks_indexed} chunks searchable so far..."
+        )
@@ -0,0 +1,212 @@
+# llm_client.py
+
+import asyncio
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# OpenAI-compatible chat completions endpoint; point it at a local fake server for testing
+DEFAULT_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("DOCTALK_LLM_CONNECT_TIMEOUT", "5"))
+DEFAULT_READ_TIMEOUT = float(os.getenv("DOCTALK_LLM_READ_TIMEOUT", "60"))
+DEFAULT_MAX_RETRIES = int(os.getenv("DOCTALK_LLM_MAX_RETRIES", "3"))
+DEFAULT_POOL_SIZE = int(os.getenv("DOCTALK_LLM_POOL_SIZE", "32"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BACKOFF_FACTOR = 0.5
+
+
+class LLMError(Exception):
+    """Raised when the LLM backend returns an error response"""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"LLM API error {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+class LLMResponseParseError(LLMError):
+    """Raised when a successful response body is not valid JSON"""
+    pass
+
+
+class LLMStream:
+    """
+    An in-flight streamed completion. Iterating yields the raw payload of every
+    SSE "data:" line until "[DONE]". The HTTP response is always released:
+    when iteration ends, when close() is called (cancellation), or when the
+    object is used as a context manager and the block exits.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            for line in self._response.iter_lines():
+                if self._closed:
+                    break
+                if line and line.strip().startswith(b"data:"):
+                    payload = line.decode().replace("data: ", "").strip()
+                    if payload == "[DONE]":
+                        break
+                    yield payload
+        finally:
+            self.close()
+
+    def close(self):
+        """Cancel the stream and return its connection to the pool."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._response.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LLMClient(ABC):
+    """
+    Interface of a chat-completions backend. Implementations take the OpenAI
+    request body (without "stream") and return the parsed JSON response, or an
+    LLMStream of SSE payloads.
+    """
+
+    @abstractmethod
+    def complete(self, body: dict) -> dict:
+        ...
+
+    @abstractmethod
+    def stream(self, body: dict) -> LLMStream:
+        ...
+
+    def close(self):
+        pass
+
+
+class HTTPLLMClient(LLMClient):
+    """
+    OpenAI-compatible HTTP client (Groq by default) with a keep-alive connection
+    pool, connect/read timeouts and bounded retries with exponential backoff on
+    429 and 5xx responses (honouring Retry-After). Read timeouts are raised as
+    requests.exceptions.ReadTimeout without a retry.
+    """
+
+    def __init__(self, api_key: str, api_url: str = DEFAULT_API_URL,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES, pool_size: int = DEFAULT_POOL_SIZE):
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+        retry = Retry(
+            total=max_retries,
+            read=False,  # A request that timed out reading is not sent again; the model may still be generating
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _post(self, body: dict, stream: bool):
+        response = self.session.post(
+            self.api_url, json=dict(body, stream=stream), stream=stream, timeout=self.timeout
+        )
+        if response.status_code != 200:
+            text = response.text
+            response.close()
+            raise LLMError(response.status_code, text)
+        return response
+
+    def complete(self, body: dict) -> dict:
+        response = self._post(body, stream=False)
+        try:
+            return response.json()
+        except ValueError:
+            raise LLMResponseParseError(response.status_code, response.text)
+
+    def stream(self, body: dict) -> LLMStream:
+        return LLMStream(self._post(body, stream=True))
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncLLMClient:
+    """
+    asyncio variant of an LLMClient, for callers running on an event loop. Each
+    blocking call of the wrapped client runs in a worker thread, so requests
+    share its connection pool, timeouts and retries. stream() is an async
+    generator of SSE payloads; closing it, or cancelling the task that iterates
+    it, closes the HTTP response (in the background, as soon as the read in
+    progress returns).
+    """
+
+    def __init__(self, client: LLMClient):
+        self.client = client
+
+    async def complete(self, body: dict) -> dict:
+        return await asyncio.to_thread(self.client.complete, body)
+
+    async def stream(self, body: dict):
+        loop = asyncio.get_running_loop()
+        stream = await asyncio.to_thread(self.client.stream, body)
+        queue = asyncio.Queue()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # The loop is gone; nobody is reading any more
+
+        def pump():
+            # A thread of its own rather than the loop's executor, so a read still
+            # blocked after cancellation never holds up the loop's shutdown
+            try:
+                for payload in stream:
+                    put((payload, None))
+                put((None, None))
+            except Exception as e:
+                put((None, e))
+
+        threading.Thread(target=pump, daemon=True).start()
+        try:
+            while True:
+                payload, error = await queue.get()
+                if error is not None and not stream.closed:
+                    raise error
+                if payload is None:
+                    return
+                yield payload
+        finally:
+            # Closing waits for a read in progress, so it must not block the loop
+            threading.Thread(target=stream.close, daemon=True).start()
+
+    async def close(self):
+        await asyncio.to_thread(self.client.close)
+
+
+def parse_delta(payload: str) -> str:
+    """Return the content delta of one streamed chat-completions chunk."""
+    return json.loads(payload)["choices"][0]["delta"].get("content", "")
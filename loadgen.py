@@ -0,0 +1,280 @@
+# loadgen.py
+"""
+Synthetic load generator for the scheduler (scheduler.py).
+
+Many sessions use the app's pipeline at once. Each one indexes its own small
+synthetic PDF and then asks questions one after another, like a reader. One
+"noisy" session can also fire a burst of questions concurrently. Answers come
+from the benchmark's stub LLM. The stub can be limited to a number of
+concurrent requests and answers the rest with 429, like a rate-limited provider.
+
+The report is JSON. It gives latencies (queue wait included) for ingestion,
+time to first token and full answers (p50/p99), and outcome counts: answered,
+shed by the scheduler, or failed at the LLM. It also gives the stub's
+throttling counters and each pool's counters. The quiet sessions are reported
+apart from the noisy one, to show whether fair queuing protects them.
+
+Usage:
+    python loadgen.py                              # 16 sessions, 4 questions each
+    python loadgen.py --sessions 32 --burst 20     # one session floods the LLM queue
+    python loadgen.py --unlimited                  # the same load without admission limits
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Cold model loading is part of the first ingestion, as in a fresh server
+os.environ.setdefault("DOCTALK_WARMUP", "0")
+
+from benchmark import _StubLLMHandler, percentiles, sample_queries, start_stub_llm, synthetic_pages, write_pdf
+
+NUM_SESSIONS = 16
+QUESTIONS_PER_SESSION = 4
+PAGES_PER_DOCUMENT = 5
+LLM_FIRST_TOKEN_MS = 200.0
+LLM_TOKEN_MS = 10.0
+# Concurrent requests the stub LLM accepts before answering 429 (0 = unlimited)
+LLM_MAX_CONCURRENT = 4
+
+
+class _ThrottledLLMHandler(_StubLLMHandler):
+    """The stub LLM, answering 429 with Retry-After above max_concurrent in-flight requests."""
+
+    max_concurrent = 0
+    lock = None
+    counters = None
+
+    def do_POST(self):
+        with self.lock:
+            self.counters["requests"] += 1
+            throttled = bool(self.max_concurrent) and self.counters["active"] >= self.max_concurrent
+            if throttled:
+                self.counters["throttled"] += 1
+            else:
+                self.counters["active"] += 1
+                self.counters["peak_active"] = max(self.counters["peak_active"], self.counters["active"])
+        if throttled:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            super().do_POST()
+        finally:
+            with self.lock:
+                self.counters["active"] -= 1
+
+
+def _document(path: str):
+    from index_cache import hash_file
+    from pdf_reader import iter_file_section
+
+    with open(path, "rb") as f:
+        data = f.read()
+    name = os.path.basename(path)
+
+    def load_batches():
+        file = io.BytesIO(data)
+        file.name = name
+        return iter_file_section(file)
+
+    return {hash_file(io.BytesIO(data)): (name, load_batches)}
+
+
+class _Session:
+    def __init__(self, number: int, path: str, questions):
+        self.session_id = f"loadgen-{number}"
+        self.path = path
+        self.questions = questions
+        self.ingest_s = None
+        self.ingest_outcome = None
+        self.answers = []  # {"outcome", "ttft_s", "total_s", "queue_position"}
+        self.lock = threading.Lock()
+
+    def ingest(self):
+        import chatbot
+        from scheduler import Overloaded
+
+        start = time.perf_counter()
+        try:
+            job = chatbot.start_ingestion(_document(self.path), session_id=self.session_id)
+        except Overloaded:
+            self.ingest_outcome = "shed"
+            return False
+        job.wait()
+        self.ingest_s = time.perf_counter() - start
+        if isinstance(job.error, Overloaded):
+            self.ingest_outcome = "shed"
+        elif job.error is not None:
+            self.ingest_outcome = f"failed: {job.error}"
+        else:
+            self.ingest_outcome = "ok"
+        return self.ingest_outcome == "ok"
+
+    def ask(self, question: str):
+        import chatbot
+        from scheduler import Overloaded
+
+        positions = [0]
+        on_queue = lambda resource, position: positions.append(position)
+        start = time.perf_counter()
+        first = None
+        parts = []
+        outcome = "ok"
+        try:
+            for delta in chatbot.answer_with_rag(question, top_k=3, stream=True,
+                                                 session_id=self.session_id, on_queue=on_queue):
+                if first is None and delta:
+                    first = time.perf_counter() - start
+                parts.append(delta)
+        except Overloaded:
+            outcome = "shed"
+        total = time.perf_counter() - start
+        if outcome == "ok" and "".join(parts).lstrip().startswith("[Groq API error"):
+            outcome = "llm_error"
+        with self.lock:
+            self.answers.append({"outcome": outcome, "ttft_s": first if first is not None else total,
+                                 "total_s": total, "queue_position": max(positions)})
+
+
+def _run_session(session: _Session, burst: int, barrier: threading.Barrier):
+    barrier.wait()
+    if not session.ingest():
+        return
+    if burst:
+        threads = [threading.Thread(target=session.ask, args=(q,)) for q in session.questions[:burst]]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    else:
+        for question in session.questions:
+            session.ask(question)
+
+
+def _answer_report(sessions) -> dict:
+    answers = [a for s in sessions for a in s.answers]
+    ok = [a for a in answers if a["outcome"] == "ok"]
+    return {
+        "asked": len(answers),
+        "answered": len(ok),
+        "shed": sum(a["outcome"] == "shed" for a in answers),
+        "llm_errors": sum(a["outcome"] == "llm_error" for a in answers),
+        "queued": sum(a["queue_position"] > 0 for a in answers),
+        "max_queue_position": max((a["queue_position"] for a in answers), default=0),
+        "ttft": percentiles([a["ttft_s"] for a in ok]),
+        "total": percentiles([a["total_s"] for a in ok]),
+    }
+
+
+def run(num_sessions: int = NUM_SESSIONS, questions: int = QUESTIONS_PER_SESSION, pages: int = PAGES_PER_DOCUMENT,
+        burst: int = 0, llm_first_token_ms: float = LLM_FIRST_TOKEN_MS, llm_token_ms: float = LLM_TOKEN_MS,
+        llm_max_concurrent: int = LLM_MAX_CONCURRENT, unlimited: bool = False, directory: str = None) -> dict:
+    import chatbot
+    from llm_client import HTTPLLMClient
+    from scheduler import pools, snapshot
+
+    if unlimited:
+        for p in pools.values():
+            p.resize(limit=1 << 30, max_queue=1 << 30)
+
+    sessions = []
+    for number in range(num_sessions):
+        page_texts = synthetic_pages(pages, seed=100 + number)
+        path = os.path.join(directory, f"loadgen-{number}.pdf")
+        if not os.path.exists(path):
+            write_pdf(page_texts, path)
+        count = max(questions, burst) if number == 0 else questions
+        sessions.append(_Session(number, path, sample_queries("\n".join(page_texts), count, seed=number)))
+
+    counters = {"requests": 0, "throttled": 0, "active": 0, "peak_active": 0}
+    server, url = start_stub_llm(llm_first_token_ms, llm_token_ms, base=_ThrottledLLMHandler,
+                                 max_concurrent=llm_max_concurrent, lock=threading.Lock(), counters=counters)
+    chatbot.set_llm_client(HTTPLLMClient("loadgen", api_url=url, pool_size=max(4, num_sessions + burst)))
+    barrier = threading.Barrier(num_sessions)
+    threads = [
+        threading.Thread(target=_run_session, args=(s, burst if i == 0 else 0, barrier), daemon=True)
+        for i, s in enumerate(sessions)
+    ]
+    start = time.perf_counter()
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        server.shutdown()
+    wall = time.perf_counter() - start
+    for s in sessions:
+        chatbot.release_vector_store(s.session_id)
+
+    ingest_outcomes = {}
+    for s in sessions:
+        ingest_outcomes[s.ingest_outcome] = ingest_outcomes.get(s.ingest_outcome, 0) + 1
+    return {
+        "config": {
+            "sessions": num_sessions,
+            "questions_per_session": questions,
+            "pages_per_document": pages,
+            "burst": burst,
+            "llm_first_token_ms": llm_first_token_ms,
+            "llm_token_ms": llm_token_ms,
+            "llm_max_concurrent": llm_max_concurrent,
+            "scheduler": "unlimited" if unlimited else {name: {"limit": p.limit, "max_queue": p.max_queue}
+                                                        for name, p in pools.items()},
+        },
+        "wall_s": wall,
+        "ingest": dict(percentiles([s.ingest_s for s in sessions if s.ingest_s is not None]), outcomes=ingest_outcomes),
+        "answers": _answer_report(sessions),
+        "quiet_sessions": _answer_report(sessions[1:] if burst else sessions),
+        "noisy_session": _answer_report(sessions[:1]) if burst else None,
+        "stub_llm": {k: v for k, v in counters.items() if k != "active"},
+        "pools": snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive many concurrent sessions through the scheduler.")
+    parser.add_argument("--sessions", type=int, default=NUM_SESSIONS)
+    parser.add_argument("--questions", type=int, default=QUESTIONS_PER_SESSION, help="questions per session")
+    parser.add_argument("--pages", type=int, default=PAGES_PER_DOCUMENT, help="pages per session's document")
+    parser.add_argument("--burst", type=int, default=0,
+                        help="session 0 asks this many questions at once instead of one after another")
+    parser.add_argument("--llm-delay-ms", type=float, default=LLM_FIRST_TOKEN_MS, help="stub LLM delay before the first token")
+    parser.add_argument("--llm-token-ms", type=float, default=LLM_TOKEN_MS, help="stub LLM delay per streamed token")
+    parser.add_argument("--llm-max-concurrent", type=int, default=LLM_MAX_CONCURRENT,
+                        help="requests the stub LLM serves at once before answering 429 (0 = unlimited)")
+    parser.add_argument("--unlimited", action="store_true", help="lift the scheduler's limits, for comparison")
+    parser.add_argument("--corpus-dir", help="keep generated documents here instead of a temporary directory")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.corpus_dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        report = run(args.sessions, args.questions, args.pages, burst=args.burst,
+                     llm_first_token_ms=args.llm_delay_ms, llm_token_ms=args.llm_token_ms,
+                     llm_max_concurrent=args.llm_max_concurrent, unlimited=args.unlimited, directory=directory)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    answers = report["answers"]
+    print(f"answered {answers['answered']}/{answers['asked']}, shed {answers['shed']}, "
+          f"LLM errors {answers['llm_errors']}, 429s {report['stub_llm']['throttled']}, "
+          f"p99 answer {answers['total'].get('p99_ms', 0):.0f}ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
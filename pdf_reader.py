@@ -1,9 +1,28 @@
 # pdf_reader.py
 
-import PyPDF2
-import io
-import re
-from docx import Document
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from lazy_import import lazy_module
+from telemetry import record, span
+from text_pipeline import PageNormalizer, normalize_pages, normalize_text
+
+# Imported on first use to keep app start-up fast
+PyPDF2 = lazy_module("PyPDF2")
+
+# Number of worker processes for page-parallel PDF extraction (1 disables the pool)
+PDF_WORKERS = int(os.getenv("DOCTALK_PDF_WORKERS", str(os.cpu_count() or 1)))
+# PDFs shorter than this are extracted in-process; the pool is not worth its overhead
+MIN_PAGES_PER_WORKER = 16
+# Pages per batch when streaming a PDF into a live index
+STREAM_BATCH_PAGES = int(os.getenv("DOCTALK_STREAM_BATCH_PAGES", "8"))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
 
 class PDFProcessError(Exception):
     """Custom exception for PDF processing errors"""
@@ -11,44 +30,28 @@ class PDFProcessError(Exception):
 
 def sanitize_text(text):
     """
-    Basic PDF text sanitization:
+    Basic text sanitization for text without page structure (e.g. DOCX):
     - Remove lines that are just numbers (page numbers)
     - Remove lines like 'Page X' or 'Page X of Y'
-    - Remove repeated headers/footers (if any)
+    - Remove lines repeated too often (likely header/footer)
     - Remove blank lines and excessive whitespace
-    - Optionally join lines that are likely part of the same sentence
-    """
-    lines = text.splitlines()
-    cleaned_lines = []
-    header_footer_candidates = {}
-    for line in lines:
-        l = line.strip()
-        # Remove blank lines
-        if not l:
-            continue
-        # Remove lines that are just numbers (page numbers)
-        if re.fullmatch(r"\d+", l):
-            continue
-        # Remove lines like 'Page X' or 'Page X of Y'
-        if re.match(r"^Page \d+( of \d+)?$", l, re.IGNORECASE):
-            continue
-        # Track repeated lines (possible header/footer)
-        header_footer_candidates[l] = header_footer_candidates.get(l, 0) + 1
-        cleaned_lines.append(l)
-    # Remove lines that repeat too often (likely header/footer)
-    threshold = max(2, len(lines) // 10)  # If a line appears on >10% of pages, treat as header/footer
-    filtered_lines = [l for l in cleaned_lines if header_footer_candidates[l] <= threshold]
-    # Remove excessive whitespace and join lines
-    filtered_text = "\n".join(filtered_lines)
-    filtered_text = re.sub(r"[ \t]+", " ", filtered_text)  # Collapse spaces
-    filtered_text = re.sub(r"\n{2,}", "\n", filtered_text)  # Collapse multiple blank lines
-    return filtered_text
+    PDFs go through sanitize_pages, which finds headers/footers by their place on the page.
+    """
+    return normalize_text(text)
+
+def sanitize_pages(pages):
+    """
+    Sanitize (page_number, text) pages in one pass: like sanitize_text, and also
+    remove headers/footers that recur at the top or bottom of many pages.
+    """
+    return normalize_pages(pages).text
 
 def extract_docx_text(file):
     """
     Extract text from a .docx file.
     """
     try:
+        from docx import Document
         doc = Document(file)
         text = "\n".join([para.text for para in doc.paragraphs])
         # Sanitize text (reuse PDF sanitization)
@@ -56,7 +59,122 @@ def extract_docx_text(file):
     except Exception as e:
         raise PDFProcessError(f"Error reading DOCX: {str(e)}")
 
-def extract_text_from_file(file):
+def _get_pool(workers: int):
+    """Return the shared process pool, (re)creating it if the worker count changed."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+def _discard_pool():
+    """Drop a pool whose worker died so the next call starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+# Worker-side cache of the PDF being extracted, so consecutive page ranges of the
+# same file do not re-parse it
+_worker_pdf = None
+
+def _extract_page_range(pdf_path: str, start: int, end: int, keep: bool = True):
+    """
+    Extract pages [start, end) of a PDF file on disk.
+    Runs in a worker process, so it opens the PDF itself. The parsed PDF is
+    kept for the worker's next range unless keep is False (the file's last
+    ranges), so idle workers do not hold on to finished files.
+    Returns a list of (page_number, text) with 1-based page numbers.
+    """
+    global _worker_pdf
+    if _worker_pdf is None or _worker_pdf[0] != pdf_path:
+        _worker_pdf = None  # Release the previous file before parsing the next one
+        _worker_pdf = (pdf_path, PyPDF2.PdfReader(pdf_path))
+    pdf = _worker_pdf[1]
+    try:
+        return [(i + 1, pdf.pages[i].extract_text() or "") for i in range(start, end)]
+    finally:
+        if not keep:
+            _worker_pdf = None
+
+def _page_ranges(num_pages: int, workers: int, batch_pages: int = None):
+    """
+    Split pages into contiguous ranges: one per worker, or batch_pages pages each.
+    """
+    if batch_pages:
+        size = batch_pages
+    else:
+        num_ranges = max(1, min(workers, num_pages // MIN_PAGES_PER_WORKER))
+        size = -(-num_pages // num_ranges)  # ceil division
+    return [(start, min(start + size, num_pages)) for start in range(0, num_pages, size)]
+
+def iter_pdf_page_batches(file, workers: int = None, batch_pages: int = None):
+    """
+    Yield the pages of a PDF as batches of (page_number, text), in page order.
+    Page ranges are extracted ahead of time across a process pool, so the caller
+    can work on one batch while the next ones are being extracted.
+    """
+    workers = workers or PDF_WORKERS
+    # Check if file is empty
+    file_content = file.read()
+    if len(file_content) == 0:
+        raise PDFProcessError("The uploaded file is empty.")
+
+    # Reset file pointer and try to read as PDF
+    file.seek(0)
+    pdf = PyPDF2.PdfReader(file)
+
+    # Check if PDF has pages
+    num_pages = len(pdf.pages)
+    if num_pages == 0:
+        raise PDFProcessError("The PDF file contains no pages.")
+
+    ranges = _page_ranges(num_pages, workers, batch_pages)
+    if workers <= 1 or num_pages < MIN_PAGES_PER_WORKER or len(ranges) == 1:
+        for start, end in ranges:
+            yield [(i + 1, pdf.pages[i].extract_text() or "") for i in range(start, end)]
+        return
+
+    # Workers read the PDF from a temporary file instead of receiving a copy per task
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    futures = []
+    try:
+        tmp.write(file_content)
+        tmp.close()
+        pool = _get_pool(workers)
+        # Any worker may take the last `workers` ranges, so each of them releases the file
+        futures = [pool.submit(_extract_page_range, tmp.name, start, end, i + workers < len(ranges))
+                   for i, (start, end) in enumerate(ranges)]
+        done = 0
+        try:
+            for future in futures:  # Futures are collected in submission order, so pages stay in order
+                batch = future.result()
+                done += 1
+                yield batch
+        except BrokenProcessPool:
+            # A worker crashed (e.g. out of memory); finish in-process
+            _discard_pool()
+            for start, end in ranges[done:]:
+                yield [(i + 1, pdf.pages[i].extract_text() or "") for i in range(start, end)]
+    finally:
+        # Runs on completion, on error and when the caller stops iterating early
+        for future in futures:
+            future.cancel()
+        os.unlink(tmp.name)
+
+def extract_pages_from_pdf(file, workers: int = None):
+    """
+    Extract the text of every page of a PDF, in page order.
+    Large PDFs are split into page ranges that are extracted across a process pool.
+    Returns a list of (page_number, text) with 1-based page numbers.
+    """
+    return [page for batch in iter_pdf_page_batches(file, workers=workers) for page in batch]
+
+def extract_text_from_file(file, workers: int = None):
     """
     Extract text from a PDF or DOCX file, with error handling.
     """
@@ -65,52 +183,90 @@ def extract_text_from_file(file):
     else:
         # Default to PDF extraction
         try:
-            # Check if file is empty
-            file_content = file.read()
-            if len(file_content) == 0:
-                raise PDFProcessError("The uploaded file is empty.")
-            
-            # Reset file pointer and try to read as PDF
-            file.seek(0)
-            pdf = PyPDF2.PdfReader(file)
-            
-            # Check if PDF has pages
-            if len(pdf.pages) == 0:
-                raise PDFProcessError("The PDF file contains no pages.")
-                
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-                    
+            pages = extract_pages_from_pdf(file, workers=workers)
+
             # Check if any text was extracted
-            if not text.strip():
+            if not any(page_text.strip() for _, page_text in pages):
                 raise PDFProcessError("No readable text found in the PDF. The file might be scanned images or corrupted.")
             
             # Sanitize text before returning
-            text = sanitize_text(text)
+            text = sanitize_pages(pages)
             return text
             
-        except PyPDF2.PdfReadError as e:
+        except PyPDF2.errors.PdfReadError as e:
             raise PDFProcessError(f"Error reading PDF: The file might be corrupted or password protected. Details: {str(e)}")
         except Exception as e:
             raise PDFProcessError(f"Unexpected error processing PDF: {str(e)}")
 
-def extract_text_from_files(files):
+def extract_file_section(file, workers: int = None):
+    """
+    Extract one file's text followed by its end-of-file separator.
+    Extraction errors are recorded in the text instead of being raised,
+    so one bad file does not stop a multi-file upload.
+    """
+    # Get filename for separator (handle both UploadedFile and file-like objects)
+    filename = getattr(file, 'name', 'UnknownFile')
+    try:
+        with span("extract.file", file=filename):
+            text = extract_text_from_file(file, workers=workers)
+    except PDFProcessError as e:
+        text = f"[Error extracting {filename}: {str(e)}]"
+    return "\n\n".join([text, f"\n--- End of File: {filename} ---\n"])
+
+def iter_file_section(file, workers: int = None, batch_pages: int = STREAM_BATCH_PAGES):
+    """
+    Streaming version of extract_file_section: yield one file's sanitized pages
+    in batches of (page_number, text), followed by its end-of-file separator.
+    Text that is not on a PDF page (DOCX text, errors, the separator) has page 0.
+    Errors are yielded as text, like extract_file_section, so the caller never
+    has to undo a partially ingested file.
+    """
+    filename = getattr(file, 'name', 'UnknownFile')
+    separator = f"\n--- End of File: {filename} ---\n"
+    if filename.lower().endswith('.docx'):
+        yield [(0, extract_file_section(file, workers=workers))]
+        return
+
+    # Running headers/footers are detected across batches, not within each one
+    normalizer = PageNormalizer()
+    found_text = False
+    error = None
+    try:
+        # Extraction time per batch, excluding the time the consumer spends on it
+        start = time.perf_counter()
+        for batch in iter_pdf_page_batches(file, workers=workers, batch_pages=batch_pages):
+            found_text = found_text or any(page_text.strip() for _, page_text in batch)
+            pages = normalizer.feed(batch).pages()
+            record("extract.batch", time.perf_counter() - start, file=filename, pages=len(batch))
+            if pages:
+                yield pages
+            start = time.perf_counter()
+        if not found_text:
+            raise PDFProcessError("No readable text found in the PDF. The file might be scanned images or corrupted.")
+    except PDFProcessError as e:
+        error = f"[Error extracting {filename}: {str(e)}]"
+    except PyPDF2.errors.PdfReadError as e:
+        error = f"[Error extracting {filename}: Error reading PDF: The file might be corrupted or password protected. Details: {str(e)}]"
+    except Exception as e:
+        error = f"[Error extracting {filename}: Unexpected error processing PDF: {str(e)}]"
+    pages = normalizer.finish().pages()  # Pages still held back for header detection
+    if pages:
+        yield pages
+    if error:
+        yield [(0, error)]
+    yield [(0, "\n" + separator)]
+
+def extract_text_from_files(files, workers: int = None):
     """
     Extract and combine text from multiple PDF/DOCX files.
     Adds a separator after each file's content for clarity.
     Returns a single combined string.
+    Files are extracted concurrently; their pages share one process pool.
     """
-    combined_texts = []
-    for file in files:
-        # Get filename for separator (handle both UploadedFile and file-like objects)
-        filename = getattr(file, 'name', 'UnknownFile')
-        try:
-            text = extract_text_from_file(file)
-        except PDFProcessError as e:
-            text = f"[Error extracting {filename}: {str(e)}]"
-        combined_texts.append(text)
-        combined_texts.append(f"\n--- End of File: {filename} ---\n")
-    return "\n\n".join(combined_texts)
+    files = list(files)
+    with span("extract.files", files=len(files)):
+        if len(files) <= 1:
+            return "\n\n".join(extract_file_section(file, workers=workers) for file in files)
+        with ThreadPoolExecutor(max_workers=min(len(files), workers or PDF_WORKERS)) as executor:
+            sections = list(executor.map(lambda f: extract_file_section(f, workers=workers), files))
+        return "\n\n".join(sections)
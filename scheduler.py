@@ -0,0 +1,239 @@
+# scheduler.py
+"""
+Admission control and fair scheduling for the expensive shared resources.
+
+Each resource has a pool that runs a bounded number of tasks at once:
+    ingest   indexing jobs (extraction and embedding of uploads)
+    query    query embedding, retrieval and context packing
+    llm      requests to the LLM API (held for the whole streamed answer)
+
+Tasks that find their pool full wait in a queue per session. Sessions are
+served round-robin, so one client with many requests cannot starve the others.
+When a pool's queue is already full, new tasks are rejected right away
+(Overloaded) rather than queued behind work that would not finish in time,
+and a task that waits longer than the pool's timeout is rejected too. Callers
+show "busy, try again" (the app) or answer 503 with Retry-After (the API).
+
+Limits come from the environment, e.g. DOCTALK_LLM_CONCURRENCY,
+DOCTALK_LLM_MAX_QUEUE and DOCTALK_LLM_QUEUE_TIMEOUT_S.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from telemetry import record
+
+# Pool -> (concurrent tasks, queued tasks before shedding, seconds a task may wait)
+DEFAULT_LIMITS = {
+    "ingest": (2, 32, 600.0),
+    "query": (8, 64, 15.0),
+    "llm": (4, 32, 60.0),
+}
+# How often waiting tasks re-check their queue position (and the cancel event)
+POLL_SECONDS = 0.25
+
+
+class Overloaded(Exception):
+    """A task was rejected because its pool's queue is full or it waited too long"""
+
+    def __init__(self, pool: str, queued: int, retry_after: float):
+        super().__init__(f"The {pool} queue is full ({queued} waiting); try again in {retry_after:.0f}s")
+        self.pool = pool
+        self.queued = queued
+        self.retry_after = retry_after
+
+
+class Ticket:
+    __slots__ = ("session_id", "granted", "queued_at", "started_at")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.granted = False
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+
+
+class FairPool:
+    """
+    At most limit tasks run at once; waiting tasks are queued per session and
+    admitted round-robin across sessions. At most max_queue tasks wait; more
+    are shed.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._queues = OrderedDict()  # session id -> deque of waiting tickets, in serving order
+        self._queued = 0
+        self._running = 0
+        self._cond = threading.Condition()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "peak_queue": 0}
+        self._recent_wait = deque(maxlen=64)  # Seconds queued tasks waited, for Retry-After
+
+    # -------------------------------
+    # Admission
+    # -------------------------------
+    def _grant_waiting(self):
+        # Called with the lock held: admit waiting tickets, one session at a time
+        while self._running < self.limit and self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._queued -= 1
+            self._start(ticket)
+        self._cond.notify_all()
+
+    def _start(self, ticket: Ticket):
+        ticket.granted = True
+        ticket.started_at = time.perf_counter()
+        self._running += 1
+        self.stats["admitted"] += 1
+
+    def retry_after(self) -> float:
+        """Seconds a shed client should wait before retrying (recent queue waits, at least 1)."""
+        waits = list(self._recent_wait)
+        return max(1.0, sum(waits) / len(waits)) if waits else 1.0
+
+    def check(self):
+        """Raise Overloaded if a new task would be shed right now."""
+        with self._cond:
+            if self._running >= self.limit and self._queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise Overloaded(self.name, self._queued, self.retry_after())
+
+    def acquire(self, session_id: str, on_wait=None, cancel=None, timeout: float = None):
+        """
+        Wait for a slot. on_wait(position) is called while queued whenever the
+        1-based queue position changes, and with 0 once admitted after waiting.
+        Returns the ticket to pass to release(), or None if cancel was set while
+        waiting. Raises Overloaded if the task is shed or times out.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        ticket = Ticket(session_id)
+        with self._cond:
+            if self._running < self.limit and not self._queues:
+                self._start(ticket)
+                return ticket
+            if self._queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise Overloaded(self.name, self._queued, self.retry_after())
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._queued += 1
+            self.stats["queued"] += 1
+            self.stats["peak_queue"] = max(self.stats["peak_queue"], self._queued)
+
+        deadline = ticket.queued_at + timeout
+        reported = None
+        while True:
+            with self._cond:
+                if not ticket.granted:
+                    expired = time.perf_counter() >= deadline
+                    if expired or (cancel is not None and cancel.is_set()):
+                        self._withdraw(ticket)
+                        if expired:
+                            self.stats["timed_out"] += 1
+                            raise Overloaded(self.name, self._queued, self.retry_after())
+                        return None
+                    position = self._position(ticket)
+                    if position == reported or on_wait is None:
+                        self._cond.wait(min(POLL_SECONDS, max(0.0, deadline - time.perf_counter())))
+                        continue
+            if ticket.granted:
+                break
+            reported = position
+            on_wait(position)  # Outside the lock: the callback may render UI
+
+        waited = ticket.started_at - ticket.queued_at
+        self._recent_wait.append(waited)
+        record("queue.wait", waited, pool=self.name)
+        if on_wait is not None:
+            on_wait(0)
+        return ticket
+
+    def release(self, ticket: Ticket):
+        if ticket is None or not ticket.granted:
+            return
+        with self._cond:
+            ticket.granted = False
+            self._running -= 1
+            self._grant_waiting()
+
+    @contextmanager
+    def slot(self, session_id: str, on_wait=None, cancel=None):
+        """acquire() and release() around a block; yields the ticket (None if cancelled)."""
+        ticket = self.acquire(session_id, on_wait=on_wait, cancel=cancel)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    # -------------------------------
+    # Queue inspection
+    # -------------------------------
+    def _withdraw(self, ticket: Ticket):
+        queue = self._queues.get(ticket.session_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[ticket.session_id]
+
+    def _position(self, ticket: Ticket) -> int:
+        """
+        1-based place of a waiting ticket in admission order. Round-robin admits
+        one ticket per waiting session per round, so the r-th ticket of a session
+        (0-based) waits for the first r rounds, plus the sessions ahead of it in
+        the rotation that still have a ticket in round r.
+        """
+        own = self._queues[ticket.session_id]
+        r = own.index(ticket)
+        ahead = sum(min(len(queue), r) for queue in self._queues.values())
+        for queue in self._queues.values():
+            if queue is own:
+                break
+            ahead += len(queue) > r
+        return ahead + 1
+
+    def resize(self, limit: int = None, max_queue: int = None):
+        """Change the pool's limits at runtime; raising the limit admits waiting tasks."""
+        with self._cond:
+            if limit is not None:
+                self.limit = limit
+            if max_queue is not None:
+                self.max_queue = max_queue
+            self._grant_waiting()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return dict(self.stats, name=self.name, limit=self.limit, max_queue=self.max_queue,
+                        running=self._running, waiting=self._queued, sessions_waiting=len(self._queues))
+
+
+def _limits(name: str, default):
+    limit, max_queue, timeout = default
+    prefix = f"DOCTALK_{name.upper()}_"
+    return (
+        int(os.getenv(prefix + "CONCURRENCY", str(limit))),
+        int(os.getenv(prefix + "MAX_QUEUE", str(max_queue))),
+        float(os.getenv(prefix + "QUEUE_TIMEOUT_S", str(timeout))),
+    )
+
+
+pools = {name: FairPool(name, *_limits(name, default)) for name, default in DEFAULT_LIMITS.items()}
+
+
+def pool(name: str) -> FairPool:
+    return pools[name]
+
+
+def snapshot() -> dict:
+    """State and counters of every pool (running, waiting, admitted, rejected, ...)."""
+    return {name: p.snapshot() for name, p in pools.items()}
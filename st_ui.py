@@ -43,6 +43,35 @@ def render_about_section():
         ---
         """)
 
+def render_debug_panel():
+    """Renders stage timings (process-wide) in a sidebar expander, for diagnosing slowness."""
+    from telemetry import recent_spans, snapshot
+
+    with st.sidebar.expander("🛠️ Debug: timings", expanded=False):
+        metrics = snapshot()
+        stages = metrics["stages_seconds"]
+        if not stages:
+            st.caption("No timings recorded yet.")
+            return
+        st.markdown("**Stages** (ms, recent values)")
+        st.dataframe(
+            [
+                {"stage": name, "count": s["count"], "p50": round(s["p50"] * 1000, 1),
+                 "p95": round(s["p95"] * 1000, 1), "last": round(s["last"] * 1000, 1)}
+                for name, s in sorted(stages.items())
+            ],
+            hide_index=True,
+        )
+        for name, s in metrics["rates"].items():
+            st.caption(f"{name}: p50 {s['p50']:.1f}, last {s['last']:.1f}")
+        st.markdown("**Latest spans**")
+        st.dataframe(
+            [{"span": s["span"], "ms": s["ms"],
+              "attrs": ", ".join(f"{k}={v}" for k, v in s.items() if k not in ("span", "ms", "ts", "thread"))}
+             for s in recent_spans(20)],
+            hide_index=True,
+        )
+
 def get_base64_img(image_path):
     with open(image_path, "rb") as img_file:
         encoded = base64.b64encode(img_file.read()).decode()
@@ -79,53 +108,3 @@ def configure_page():
         layout="wide",
         initial_sidebar_state="expanded"
     )
-
-def export_chat_history_to_pdf(chat_history, file_name="chat_history.pdf"):
-    """
-    Export chat history (list of dicts with 'user' and 'bot') to a PDF and return bytes using ReportLab (full Unicode support).
-    """
-    from io import BytesIO
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.units import inch
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-    from reportlab.lib.enums import TA_LEFT
-    from reportlab.lib import colors
-    import re
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, leftMargin=0.75*inch, rightMargin=0.75*inch, topMargin=0.75*inch, bottomMargin=0.75*inch)
-    styles = getSampleStyleSheet()
-    normal = styles["Normal"]
-    normal.fontName = "Times-Roman"
-    normal.fontSize = 12
-    bold = ParagraphStyle(name="Bold", parent=normal, fontName="Times-Bold")
-    code = ParagraphStyle(name="Code", parent=normal, fontName="Courier", fontSize=10, backColor=colors.whitesmoke, leftIndent=12)
-    elements = []
-
-    elements.append(Paragraph("<b>DocTalk Chat History</b>", styles["Title"]))
-    elements.append(Spacer(1, 12))
-    for idx, turn in enumerate(chat_history, start=1):
-        elements.append(Paragraph(f"<b>Q{idx}:</b> {turn['user']}", bold))
-        answer = turn["bot"]
-        code_block_pattern = re.compile(r"```([\w\+\-]*)\n([\s\S]*?)```", re.MULTILINE)
-        pos = 0
-        for match in code_block_pattern.finditer(answer):
-            start, end = match.span()
-            if start > pos:
-                md = answer[pos:start]
-                if md.strip():
-                    elements.append(Paragraph(md.strip().replace("\n", "<br/>"), normal))
-            code_text = match.group(2)
-            code_html = f'<font face="Courier">{code_text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("\n", "<br/>")}</font>'
-            elements.append(Paragraph(code_html, code))
-            pos = end
-        if pos < len(answer):
-            md = answer[pos:]
-            if md.strip():
-                elements.append(Paragraph(md.strip().replace("\n", "<br/>"), normal))
-        elements.append(Spacer(1, 8))
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer.read()
@@ -0,0 +1,81 @@
+# startup_report.py
+"""
+Measure app start-up cost: import time per module, as reported by
+`python -X importtime`, for each of the app's own modules.
+
+Usage:
+    python startup_report.py            # table of the slowest imports
+    python startup_report.py --json     # machine-readable report
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Modules imported before the upload widget renders
+APP_MODULES = ["st_ui", "pdf_reader", "index_cache", "chatbot"]
+
+
+def measure_imports(module: str):
+    """
+    Import a module in a fresh interpreter and return (wall seconds, entries),
+    where entries are (module name, self microseconds, cumulative microseconds).
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),  # The app's modules import from any working directory
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall, entries
+
+
+def build_report(modules=APP_MODULES, top: int = 15) -> dict:
+    report = {"python": sys.version.split()[0], "modules": {}}
+    for module in modules:
+        wall, entries = measure_imports(module)
+        top_level = next((cum for name, _, cum in entries if name == module), 0)
+        slowest = sorted(entries, key=lambda e: e[2], reverse=True)[:top]
+        report["modules"][module] = {
+            "interpreter_wall_s": round(wall, 3),
+            "import_s": round(top_level / 1e6, 3),
+            "slowest": [
+                {"module": name, "self_ms": round(s / 1000, 1), "cumulative_ms": round(c / 1000, 1)}
+                for name, s, c in slowest
+            ],
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time per module at app start-up.")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("modules", nargs="*", default=APP_MODULES)
+    args = parser.parse_args()
+
+    report = build_report(args.modules, args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for module, stats in report["modules"].items():
+        print(f"\n== import {module}: {stats['import_s']:.3f}s (interpreter total {stats['interpreter_wall_s']:.3f}s)")
+        print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for entry in stats["slowest"]:
+            print(f"{entry['cumulative_ms']:>14.1f} {entry['self_ms']:>9.1f}  {entry['module']}")
+
+
+if __name__ == "__main__":
+    main()
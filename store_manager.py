@@ -0,0 +1,157 @@
+# store_manager.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from index_cache import IndexCache
+from answer_cache import QueryEmbeddingCache
+from vector_store import VectorStore, load_embedder, warm_up
+
+# Global RAM budget for all resident indexes (embedder not included)
+DEFAULT_POOL_MAX_BYTES = int(os.getenv("DOCTALK_POOL_MAX_MB", "512")) * 1024 * 1024
+# Stores that have been unloaded and untouched this long are dropped; only their cache key is kept
+DEFAULT_IDLE_FORGET_SECONDS = 60 * 60
+# Cache keys kept for dropped idle stores, so they can still be reloaded
+MAX_PARKED_SESSIONS = 4096
+
+
+class StoreEvicted(Exception):
+    """A session's unloaded index is no longer in the on-disk cache, so its documents must be indexed again"""
+
+    def __init__(self, session_id: str):
+        super().__init__("The documents of this session were evicted from the index cache; upload them again")
+        self.session_id = session_id
+
+
+class StoreManager:
+    """
+    Hands out one VectorStore per session while sharing a single embedder.
+
+    Stores are kept in least-recently-used order. When the resident size of all
+    indexes exceeds max_bytes, the least recently used ones are unloaded to the
+    on-disk index cache and transparently reloaded on their next access.
+    Loading and unloading happen under a lock per store, not the pool's lock,
+    so one session's disk I/O does not hold up the others.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", max_bytes: int = DEFAULT_POOL_MAX_BYTES,
+                 cache: IndexCache = None, idle_forget_seconds: int = DEFAULT_IDLE_FORGET_SECONDS):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.idle_forget_seconds = idle_forget_seconds
+        self.cache = cache if cache is not None else IndexCache()
+        self.query_cache = QueryEmbeddingCache()
+        self._stores = OrderedDict()  # session_id -> VectorStore, oldest first
+        self._last_used = {}  # session_id -> timestamp
+        self._store_locks = {}  # session_id -> lock held while the store is reloaded or unloaded
+        self._parked = OrderedDict()  # session_id -> cache key of a dropped idle store, oldest first
+        self._lock = threading.RLock()
+        self._warm_thread = None
+
+    @property
+    def embedder(self):
+        """The shared embedding model (loaded on first access)."""
+        return load_embedder(self.model_name)
+
+    def warm_up(self):
+        """
+        Start loading the embedder in the background (once per process), so the
+        first upload does not wait for it.
+        """
+        with self._lock:
+            if self._warm_thread is None:
+                self._warm_thread = warm_up(self.model_name)
+            return self._warm_thread
+
+    def get(self, session_id: str, replace_evicted: bool = False) -> VectorStore:
+        """
+        Return the store for a session, creating it or reloading it from disk if needed.
+        Raises StoreEvicted if the store was unloaded and its cache entry has been
+        evicted since; the session then starts over with an empty store. Callers
+        that are about to index the documents again pass replace_evicted to get
+        that empty store right away.
+        """
+        with self._lock:
+            store = self._stores.get(session_id)
+            if store is None:
+                store = VectorStore(self.model_name, cache=self.cache, query_cache=self.query_cache)
+                store.cache_key = self._parked.pop(session_id, None)  # Reloaded below
+                self._stores[session_id] = store
+                self._store_locks[session_id] = threading.Lock()
+            else:
+                self._stores.move_to_end(session_id)
+            store_lock = self._store_locks[session_id]
+            self._last_used[session_id] = time.time()
+        if not store.is_loaded() and store.cache_key is not None:
+            with store_lock:
+                evicted = not store.is_loaded() and not store.reload()
+            if evicted:
+                self._drop(session_id, store)
+                if replace_evicted:
+                    return self.get(session_id)
+                raise StoreEvicted(session_id)
+        self.enforce_budget(keep=session_id)
+        return store
+
+    def _drop(self, session_id: str, store: VectorStore):
+        # Forget the session's store unless it was already replaced
+        with self._lock:
+            if self._stores.get(session_id) is store:
+                self.release(session_id)
+
+    def release(self, session_id: str):
+        """Forget a session's store (its cache entry on disk is kept)."""
+        with self._lock:
+            self._stores.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+            self._store_locks.pop(session_id, None)
+            self._parked.pop(session_id, None)
+
+    def _park(self, session_id: str):
+        # Drop an unloaded store but remember where it is on disk
+        key = self._stores[session_id].cache_key
+        self.release(session_id)
+        if key is not None:
+            self._parked[session_id] = key
+            while len(self._parked) > MAX_PARKED_SESSIONS:
+                self._parked.popitem(last=False)
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(store.memory_bytes() for store in self._stores.values())
+
+    def memory_report(self) -> dict:
+        """Resident bytes per session, in least-recently-used order."""
+        with self._lock:
+            return {sid: store.memory_bytes() for sid, store in self._stores.items()}
+
+    def enforce_budget(self, keep: str = None):
+        """
+        Unload least recently used stores until the pool fits its RAM budget,
+        and forget stores that have been idle on disk for a long time.
+        The store named by keep is never unloaded.
+        """
+        with self._lock:
+            total = self.resident_bytes()
+            candidates = [(sid, store, self._store_locks[sid]) for sid, store in self._stores.items() if sid != keep]
+        # Unloading writes the index to disk: outside the pool's lock, one store at a time
+        for _, store, store_lock in candidates:
+            if total <= self.max_bytes:
+                break
+            with store_lock:
+                if not store.is_loaded() or store.ingesting:
+                    continue
+                size = store.memory_bytes()
+                try:
+                    store.unload()
+                except OSError:
+                    continue  # Could not persist; keep it in memory rather than lose it
+            total -= size
+
+        with self._lock:
+            cutoff = time.time() - self.idle_forget_seconds
+            for sid, store in list(self._stores.items()):
+                if sid != keep and not store.is_loaded() and not store.ingesting and self._last_used.get(sid, 0) < cutoff:
+                    self._park(sid)
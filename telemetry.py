@@ -0,0 +1,197 @@
+# telemetry.py
+"""
+Timing spans and metrics for the pipeline stages.
+
+    with span("embed", chunks=len(chunks)):
+        ...
+    record("llm.ttft", seconds)
+    observe_rate("llm.tokens_per_s", tokens / seconds)
+
+Every finished span is added to a latency histogram (per stage), kept in a
+short list of recent spans for the debug panel, and written as one JSON line to
+the "doctalk.trace" logger. Histograms are exported as Prometheus text or JSON,
+optionally from a small HTTP server (DOCTALK_METRICS_PORT).
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400, 800, 1600)
+# Recent values kept per series for percentiles in the debug panel
+RESERVOIR_SIZE = 512
+RECENT_SPANS = 200
+# "stderr" or a file path: where span log lines go (unset: the logger has no handler of its own)
+TRACE_LOG = os.getenv("DOCTALK_TRACE_LOG")
+METRICS_PORT = os.getenv("DOCTALK_METRICS_PORT")
+
+logger = logging.getLogger("doctalk.trace")
+if TRACE_LOG:
+    handler = logging.StreamHandler(sys.stderr) if TRACE_LOG == "stderr" else logging.FileHandler(TRACE_LOG)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram with one series per label value: cumulative
+    bucket counts, sum and count, plus a reservoir of recent values for percentiles.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets, label: str = "stage"):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                    "recent": deque(maxlen=RESERVOIR_SIZE),
+                }
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def summary(self) -> dict:
+        """label value -> count, sum, mean, p50, p95, p99 and last value."""
+        with self._lock:
+            items = [(key, s["count"], s["sum"], sorted(s["recent"]), s["recent"][-1])
+                     for key, s in self._series.items()]
+        out = {}
+        for key, count, total, recent, last in items:
+            def pct(q):
+                return recent[min(len(recent) - 1, int(math.ceil(q * len(recent))) - 1)]
+            out[key] = {"count": count, "sum": total, "mean": total / count,
+                        "p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "last": last}
+        return out
+
+    def prometheus(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(s["counts"]), s["sum"], s["count"]) for key, s in sorted(self._series.items())]
+        for key, counts, total, count in series:
+            label = f'{self.label}="{key}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("doctalk_stage_seconds", "Duration of pipeline stages in seconds.", TIME_BUCKETS)
+RATES = Histogram("doctalk_rate", "Throughput of pipeline stages (e.g. LLM tokens per second).",
+                  RATE_BUCKETS, label="metric")
+HISTOGRAMS = (STAGE_SECONDS, RATES)
+
+_recent = deque(maxlen=RECENT_SPANS)
+_recent_lock = threading.Lock()
+
+
+def record(name: str, seconds: float, **attrs):
+    """Record a finished stage that was timed by the caller."""
+    STAGE_SECONDS.observe(name, seconds)
+    entry = dict(attrs, span=name, ms=round(seconds * 1000.0, 3), ts=time.time(),
+                 thread=threading.current_thread().name)
+    with _recent_lock:
+        _recent.append(entry)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(entry, default=str))
+
+
+def observe_rate(name: str, value: float):
+    RATES.observe(name, value)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time the block as stage `name`. The yielded dict holds the span's
+    attributes, so the block can add some (e.g. a hit/miss flag) before it ends.
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record(name, time.perf_counter() - start, **attrs)
+
+
+def recent_spans(limit: int = 50):
+    """The most recent finished spans, newest first."""
+    with _recent_lock:
+        spans = list(_recent)
+    return spans[::-1][:limit]
+
+
+def snapshot() -> dict:
+    """All histograms as JSON-serializable summaries."""
+    return {
+        "stages_seconds": STAGE_SECONDS.summary(),
+        "rates": RATES.summary(),
+    }
+
+
+def prometheus_text() -> str:
+    return "\n".join(h.prometheus() for h in HISTOGRAMS) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = prometheus_text().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = None):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json in a background thread.
+    Started once per process; later calls return the running server.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            port = int(port if port is not None else METRICS_PORT)
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="doctalk-metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,77 @@
+# tests/conftest.py
+
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+# Modules live at the repository root; no background model warm-up in tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DOCTALK_WARMUP", "0")
+
+WORDS = (
+    "vector index chunk query answer model token document page section figure table "
+    "method result analysis system memory latency throughput cache search retrieval "
+    "network protocol server client request response error timeout retry buffer "
+    "stream parser schema field record column value key signal filter sample"
+).split()
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words embedder, so tests need no model download."""
+
+    dim = 64
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        out = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for i, text in enumerate(sentences):
+            for word in text.lower().split():
+                out[i, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        return out
+
+
+def doc_text(seed: int, chars: int = 20000) -> str:
+    """Pseudo-text that does not repeat itself, so no chunk is a duplicate of another."""
+    rng = np.random.default_rng(seed)
+    sentences, length = [], 0
+    while length < chars:
+        words = list(rng.choice(WORDS, size=int(rng.integers(6, 14))))
+        words.append(f"ID{seed}x{len(sentences)}")
+        sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def documents(*seeds, chars: int = 20000):
+    """A documents mapping for VectorStore.sync_documents, one document per seed."""
+    return {f"doc-{s}": (f"doc-{s}.pdf", lambda s=s: [doc_text(s, chars)]) for s in seeds}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    from index_cache import IndexCache
+
+    return IndexCache(str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def make_store(cache):
+    """Factory of stores sharing one on-disk cache and the hash embedder."""
+    from vector_store import VectorStore
+
+    created = []
+
+    def make():
+        store = VectorStore(cache=cache, embedder=HashEmbedder())
+        created.append(store)
+        return store
+
+    yield make
+    for store in created:
+        store.reset()
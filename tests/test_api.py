@@ -0,0 +1,98 @@
+# tests/test_api.py
+
+import os
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")  # Needed by fastapi's TestClient
+pytest.importorskip("dotenv")
+
+os.environ.setdefault("DOCTALK_WARMUP", "0")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import api  # noqa: E402
+import chatbot  # noqa: E402
+from store_manager import StoreEvicted  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    with TestClient(api.app) as client:
+        yield client
+    with api._sessions_lock:
+        sessions = list(api._sessions.values())
+        api._sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def _create(client) -> str:
+    response = client.post("/sessions")
+    assert response.status_code == 201
+    return response.json()["session_id"]
+
+
+def test_healthz_counts_sessions(client):
+    _create(client)
+    body = client.get("/healthz").json()
+    assert body["status"] == "ok"
+    assert body["sessions"] == 1
+    assert "scheduler" in body
+
+
+def test_unknown_sessions_and_bundles_are_404(client):
+    assert client.get("/sessions/nope/documents").status_code == 404
+    assert client.post("/sessions", json={"bundle": "nope"}).status_code == 404
+
+
+def test_only_pdf_and_docx_uploads_are_accepted(client):
+    sid = _create(client)
+    response = client.post(f"/sessions/{sid}/documents", files=[("files", ("notes.txt", b"x", "text/plain"))])
+    assert response.status_code == 415
+
+
+def test_uploads_over_the_size_limit_are_rejected_and_not_kept(client, monkeypatch):
+    monkeypatch.setattr(api, "MAX_UPLOAD_MB", 0)
+    sid = _create(client)
+    response = client.post(f"/sessions/{sid}/documents",
+                           files=[("files", ("big.pdf", b"%PDF" + b"x" * 1024, "application/pdf"))])
+    assert response.status_code == 413
+    session = api._sessions[sid]
+    assert session.files == {}
+    assert os.listdir(session.directory) == []
+
+
+def test_an_evicted_store_is_410(client, monkeypatch):
+    sid = _create(client)
+
+    def evicted(session_id):
+        raise StoreEvicted(session_id)
+
+    monkeypatch.setattr(chatbot.stores, "get", evicted)
+    response = client.post(f"/sessions/{sid}/retrieve", json={"query": "anything"})
+    assert response.status_code == 410
+    assert "upload them again" in response.json()["detail"]
+
+
+def test_idle_sessions_expire_with_their_uploads(client, monkeypatch):
+    sid = _create(client)
+    directory = api._sessions[sid].directory
+    monkeypatch.setattr(api, "SESSION_TTL_SECONDS", -1)
+    monkeypatch.setattr(api, "_last_sweep", float("-inf"))
+
+    assert client.get(f"/sessions/{sid}/documents").status_code == 404
+    deadline = time.monotonic() + 5
+    while os.path.exists(directory) and time.monotonic() < deadline:
+        time.sleep(0.01)  # The session is closed in the API's thread pool
+    assert not os.path.exists(directory)
+
+
+def test_deleting_a_session_removes_its_directory(client):
+    sid = _create(client)
+    directory = api._sessions[sid].directory
+    assert client.delete(f"/sessions/{sid}").status_code == 204
+    assert not os.path.exists(directory)
+    assert client.delete(f"/sessions/{sid}").status_code == 404
@@ -0,0 +1,39 @@
+# tests/test_bm25.py
+
+from bm25 import BM25Index, has_identifier, reciprocal_rank_fusion
+
+
+def test_rrf_favours_ids_ranked_well_by_both_lists():
+    dense = [1, 2, 3, 4]
+    lexical = [5, 3, 6, 1]
+    fused = reciprocal_rank_fusion([dense, lexical], [1.0, 1.0], k=60)
+    # 3 and 1 appear in both rankings and beat the single-list winners
+    assert fused[:2] == [1, 3]
+    assert set(fused) == {1, 2, 3, 4, 5, 6}
+
+
+def test_rrf_weights():
+    dense = [1, 2]
+    lexical = [3, 4]
+    assert reciprocal_rank_fusion([dense, lexical], [1.0, 2.0], k=60)[0] == 3
+    assert reciprocal_rank_fusion([dense, lexical], [2.0, 1.0], k=60)[0] == 1
+    assert reciprocal_rank_fusion([dense, lexical], [1.0, 0.0], k=60)[:2] == [1, 2]
+
+
+def test_bm25_add_remove_and_search():
+    index = BM25Index()
+    index.add(1, "the pump model XR-200 draws two amps")
+    index.add(2, "the valve model closes under pressure")
+    index.add(3, "maintenance schedule for the pump")
+    assert index.search("XR-200")[0][0] == 1
+    assert [cid for cid, _ in index.search("pump")] in ([1, 3], [3, 1])
+
+    index.remove(1, "the pump model XR-200 draws two amps")
+    assert len(index) == 2
+    assert index.search("XR-200") == []
+    assert [cid for cid, _ in index.search("pump")] == [3]
+
+
+def test_has_identifier():
+    assert has_identifier("what does XR-200 draw")
+    assert not has_identifier("what does the pump draw")
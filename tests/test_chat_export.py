@@ -0,0 +1,41 @@
+# tests/test_chat_export.py
+
+import io
+
+import chat_export
+from chat_export import export_chat_history_to_pdf, turn_flowables
+
+
+def _history(turns):
+    return [{"user": f"Question {i} about <tags> & more?", "bot": f"Answer {i}.\n\n```py\nx = {i}\n```"}
+            for i in range(turns)]
+
+
+def _pdf_text(data: bytes) -> str:
+    import PyPDF2
+
+    return "".join(page.extract_text() for page in PyPDF2.PdfReader(io.BytesIO(data)).pages)
+
+
+def test_export_contains_every_turn():
+    chat_export.clear_caches()
+    data = export_chat_history_to_pdf(_history(3))
+    assert data.startswith(b"%PDF")
+    text = _pdf_text(data)
+    for i in range(3):
+        assert f"Question {i} about <tags> & more?" in text
+        assert f"x = {i}" in text
+
+
+def test_only_new_turns_are_parsed_and_unchanged_chats_are_reused():
+    chat_export.clear_caches()
+    history = _history(4)
+    first = export_chat_history_to_pdf(history)
+    assert turn_flowables.cache_info().misses == 4
+    assert export_chat_history_to_pdf(list(history)) is first  # Same content: cached bytes
+
+    history.append({"user": "One more?", "bot": "Yes."})
+    longer = export_chat_history_to_pdf(history)
+    assert turn_flowables.cache_info().misses == 5  # Earlier turns came from the cache
+    assert "One more?" in _pdf_text(longer)
+    assert "Question 0" in _pdf_text(longer)  # Cached flowables can be laid out again
@@ -0,0 +1,83 @@
+# tests/test_chat_render.py
+
+from chat_render import Segment, StreamRenderer, parse_segments, stable_prefix
+
+
+class FakeContainer:
+    """Stands in for a Streamlit container: records what is written into it."""
+
+    def __init__(self):
+        self.items = []  # ("markdown" | "code", text), or a nested slot
+
+    def container(self):
+        return self
+
+    def empty(self):
+        slot = FakeSlot()
+        self.items.append(slot)
+        return slot
+
+    def markdown(self, text):
+        self.items.append(("markdown", text))
+
+    def code(self, text, language=None):
+        self.items.append(("code", text))
+
+    def written(self):
+        out = []
+        for item in self.items:
+            out += item.written() if isinstance(item, FakeContainer) else [item]
+        return out
+
+
+class FakeSlot(FakeContainer):
+    """st.empty(): each write replaces what the slot showed before."""
+
+    writes = 0
+
+    def container(self):
+        inner = FakeContainer()
+        self.items = [inner]
+        FakeSlot.writes += 1
+        return inner
+
+    def markdown(self, text):
+        self.items = [("markdown", text)]
+        FakeSlot.writes += 1
+
+
+def test_parse_segments():
+    text = "Intro\n\n```python\nprint(1)\n```\n\nOutro"
+    assert parse_segments(text) == (
+        Segment("Intro\n\n"),
+        Segment("print(1)\n", "python", code=True),
+        Segment("\n\nOutro"),
+    )
+    assert parse_segments("  \n") == ()
+
+
+def test_stable_prefix_stops_at_open_paragraphs_and_code_blocks():
+    assert stable_prefix("first paragraph\n\nsecond, still stream") == len("first paragraph\n\n")
+    assert stable_prefix("no break yet") == 0
+    text = "para\n\n```\ncode\n```\nafter"
+    assert stable_prefix(text) == text.index("after") - 1
+    assert stable_prefix("para\n\n```\nopen code\n\nmore") == len("para\n\n")
+
+
+def test_stream_renderer_batches_redraws_and_writes_finished_parts_once():
+    answer = "".join(f"Paragraph {i} has a few words.\n\n" for i in range(20)) + "```sh\nls\n```\nDone."
+    deltas = [answer[i:i + 5] for i in range(0, len(answer), 5)]
+    page = FakeContainer()
+    FakeSlot.writes = 0
+    renderer = StreamRenderer(page, interval_ms=1e9, max_tokens=10)
+    for delta in deltas:
+        renderer.add(delta)
+    assert renderer.finish() == answer
+
+    assert renderer.renders == len(deltas) // 10 + 1
+    written = page.written()
+    assert "".join(text for kind, text in written if kind == "markdown").replace("\n", "") == \
+        answer.replace("```sh\nls\n```", "").replace("\n", "")
+    assert ("code", "ls\n") in written
+    # Finished paragraphs are not redrawn: writes stay proportional to the redraws
+    assert FakeSlot.writes <= 3 * renderer.renders
@@ -0,0 +1,72 @@
+# tests/test_chunk_store.py
+
+import shutil
+
+import chunk_store
+from chunk_store import ChunkStore
+from conftest import documents
+
+
+def test_add_get_and_remove():
+    store = ChunkStore()
+    first = store.add("a", ["alpha", "beta", "gamma"], pages=[1, 1, 2])
+    second = store.add("b", ["délta"])
+    assert list(first) == [0, 1, 2] and list(second) == [3]
+    assert store[3] == "délta" and store.doc_of(3) == "b" and store.page_of(3) == 0
+    assert store.page_of(2) == 2
+
+    store.remove([1])
+    assert 1 not in store and len(store) == 3
+    assert store.ids() == [0, 2, 3]
+    assert store.doc_chunk_ids() == {"a": chunk_store.array("q", [0, 2]), "b": chunk_store.array("q", [3])}
+    assert store.text_bytes() == len("alpha") + len("gamma") + len("délta".encode("utf-8"))
+
+
+def test_compaction_keeps_ids(monkeypatch):
+    monkeypatch.setattr(chunk_store, "COMPACT_MIN_BYTES", 0)
+    store = ChunkStore()
+    store.add("a", [f"chunk {i}" for i in range(10)])
+    store.remove(range(0, 8))  # Most of the file is dead: compacted
+    assert store._size == store.text_bytes()
+    assert list(store.items()) == [(8, "chunk 8"), (9, "chunk 9")]
+    assert store.add("a", ["more"]) == range(10, 11)
+    assert store[10] == "more"
+
+
+def test_save_and_open(tmp_path):
+    store = ChunkStore()
+    store.add("a", ["one", "two", "three"], pages=[1, 2, 3])
+    store.remove([1])
+    store.save(str(tmp_path))
+
+    opened = ChunkStore.open(str(tmp_path))
+    assert list(opened.items()) == [(0, "one"), (2, "three")]
+    assert opened.page_of(2) == 3 and opened.next_id == 3
+    # Read-only on disk: the first write goes to a scratch copy
+    opened.add("b", ["four"])
+    assert opened[3] == "four" and opened[0] == "one"
+    assert open(tmp_path / chunk_store.CHUNK_TEXT_FILE, encoding="utf-8").read() == "onethree"
+
+
+def test_opened_store_stays_writable_after_its_files_are_deleted(tmp_path):
+    store = ChunkStore()
+    store.add("a", ["one", "two"])
+    (tmp_path / "entry").mkdir()
+    store.save(str(tmp_path / "entry"))
+    opened = ChunkStore.open(str(tmp_path / "entry"))
+    shutil.rmtree(tmp_path / "entry")
+    opened.add("b", ["three"])
+    assert [text for _, text in opened.items()] == ["one", "two", "three"]
+
+
+def test_cached_store_can_be_extended_after_its_entry_is_evicted(make_store, cache):
+    docs = documents(1, 2)
+    make_store().sync_documents(docs)
+    store = make_store()
+    assert store.sync_documents(docs)["cached"]
+    shutil.rmtree(cache._entry_dir(store.cache_key))
+
+    summary = store.sync_documents(documents(1, 2, 3))
+    assert summary["added"] == 1
+    assert store.chunk_records(store.retrieve_ids("ID3x3", k=1))[0][1] == "doc-3"
+    assert store.chunk_records(store.retrieve_ids("ID1x3", k=1))[0][1] == "doc-1"
@@ -0,0 +1,76 @@
+# tests/test_context_packer.py
+
+import numpy as np
+
+import context_packer
+from context_packer import count_tokens, merge_overlap, pack_context
+
+
+def _records(texts, doc_id="doc", first_id=0):
+    return [(first_id + i, doc_id, text, (doc_id,)) for i, text in enumerate(texts)]
+
+
+def test_context_fits_the_token_budget():
+    candidates = _records([f"chunk {i} " + "word " * 40 for i in range(0, 20, 2)])  # No neighbours
+    context, used = pack_context(candidates, budget=200)
+    assert count_tokens(context) <= 200
+    assert 0 < len(used) < len(candidates)
+    # Best candidates first; a chunk that does not fit is skipped, not cut
+    assert used == [text for _, _, text, _ in candidates[:len(used)]]
+    assert pack_context(candidates, budget=5) == ("", [])
+
+
+def test_a_shorter_chunk_still_fills_the_remaining_budget():
+    long_text = "long " * 200
+    candidates = _records(["first " * 50, long_text, "short one"], first_id=0)
+    candidates = [(cid * 2, doc, text, src) for cid, doc, text, src in candidates]
+    _, used = pack_context(candidates, budget=100)
+    assert long_text not in used and "short one" in used
+
+
+def test_exact_duplicates_are_sent_once():
+    candidates = _records(["same text", "other text"]) + _records(["same text "], doc_id="copy", first_id=10)
+    context, used = pack_context(candidates)
+    assert used == ["same text", "other text"]
+    assert context.count("same text") == 1
+
+
+def test_neighbouring_chunks_are_merged_without_their_overlap():
+    first = "alpha beta gamma delta"
+    second = "gamma delta epsilon zeta"
+    assert merge_overlap(first, second) == "alpha beta gamma delta epsilon zeta"
+    context, used = pack_context(_records([first, second]))
+    assert context == "alpha beta gamma delta epsilon zeta"
+    assert used == [first, second]
+    # Not neighbours: separate chunks
+    context, _ = pack_context([(0, "doc", first, ()), (5, "doc", second, ())])
+    assert context == first + "\n" + second
+
+
+def test_estimated_counts_keep_a_safety_margin(monkeypatch):
+    candidates = _records([f"word{i} " * 10 for i in range(0, 40, 2)])
+    context, _ = pack_context(candidates, budget=200)
+    assert count_tokens(context) <= 200 * (1 - context_packer.ESTIMATE_MARGIN)
+
+    class WordTokenizer:
+        def encode(self, text, add_special_tokens=False):
+            return text.split() or [text]
+
+    # With the model's tokenizer the counts are exact and the whole budget is used
+    monkeypatch.setattr(context_packer, "_get_tokenizer", lambda: WordTokenizer())
+    assert context_packer.usable_budget(200) == 200
+    context, used = pack_context(candidates, budget=55)
+    assert len(used) == 5 and count_tokens(context) <= 55
+
+
+def test_mmr_prefers_diverse_chunks(monkeypatch):
+    monkeypatch.setattr(context_packer, "ESTIMATE_MARGIN", 0.0)
+    candidates = _records(["a one", "a two", "b three"], first_id=0)
+    candidates = [(cid * 2, doc, text, src) for cid, doc, text, src in candidates]
+    vectors = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+    q_emb = np.array([[1.0, 1.0]], dtype=np.float32) / np.sqrt(2)
+    # Room for two chunks: the near-copy of the best one loses to the different one
+    budget = count_tokens("a one") + count_tokens("\n") + count_tokens("b three")
+    assert pack_context(candidates, budget=budget)[1] == ["a one", "a two"]
+    _, used = pack_context(candidates, q_emb=q_emb, vectors=vectors, budget=budget)
+    assert used == ["a one", "b three"]
@@ -0,0 +1,83 @@
+# tests/test_conversation.py
+
+import numpy as np
+
+import conversation
+from conversation import CARRY_OVER_CHUNKS, Conversation, ConversationCache
+from conftest import documents
+
+
+def _unit(*values):
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_query_vector_blends_previous_questions():
+    chat = Conversation("docs")
+    q = _unit(1, 0, 0).reshape(1, -1)
+    assert chat.query_vector(q) is q  # Nothing to blend yet
+
+    chat.record("about the pump", _unit(0, 1, 0), [1, 2])
+    blended = chat.query_vector(q).reshape(-1)
+    assert np.isclose(np.linalg.norm(blended), 1.0)
+    assert blended[0] > blended[1] > 0  # Leans towards the history, led by the question
+    assert chat.query_vector(q, weight=0) is q
+
+
+def test_carry_over_returns_the_previous_turns_context():
+    chat = Conversation("docs")
+    assert chat.carry_over() == []
+    chat.record("first", _unit(1, 0), [7, 8])
+    chat.record("second", _unit(0, 1), list(range(10, 20)))
+    assert chat.carry_over() == list(range(10, 10 + CARRY_OVER_CHUNKS))
+
+
+def test_cache_resets_when_the_chat_or_documents_change():
+    cache = ConversationCache()
+    chat = cache.get("s1", "docs", [])
+    chat.record("first", _unit(1, 0), [1])
+    history = [{"user": "first", "assistant": "answer"}]
+
+    # The next question arrives with the recorded turn as the last one in its history
+    assert cache.get("s1", "docs", history) is chat
+    chat.record("next", _unit(0, 1), [2])
+    history.append({"user": "next", "assistant": "answer"})
+    assert cache.get("s1", "docs", [{"user": "older"}] + history) is chat
+    assert cache.get("s2", "docs", history) is not chat  # Sessions are separate
+
+    assert cache.get("s1", "docs", history[:1]) is not chat  # A turn was dropped
+    chat = cache.get("s1", "docs", [])
+    chat.record("first", _unit(1, 0), [1])
+    assert cache.get("s1", "other docs", [{"user": "first"}]) is not chat
+    assert cache.stats()["resets"] == 2
+
+
+def test_cache_keeps_the_most_recent_conversations():
+    cache = ConversationCache(max_conversations=2)
+    first = cache.get("a", "docs", [])
+    cache.get("b", "docs", [])
+    cache.get("a", "docs", [])
+    cache.get("c", "docs", [])
+    assert cache.get("a", "docs", []) is first
+    assert cache.stats()["conversations"] == 2
+
+
+def test_fetch_reuses_the_working_set(make_store, monkeypatch):
+    store = make_store()
+    store.sync_documents(documents(1))
+    ids = list(store.doc_chunks["doc-1"])[3:6]
+    chat = Conversation(store.doc_set_key())
+
+    records, vectors = chat.fetch(store, ids)
+    assert records == store.chunk_records(ids)
+    assert np.allclose(vectors, store.chunk_vectors(ids))
+    assert (chat.fetched, chat.reused) == (3, 0)
+
+    more = ids[:2] + [cid for cid in store.doc_chunks["doc-1"] if cid not in ids][:2]
+    records, _ = chat.fetch(store, more)
+    assert [r[0] for r in records] == more
+    assert (chat.fetched, chat.reused) == (5, 2)
+
+    monkeypatch.setattr(conversation, "WORKING_SET_CHUNKS", 2)
+    chat.fetch(store, more[-2:])
+    assert list(chat._chunks) == more[-2:]
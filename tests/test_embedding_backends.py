@@ -0,0 +1,46 @@
+# tests/test_embedding_backends.py
+
+import time
+
+import numpy as np
+
+import embedding_backends
+from embedding_backends import BucketedEncoder
+
+
+class _OverheadModel:
+    """Costs a fixed delay per call, so larger batches have the best throughput."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, show_progress_bar=False):
+        self.batch_sizes.append(len(texts))
+        time.sleep(0.005)
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_encode_keeps_input_order():
+    encoder = BucketedEncoder(_OverheadModel(), "fake", threads=2)
+    texts = ["x" * n for n in (900, 10, 300, 50, 10)]
+    assert encoder.encode(texts)[:, 0].tolist() == [900, 10, 300, 50, 10]
+    assert encoder.encode("abc")[0] == 3
+
+
+def test_batch_size_is_tuned_per_length_bucket(monkeypatch):
+    monkeypatch.setattr(embedding_backends, "AUTOTUNE", True)
+    model = _OverheadModel()
+    encoder = BucketedEncoder(model, "fake", threads=2)
+    texts = ["word " * 80] * 2000  # ~100 tokens each: the third bucket
+    encoder.encode(texts)
+
+    tuning = encoder.tuning()["128"]
+    assert tuning["tokens_per_batch"] == embedding_backends.TOKENS_PER_BATCH * 2
+    assert tuning["threads"] == 2
+    model.batch_sizes.clear()
+    encoder.encode(texts[:256])
+    assert model.batch_sizes == [128, 128]
+    assert encoder.tuning()["32"]["tokens_per_batch"] is None  # Nothing measured for short texts
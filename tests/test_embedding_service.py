@@ -0,0 +1,71 @@
+# tests/test_embedding_service.py
+
+import threading
+
+import numpy as np
+import pytest
+
+import embedding_service
+from conftest import HashEmbedder
+from embedding_service import BULK, QUERY, EmbeddingService
+
+
+class GatedEmbedder(HashEmbedder):
+    """Records each forward pass; the first one waits until the test opens the gate."""
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def encode(self, sentences, **kwargs):
+        self.calls.append(list(sentences))
+        self.started.set()
+        assert self.gate.wait(10)
+        return super().encode(sentences, **kwargs)
+
+
+def test_concurrent_requests_share_a_batch_and_get_their_own_rows():
+    embedder = GatedEmbedder()
+    service = EmbeddingService(lambda: embedder, name="test")
+    first = service.submit(["warm up"], lane=QUERY)
+    assert embedder.started.wait(5)  # The worker is busy: the next requests queue up
+    futures = [service.submit([f"query {i}", f"other {i}"], lane=QUERY) for i in range(5)]
+    embedder.gate.set()
+
+    first.result(5)
+    expected = HashEmbedder().encode([f"query {i}" for i in range(5)])
+    for i, future in enumerate(futures):
+        rows = future.result(5)
+        assert rows.shape == (2, HashEmbedder.dim)
+        assert np.array_equal(rows[0], expected[i])
+    assert len(embedder.calls) == 2  # The five queued requests went through in one pass
+    assert service.stats[QUERY] == {"batches": 2, "texts": 11}
+
+
+def test_queries_overtake_a_running_bulk_encode(monkeypatch):
+    monkeypatch.setattr(embedding_service, "BULK_SLICE", 4)
+    embedder = GatedEmbedder()
+    service = EmbeddingService(lambda: embedder, name="test")
+    bulk = service.submit([f"chunk {i}" for i in range(12)], lane=BULK)
+    assert embedder.started.wait(5)
+    query = service.submit(["the question"], lane=QUERY)
+    embedder.gate.set()
+
+    assert query.result(5).shape == (1, HashEmbedder.dim)
+    assert bulk.result(5).shape == (12, HashEmbedder.dim)
+    # The query waited for one bulk slice, not for the whole document
+    assert embedder.calls[1] == ["the question"]
+    assert [len(call) for call in embedder.calls] == [4, 1, 4, 4]
+
+
+def test_encoder_errors_reach_the_caller():
+    class Broken:
+        def encode(self, sentences, **kwargs):
+            raise RuntimeError("model failed")
+
+    service = EmbeddingService(lambda: Broken(), name="test")
+    with pytest.raises(RuntimeError, match="model failed"):
+        service.encode(["text"])
+    assert service.queue_depth() == {QUERY: 0, BULK: 0}
+    assert service.encode([]).shape == (0, 0)
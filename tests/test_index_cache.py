@@ -0,0 +1,61 @@
+# tests/test_index_cache.py
+
+import numpy as np
+
+from chunk_store import ChunkStore
+from index_cache import IndexCache, make_cache_key
+from lazy_import import lazy_module
+
+faiss = lazy_module("faiss")
+
+
+def _entry(texts, dim=8):
+    chunks = ChunkStore()
+    ids = chunks.add("doc", texts, pages=list(range(1, len(texts) + 1)))
+    embeddings = np.random.default_rng(len(texts)).random((len(texts), dim), dtype=np.float32)
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    return chunks, embeddings, index
+
+
+def test_cache_key_ignores_file_order_but_not_settings():
+    key = make_cache_key(["a", "b"], "model", 500, 50)
+    assert key == make_cache_key(["b", "a"], "model", 500, 50)
+    assert key != make_cache_key(["a", "b"], "model", 400, 50)
+    assert key != make_cache_key(["a", "b"], "other", 500, 50)
+    assert key != make_cache_key(["a"], "model", 500, 50)
+
+
+def test_put_get_round_trip(cache):
+    texts = [f"chunk number {i}" for i in range(5)]
+    chunks, embeddings, index = _entry(texts)
+    cache.put("key", chunks, embeddings, index, meta={"index_spec": "Flat"})
+
+    loaded_chunks, loaded_embeddings, loaded_index, meta = cache.get("key")
+    assert [text for _, text in loaded_chunks.items()] == texts
+    assert [loaded_chunks.page_of(cid) for cid in loaded_chunks.ids()] == [1, 2, 3, 4, 5]
+    assert np.array_equal(loaded_embeddings, embeddings)
+    assert loaded_index.ntotal == 5
+    assert meta["index_spec"] == "Flat" and "created" in meta
+    assert cache.get("missing") is None
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    entry = _entry([f"chunk {i} " * 20 for i in range(20)])
+    cache.put("first", *entry)
+    cache.put("second", *entry)
+    # Room for two entries: a third one evicts the least recently used
+    cache.max_bytes = int(cache.size() * 1.25)
+    cache.get("first")  # Now more recent than "second"
+    cache.put("third", *entry)
+    assert cache.contains("first") and cache.contains("third")
+    assert not cache.contains("second")
+
+
+def test_evict_keeps_the_named_entry(tmp_path):
+    entry = _entry(["some chunk text"] * 3)
+    cache = IndexCache(str(tmp_path / "cache"), max_bytes=0)
+    cache.put("only", *entry)  # Over budget on its own, but just stored
+    assert cache.contains("only")
+    cache.evict()
+    assert not cache.contains("only")
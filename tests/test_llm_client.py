@@ -0,0 +1,190 @@
+# tests/test_llm_client.py
+
+import threading
+import time
+
+import pytest
+import requests
+
+import llm_client
+from benchmark import _StubLLMHandler, start_stub_llm
+from llm_client import HTTPLLMClient, LLMClient, LLMError, parse_delta
+
+BODY = {"model": "stub", "messages": [{"role": "user", "content": "hi"}]}
+
+
+class _FlakyLLMHandler(_StubLLMHandler):
+    """The stub LLM, answering the first `failures` requests with `status`."""
+
+    failures = 0
+    status = 503
+    lock = None
+    counters = None
+
+    def do_POST(self):
+        with self.lock:
+            self.counters["requests"] += 1
+            fail = self.counters["requests"] <= self.failures
+        if fail:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(self.status)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        super().do_POST()
+
+
+@pytest.fixture
+def flaky_llm(monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_FACTOR", 0.0)
+    servers = []
+
+    def start(failures, status, **kwargs):
+        counters = {"requests": 0}
+        server, url = start_stub_llm(base=_FlakyLLMHandler, failures=failures, status=status,
+                                     lock=threading.Lock(), counters=counters, **kwargs)
+        servers.append(server)
+        return url, counters
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_llm_client_is_abstract():
+    with pytest.raises(TypeError):
+        LLMClient()
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_rate_limits_and_server_errors(flaky_llm, status):
+    url, counters = flaky_llm(failures=2, status=status)
+    client = HTTPLLMClient("test", api_url=url, max_retries=3)
+    try:
+        answer = client.complete(BODY)
+        assert answer["choices"][0]["message"]["content"].startswith("token0")
+        assert counters["requests"] == 3
+        deltas = [parse_delta(p) for p in client.stream(BODY)]
+        assert deltas[0] == "token0 "
+    finally:
+        client.close()
+
+
+def test_gives_up_after_max_retries(flaky_llm):
+    url, counters = flaky_llm(failures=10, status=429)
+    client = HTTPLLMClient("test", api_url=url, max_retries=2)
+    try:
+        with pytest.raises(LLMError) as error:
+            client.complete(BODY)
+        assert error.value.status_code == 429
+        assert counters["requests"] == 3
+    finally:
+        client.close()
+
+
+def test_client_errors_are_not_retried(flaky_llm):
+    url, counters = flaky_llm(failures=1, status=400)
+    client = HTTPLLMClient("test", api_url=url, max_retries=3)
+    try:
+        with pytest.raises(LLMError) as error:
+            client.stream(BODY)
+        assert error.value.status_code == 400
+        assert counters["requests"] == 1
+    finally:
+        client.close()
+
+
+def test_read_timeout(flaky_llm):
+    url, _ = flaky_llm(failures=0, status=200, first_token_delay_ms=2000)
+    client = HTTPLLMClient("test", api_url=url, read_timeout=0.2, max_retries=0)
+    start = time.perf_counter()
+    try:
+        with pytest.raises(requests.exceptions.Timeout):
+            client.complete(BODY)
+        assert time.perf_counter() - start < 1.5
+    finally:
+        client.close()
+
+
+def test_abandoned_stream_is_closed():
+    server, url = start_stub_llm(token_delay_ms=20)
+    client = HTTPLLMClient("test", api_url=url, max_retries=0)
+    try:
+        stream = client.stream(BODY)
+        payloads = iter(stream)
+        assert parse_delta(next(payloads)) == "token0 "
+        payloads.close()  # The consumer stops reading, e.g. the user left the page
+        assert stream.closed
+        assert stream._response.raw.closed
+
+        with client.stream(BODY) as cancelled:
+            next(iter(cancelled))
+        assert cancelled.closed
+        assert client.complete(BODY)["choices"]  # The pool still serves requests
+    finally:
+        client.close()
+        server.shutdown()
+
+
+def test_async_client_completes_and_streams():
+    import asyncio
+
+    from llm_client import AsyncLLMClient
+
+    server, url = start_stub_llm()
+    client = AsyncLLMClient(HTTPLLMClient("test", api_url=url, max_retries=0))
+
+    async def run():
+        answer = await client.complete(BODY)
+        deltas = [parse_delta(p) async for p in client.stream(BODY)]
+        await client.close()
+        return answer, deltas
+
+    try:
+        answer, deltas = asyncio.run(run())
+        assert answer["choices"][0]["message"]["content"] == "".join(deltas)
+        assert deltas[0] == "token0 "
+    finally:
+        server.shutdown()
+
+
+def test_cancelling_an_async_stream_closes_the_response():
+    import asyncio
+
+    from llm_client import AsyncLLMClient
+
+    class Recording(HTTPLLMClient):
+        streams = []
+
+        def stream(self, body):
+            stream = super().stream(body)
+            self.streams.append(stream)
+            return stream
+
+    server, url = start_stub_llm(token_delay_ms=50)
+    client = AsyncLLMClient(Recording("test", api_url=url, max_retries=0))
+
+    async def run():
+        first = asyncio.Event()
+
+        async def consume():
+            async for _ in client.stream(BODY):
+                first.set()
+
+        task = asyncio.create_task(consume())
+        await asyncio.wait_for(first.wait(), 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    try:
+        asyncio.run(run())
+        stream = Recording.streams[0]
+        deadline = time.perf_counter() + 5
+        while not stream._response.raw.closed and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        assert stream.closed and stream._response.raw.closed
+    finally:
+        client.client.close()
+        server.shutdown()
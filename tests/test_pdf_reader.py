@@ -0,0 +1,95 @@
+# tests/test_pdf_reader.py
+
+import os
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import pdf_reader
+from conftest import doc_text
+from pdf_reader import extract_pages_from_pdf, extract_text_from_files, iter_pdf_page_batches
+
+PAGES = 40
+
+
+@pytest.fixture(scope="module")
+def pdf_path(tmp_path_factory):
+    from benchmark import write_pdf
+
+    path = tmp_path_factory.mktemp("pdf") / "long.pdf"
+    write_pdf([doc_text(n, chars=400) for n in range(PAGES)], str(path))
+    return path
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    """Temporary files (the workers' copy of the PDF) go to an empty directory."""
+    directory = tmp_path / "scratch"
+    directory.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(directory))
+    yield directory
+    pdf_reader._discard_pool()
+
+
+def test_page_ranges():
+    assert pdf_reader._page_ranges(40, 2) == [(0, 20), (20, 40)]
+    assert pdf_reader._page_ranges(40, 8) == [(0, 20), (20, 40)]  # At least MIN_PAGES_PER_WORKER each
+    assert pdf_reader._page_ranges(10, 4, batch_pages=4) == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_pool_extraction_matches_in_process_extraction(pdf_path, scratch):
+    with open(pdf_path, "rb") as f:
+        serial = extract_pages_from_pdf(f, workers=1)
+    with open(pdf_path, "rb") as f:
+        pooled = extract_pages_from_pdf(f, workers=2)
+    assert [n for n, _ in pooled] == list(range(1, PAGES + 1))
+    assert pooled == serial
+    assert pdf_reader._pool is not None  # Kept for the next file
+    assert not os.listdir(scratch)  # The workers' copy is removed
+
+
+def test_stopping_early_removes_the_workers_copy(pdf_path, scratch):
+    with open(pdf_path, "rb") as f:
+        batches = iter_pdf_page_batches(f, workers=2, batch_pages=4)
+        assert [n for n, _ in next(batches)] == [1, 2, 3, 4]
+        assert os.listdir(scratch)
+        batches.close()
+    assert not os.listdir(scratch)
+
+
+def test_a_crashed_worker_falls_back_to_in_process_extraction(pdf_path, scratch, monkeypatch):
+    class CrashedPool:
+        def submit(self, *args):
+            future = Future()
+            future.set_exception(BrokenProcessPool("worker died"))
+            return future
+
+        def shutdown(self, wait=True):
+            pass
+
+    monkeypatch.setattr(pdf_reader, "_pool", CrashedPool())
+    monkeypatch.setattr(pdf_reader, "_pool_workers", 2)
+    with open(pdf_path, "rb") as f:
+        pages = extract_pages_from_pdf(f, workers=2)
+    assert [n for n, _ in pages] == list(range(1, PAGES + 1))
+    assert pdf_reader._pool is None  # A fresh pool is started next time
+
+
+def test_files_are_extracted_concurrently_in_order(pdf_path, tmp_path, scratch):
+    empty = tmp_path / "empty.pdf"
+    empty.write_bytes(b"")
+    with open(pdf_path, "rb") as long_pdf, open(empty, "rb") as empty_pdf:
+        text = extract_text_from_files([long_pdf, empty_pdf], workers=2)
+    first_end = text.index("End of File: " + str(pdf_path))
+    assert text.index("id0x0") < first_end < text.index("The uploaded file is empty")
+
+
+def test_unreadable_pdfs_are_reported_in_the_text(tmp_path):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"this is not a PDF")
+    with open(broken, "rb") as f:
+        text = extract_text_from_files([f])
+    assert "Error reading PDF: The file might be corrupted" in text
+    assert text.rstrip().endswith("broken.pdf ---")
@@ -0,0 +1,108 @@
+# tests/test_scheduler.py
+
+import threading
+import time
+
+import pytest
+
+from scheduler import FairPool, Overloaded
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline
+        time.sleep(0.005)
+
+
+def test_sessions_are_admitted_round_robin():
+    pool = FairPool("test", limit=1, max_queue=10, timeout=10)
+    held = pool.acquire("holder")
+    admitted = []
+    threads = []
+
+    def task(session_id, n):
+        ticket = pool.acquire(session_id)
+        admitted.append(f"{session_id}{n}")
+        pool.release(ticket)
+
+    # Session a queues three tasks before b and c queue one each
+    for session_id, n in [("a", 0), ("a", 1), ("a", 2), ("b", 0), ("c", 0)]:
+        thread = threading.Thread(target=task, args=(session_id, n))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda: pool.snapshot()["waiting"] == len(threads))
+
+    positions = {
+        ticket.session_id + str(r): pool._position(ticket)
+        for queue in pool._queues.values() for r, ticket in enumerate(queue)
+    }
+    assert positions == {"a0": 1, "b0": 2, "c0": 3, "a1": 4, "a2": 5}
+
+    pool.release(held)
+    for thread in threads:
+        thread.join(5)
+    assert admitted == ["a0", "b0", "c0", "a1", "a2"]
+    assert pool.snapshot()["running"] == 0
+
+
+def test_tasks_are_shed_when_the_queue_is_full():
+    pool = FairPool("test", limit=1, max_queue=1, timeout=10)
+    held = pool.acquire("a")
+    cancel = threading.Event()
+    waiter = threading.Thread(target=pool.acquire, args=("b",), kwargs={"cancel": cancel})
+    waiter.start()
+    _wait_for(lambda: pool.snapshot()["waiting"] == 1)
+
+    with pytest.raises(Overloaded) as shed:
+        pool.acquire("c")
+    assert shed.value.retry_after >= 1
+    with pytest.raises(Overloaded):
+        pool.check()
+    assert pool.snapshot()["rejected"] == 2
+
+    cancel.set()
+    waiter.join(5)
+    assert pool.snapshot()["waiting"] == 0
+    pool.check()  # Room in the queue again
+    pool.release(held)
+
+
+def test_waiting_too_long_is_rejected():
+    pool = FairPool("test", limit=1, max_queue=4, timeout=10)
+    held = pool.acquire("a")
+    with pytest.raises(Overloaded):
+        pool.acquire("b", timeout=0.05)
+    snapshot = pool.snapshot()
+    assert snapshot["timed_out"] == 1 and snapshot["waiting"] == 0
+    pool.release(held)
+
+
+def test_cancelled_waiter_returns_none_and_reports_positions():
+    pool = FairPool("test", limit=1, max_queue=4, timeout=10)
+    held = pool.acquire("a")
+    cancel = threading.Event()
+    positions = []
+
+    def on_wait(position):
+        positions.append(position)
+        cancel.set()
+
+    assert pool.acquire("b", on_wait=on_wait, cancel=cancel) is None
+    assert positions == [1]
+    pool.release(held)
+
+
+def test_raising_the_limit_admits_waiting_tasks():
+    pool = FairPool("test", limit=1, max_queue=4, timeout=10)
+    held = pool.acquire("a")
+    tickets = []
+    waiter = threading.Thread(target=lambda: tickets.append(pool.acquire("b")))
+    waiter.start()
+    _wait_for(lambda: pool.snapshot()["waiting"] == 1)
+    pool.resize(limit=2)
+    waiter.join(5)
+    assert tickets and tickets[0].granted
+    assert pool.snapshot()["running"] == 2
+    pool.release(tickets[0])
+    pool.release(held)
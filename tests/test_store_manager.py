@@ -0,0 +1,84 @@
+# tests/test_store_manager.py
+
+import shutil
+import threading
+import time
+
+import pytest
+
+import store_manager
+import vector_store
+from conftest import HashEmbedder, documents
+from store_manager import StoreEvicted, StoreManager
+
+
+@pytest.fixture
+def manager(cache, monkeypatch):
+    embedder = HashEmbedder()
+    monkeypatch.setattr(store_manager, "VectorStore",
+                        lambda *args, **kwargs: vector_store.VectorStore(*args, embedder=embedder, **kwargs))
+    manager = StoreManager(cache=cache, max_bytes=0)  # Every store but the one in use is unloaded
+    yield manager
+    for sid in list(manager._stores):
+        manager.release(sid)
+
+
+def test_unloaded_store_is_reloaded_on_access(manager):
+    manager.get("a").sync_documents(documents(1))
+    manager.get("b")
+    assert not manager._stores["a"].is_loaded()
+
+    store = manager.get("a")
+    assert store.is_loaded() and store.retrieve_ids("ID1x3", k=1)
+
+
+def test_evicted_cache_entry_is_reported(manager, cache):
+    manager.get("a").sync_documents(documents(1))
+    manager.get("b")
+    shutil.rmtree(cache._entry_dir(manager._stores["a"].cache_key))
+
+    with pytest.raises(StoreEvicted):
+        manager.get("a")
+    # The session starts over with an empty store, ready to index again
+    assert manager.get("a").num_chunks() == 0
+
+    manager.get("c").sync_documents(documents(2))
+    manager.get("d")
+    shutil.rmtree(cache._entry_dir(manager._stores["c"].cache_key))
+    assert manager.get("c", replace_evicted=True).num_chunks() == 0
+
+
+def test_idle_store_is_dropped_but_reloadable(manager):
+    manager.idle_forget_seconds = 0
+    manager.get("a").sync_documents(documents(1))
+    time.sleep(0.01)
+    manager.get("b")
+    assert "a" not in manager._stores
+
+    assert manager.get("a").retrieve_ids("ID1x3", k=1)
+
+
+def test_reload_does_not_block_other_sessions(manager, monkeypatch):
+    manager.get("a").sync_documents(documents(1))
+    manager.get("b")
+    slow = manager._stores["a"]
+    started, finish = threading.Event(), threading.Event()
+    reload = slow.reload
+
+    def slow_reload():
+        started.set()
+        finish.wait(5)
+        return reload()
+
+    monkeypatch.setattr(slow, "reload", slow_reload)
+    loader = threading.Thread(target=manager.get, args=("a",))
+    loader.start()
+    try:
+        assert started.wait(5)
+        begin = time.perf_counter()
+        manager.get("c")
+        assert time.perf_counter() - begin < 1
+    finally:
+        finish.set()
+        loader.join()
+    assert slow.is_loaded()
@@ -0,0 +1,57 @@
+# tests/test_text_pipeline.py
+
+from conftest import doc_text
+
+
+def _pages(count):
+    return [(n, f"ACME Annual Report\n{doc_text(n, chars=600)}\nConfidential - page {n}") for n in range(1, count + 1)]
+
+
+def test_running_heads_are_found_across_small_batches():
+    from text_pipeline import PageNormalizer, normalize_pages
+
+    pages = _pages(12)
+    normalizer = PageNormalizer(sample_pages=8)
+    streamed = []
+    for i in range(0, len(pages), 2):  # Two pages per batch: too few to spot a running head alone
+        streamed += normalizer.feed(pages[i:i + 2]).pages()
+    streamed += normalizer.finish().pages()
+
+    assert streamed == normalize_pages(pages).pages()
+    assert [n for n, _ in streamed] == list(range(1, 13))
+    assert not any("ACME" in text or "Confidential" in text for _, text in streamed)
+
+
+def test_iter_file_section_strips_headers_of_short_batches(tmp_path):
+    from benchmark import write_pdf
+    from pdf_reader import iter_file_section
+
+    path = tmp_path / "report.pdf"
+    write_pdf([text for _, text in _pages(6)], str(path))
+    with open(path, "rb") as f:
+        batches = list(iter_file_section(f, workers=1, batch_pages=2))
+
+    pages = [page for batch in batches for page in batch if page[0]]
+    assert [n for n, _ in pages] == list(range(1, 7))
+    assert not any("ACME" in text for _, text in pages)
+    assert batches[-1][0][1].strip().endswith("report.pdf ---")
+
+
+def test_docx_text_loses_repeated_headers(tmp_path):
+    docx = __import__("pytest").importorskip("docx")
+    from pdf_reader import extract_docx_text, iter_file_section
+
+    document = docx.Document()
+    for n in range(1, 7):
+        document.add_paragraph("ACME Annual Report")
+        document.add_paragraph(doc_text(n, chars=300))
+        document.add_paragraph(f"Page {n}")
+    path = tmp_path / "report.docx"
+    document.save(str(path))
+
+    text = extract_docx_text(str(path))
+    assert "ACME" not in text and "Page" not in text
+    assert doc_text(3, chars=300) in text
+    with open(path, "rb") as f:
+        [(page, section)], = list(iter_file_section(f))
+    assert page == 0 and "ACME" not in section and section.rstrip().endswith("report.docx ---")
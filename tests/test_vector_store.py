@@ -0,0 +1,209 @@
+# tests/test_vector_store.py
+
+import index_builder
+from conftest import documents
+
+
+def test_ivf_index_add_and_remove_after_cache_load(make_store, monkeypatch):
+    # IVF from a few hundred chunks on; a cache load used to memory-map its
+    # inverted lists, which could then be neither copied nor edited
+    monkeypatch.setattr(index_builder, "HNSW_MIN_VECTORS", 50)
+    monkeypatch.setattr(index_builder, "IVF_MIN_VECTORS", 100)
+    docs = documents(1, 2, 3, chars=40000)
+
+    built = make_store()
+    built.sync_documents(docs)
+    assert built.index_spec.startswith("IVF")
+
+    store = make_store()
+    assert store.sync_documents(docs)["cached"]
+    assert store.index_spec.startswith("IVF")
+    removed = store.remove_document("doc-2")
+    assert removed > 0
+    assert store.index.ntotal == store.num_vectors()
+
+    summary = store.sync_documents({k: v for k, v in dict(docs, **documents(4, chars=40000)).items() if k != "doc-2"})
+    assert summary["added"] == 1 and not summary["cached"]
+    assert store.index.ntotal == store.num_vectors()
+    hit = store.retrieve_ids("ID4x3", k=3)
+    assert hit and store.chunk_records(hit[:1])[0][1] == "doc-4"
+
+
+def test_cache_load_rebuilds_index_for_current_settings(make_store, cache, monkeypatch):
+    docs = documents(1, 2)
+    make_store().sync_documents(docs)
+    key = make_store()._cache_key(docs)
+    assert cache.get(key)[3]["index_spec"] == "Flat"
+
+    # The same documents under settings that now call for HNSW
+    monkeypatch.setattr(index_builder, "HNSW_MIN_VECTORS", 10)
+    store = make_store()
+    assert store.sync_documents(docs)["cached"]
+    assert store.index_spec.startswith("HNSW")
+    assert cache.get(key)[3]["index_spec"] == store.index_spec  # The entry was replaced
+    assert store.retrieve_ids("ID2x5", k=1)
+
+
+def test_page_batches_chunk_like_the_whole_document(make_store):
+    from conftest import doc_text
+
+    text = doc_text(5)
+    pages = [(n + 1, text[i:i + 1500].strip()) for n, i in enumerate(range(0, len(text), 1500))]
+    whole = make_store()
+    whole.add_document("doc", "\n".join(t for _, t in pages))
+    batched = make_store()
+    batched.add_document_batches("doc", [pages[i:i + 3] for i in range(0, len(pages), 3)])
+
+    def texts(store):
+        return [r[2] for r in store.chunk_records(list(store.doc_chunks["doc"]))]
+
+    assert texts(batched) == texts(whole)
+
+
+def test_chunks_record_their_page_through_the_cache(make_store):
+    from conftest import doc_text
+
+    pages = [(n, doc_text(10 + n, chars=1500)) for n in range(1, 13)]
+    docs = {"paged": ("paged.pdf", lambda: [pages[i:i + 4] for i in range(0, len(pages), 4)] + [[(0, "End")]])}
+    make_store().sync_documents(docs)
+
+    store = make_store()
+    assert store.sync_documents(docs)["cached"]
+    for n in (1, 6, 12):
+        hit = store.retrieve_ids(f"ID{10 + n}x8", k=1)
+        assert store.page_of(hit[0]) == n
+
+
+def test_records_of_a_duplicated_chunk_list_every_source(make_store):
+    from conftest import doc_text
+
+    store = make_store()
+    text = doc_text(7)
+    store.sync_documents({"doc-a": ("a.pdf", lambda: [text]), "doc-b": ("b.docx", lambda: [text])})
+    report = store.dedup_report()
+    assert report["duplicates"] == report["stored_chunks"] - report["vectors"] > 0
+
+    hit = store.retrieve_ids("ID7x3", k=1)
+    (cid, doc_id, _, sources), = store.chunk_records(hit)
+    assert doc_id == "doc-a" and sources == ("doc-a", "doc-b")
+    assert list(sources) == store.sources(cid)
+
+
+def test_sync_adds_new_and_drops_removed_documents(make_store):
+    store = make_store()
+    store.sync_documents(documents(1, 2))
+    kept = list(store.doc_chunks["doc-2"])
+    loaded = []
+
+    def track(seed):
+        name, load = documents(seed)[f"doc-{seed}"]
+        return name, lambda: loaded.append(seed) or load()
+
+    summary = store.sync_documents({"doc-2": track(2), "doc-3": track(3)})
+    assert (summary["added"], summary["removed"], summary["cached"]) == (1, 1, False)
+    assert loaded == [3]  # doc-2 is not read or embedded again
+    assert list(store.doc_chunks["doc-2"]) == kept
+    assert set(store.documents()) == {"doc-2", "doc-3"}
+    assert store.index.ntotal == store.num_vectors()
+    hits = store.chunk_records(store.retrieve_ids("ID1x3", k=5))
+    assert all(doc_id != "doc-1" for _, doc_id, _, _ in hits)
+    assert store.chunk_records(store.retrieve_ids("ID3x3", k=1))[0][1] == "doc-3"
+
+
+def test_query_while_ingesting(make_store):
+    import threading
+
+    from conftest import doc_text
+
+    text = doc_text(7)
+    half = len(text) // 2
+    first_slice = threading.Event()
+    resume = threading.Event()
+
+    def batches():
+        yield text[:half]
+        assert resume.wait(10)
+        yield text[half:]
+
+    store = make_store()
+    job = threading.Thread(
+        target=store.sync_documents,
+        args=({"doc-7": ("doc-7.pdf", batches)},),
+        kwargs={"on_progress": lambda *args: first_slice.set()},
+    )
+    job.start()
+    try:
+        assert first_slice.wait(10)
+        assert store.ingesting
+        # The first half is searchable before the second one is read
+        hit = store.chunk_records(store.retrieve_ids("ID7x3", k=1))
+        assert hit and "id7x3." in hit[0][2]
+        assert not store.retrieve_ids("ID7x999", k=1, dense_weight=0)
+    finally:
+        resume.set()
+        job.join(10)
+    assert not store.ingesting
+    hit = store.chunk_records(store.retrieve_ids("ID7x150", k=1))
+    assert hit and "id7x150." in hit[0][2]
+
+
+def test_near_duplicates_stay_searchable_by_their_own_text(make_store):
+    from conftest import doc_text
+
+    text = doc_text(7)
+    revised = text.replace("id7x3.", "rev9x3.")
+    docs = {"doc-a": ("a.pdf", lambda: [text]), "doc-b": ("b.pdf", lambda: [revised])}
+    store = make_store()
+    store.sync_documents(docs)
+    assert store.dedup_stats["near"] >= 1 and store.near_dups
+
+    def lookup(s, token):
+        return [(doc_id, token in chunk) for _, doc_id, chunk, _ in s.chunk_records(s.retrieve_ids(token, k=1))]
+
+    assert lookup(store, "rev9x3") == [("doc-b", True)]
+    assert lookup(store, "id7x3") == [("doc-a", True)]
+    cached = make_store()
+    assert cached.sync_documents(docs)["cached"]
+    assert lookup(cached, "rev9x3") == [("doc-b", True)]
+
+    # The revision takes over the vector when the original goes, and stays searchable
+    store.remove_document("doc-a")
+    assert lookup(store, "rev9x3") == [("doc-b", True)]
+    assert not store.dup_of and not store.near_dups
+    assert store.index.ntotal == store.num_vectors()
+
+
+def test_searches_run_while_a_cache_load_rebuilds_the_index(make_store, monkeypatch):
+    import threading
+
+    from vector_store import VectorStore
+
+    make_store().sync_documents(documents(2, 3))
+    store = make_store()
+    store.sync_documents(documents(1))
+
+    # The cached entry is Flat; under these settings loading it rebuilds it as HNSW
+    monkeypatch.setattr(index_builder, "HNSW_MIN_VECTORS", 10)
+    building, release = threading.Event(), threading.Event()
+    build = VectorStore._build
+
+    def slow_build(vectors, ids, spec):
+        building.set()
+        assert release.wait(10)
+        return build(vectors, ids, spec)
+
+    monkeypatch.setattr(VectorStore, "_build", staticmethod(slow_build))
+    load = threading.Thread(target=store.sync_documents, args=(documents(2, 3),))
+    load.start()
+    try:
+        assert building.wait(10)
+        hits = []
+        search = threading.Thread(target=lambda: hits.extend(store.retrieve_ids("ID1x3", k=1, dense_weight=0)))
+        search.start()
+        search.join(5)
+        assert not search.is_alive(), "retrieve_ids blocked behind the index rebuild"
+        assert store.chunk_records(hits)[0][1] == "doc-1"  # Still the old contents
+    finally:
+        release.set()
+        load.join(10)
+    assert store.index_spec.startswith("HNSW") and set(store.documents()) == {"doc-2", "doc-3"}
@@ -0,0 +1,280 @@
+# text_pipeline.py
+"""
+Normalize extracted text and chunk it, without rebuilding the text repeatedly.
+
+normalize_pages() cleans each page's lines in one pass with precompiled
+patterns, drops page numbers, and removes running headers and footers. A
+running head is a line at the top or bottom of a page that recurs on many
+pages; digits are ignored when matching, so "Page 3 | Intro" counts as a
+repeat of "Page 4 | Intro". The result is one backing string plus page offsets.
+PageNormalizer does the same for a document that arrives in page batches,
+counting running heads across all batches rather than within each one.
+normalize_text() cleans text without pages (DOCX), where a line that recurs
+often anywhere in the text is treated as a header or footer.
+
+chunk_spans() then cuts that string into (start, end) offsets at the best
+separator before the size limit, with overlap. It works like the recursive
+splitter it replaces, but never copies the text. Chunk strings are only
+created when a caller asks for them.
+
+chunk_normalized() / chunk_document() combine the two: a ChunkedDocument holds
+the backing string and (doc, page, start, end) spans over it. Ingestion
+(VectorStore.add_document_batches) chunks each extracted batch of pages this way.
+"""
+
+import bisect
+import math
+import re
+from collections import Counter
+from typing import NamedTuple
+
+# Lines checked for running heads at the top and at the bottom of each page
+HEADER_FOOTER_LINES = 2
+# Share of pages a top/bottom line must recur on to count as a header/footer
+HEADER_FOOTER_MIN_SHARE = 0.1
+HEADER_FOOTER_MIN_PAGES = 3
+# Pages a streamed document is held back for before running heads are decided
+HEADER_SAMPLE_PAGES = 32
+# Text without pages (DOCX): lines that recur more often than this share of all
+# lines, and at least REPEATED_LINE_MIN_COUNT + 1 times, are dropped as headers/footers
+REPEATED_LINE_SHARE = 0.1
+REPEATED_LINE_MIN_COUNT = 2
+# Split points, best first (same order as the previous splitter)
+SEPARATORS = ("\n\n", "\n", ".", "!", "?", " ")
+# Chunks are not cut shorter than this share of chunk_size when a separator is found
+MIN_CHUNK_SHARE = 0.25
+
+_DROP_LINE = re.compile(r"\d+|page \d+( of \d+)?", re.IGNORECASE)  # Page numbers
+_SPACES = re.compile(r"[ \t]+")
+_DIGITS = re.compile(r"\d+")
+_WHITESPACE = re.compile(r"\s")
+_NON_SPACE = re.compile(r"\S")
+
+
+class NormalizedText:
+    """Cleaned text of a document and the offset at which each kept page starts."""
+
+    __slots__ = ("text", "page_starts", "page_numbers")
+
+    def __init__(self, text: str, page_starts, page_numbers):
+        self.text = text
+        self.page_starts = page_starts
+        self.page_numbers = page_numbers
+
+    def page_at(self, offset: int) -> int:
+        """Page number of the character at offset (0 if there are no pages)."""
+        i = bisect.bisect_right(self.page_starts, offset) - 1
+        return self.page_numbers[i] if i >= 0 else 0
+
+    def pages(self):
+        """The kept pages as (page_number, text); join_pages() turns them back into this text."""
+        ends = self.page_starts[1:] + [len(self.text) + 1]
+        return [(number, self.text[start:end - 1])
+                for number, start, end in zip(self.page_numbers, self.page_starts, ends)]
+
+
+class Chunk(NamedTuple):
+    doc: str
+    page: int
+    start: int
+    end: int
+
+
+class ChunkedDocument:
+    """A document's backing text and its chunks as offsets into it."""
+
+    __slots__ = ("doc", "text", "chunks")
+
+    def __init__(self, doc: str, text: str, chunks):
+        self.doc = doc
+        self.text = text
+        self.chunks = chunks
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def chunk_text(self, i: int) -> str:
+        chunk = self.chunks[i]
+        return self.text[chunk.start:chunk.end]
+
+    def texts(self):
+        return [self.text[c.start:c.end] for c in self.chunks]
+
+
+def _edge_key(line: str) -> str:
+    return _DIGITS.sub("#", line)
+
+
+def _clean_lines(text: str):
+    lines = []
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or _DROP_LINE.fullmatch(line):
+            continue
+        lines.append(_SPACES.sub(" ", line))
+    return lines
+
+
+def _count_edges(edge_counts: Counter, lines):
+    edges = lines[:HEADER_FOOTER_LINES] + lines[-HEADER_FOOTER_LINES:]
+    edge_counts.update({_edge_key(line) for line in edges})  # Once per page
+
+
+def _running_heads(edge_counts: Counter, num_pages: int):
+    threshold = max(HEADER_FOOTER_MIN_PAGES, math.ceil(num_pages * HEADER_FOOTER_MIN_SHARE))
+    return {key for key, count in edge_counts.items() if count >= threshold}
+
+
+def _join_lines(page_lines, running) -> NormalizedText:
+    parts, page_starts, page_numbers = [], [], []
+    offset = 0
+    for number, lines in page_lines:
+        n = len(lines)
+        if running:
+            lines = [
+                line for i, line in enumerate(lines)
+                if not ((i < HEADER_FOOTER_LINES or i >= n - HEADER_FOOTER_LINES) and _edge_key(line) in running)
+            ]
+        if not lines:
+            continue
+        block = "\n".join(lines)
+        page_starts.append(offset)
+        page_numbers.append(number)
+        parts.append(block)
+        offset += len(block) + 1  # Pages are joined with a newline
+    return NormalizedText("\n".join(parts), page_starts, page_numbers)
+
+
+def normalize_pages(pages) -> NormalizedText:
+    """
+    Clean the text of (page_number, text) pages:
+    - drop blank lines and page-number lines ("12", "Page 3", "Page 3 of 9")
+    - drop headers/footers that recur at the top or bottom of many pages
+    - collapse runs of spaces and tabs
+    """
+    page_lines = []
+    edge_counts = Counter()
+    for number, text in pages:
+        lines = _clean_lines(text)
+        _count_edges(edge_counts, lines)
+        page_lines.append((number, lines))
+    return _join_lines(page_lines, _running_heads(edge_counts, len(page_lines)))
+
+
+class PageNormalizer:
+    """
+    normalize_pages() for a document that arrives in page batches. Running heads
+    are counted over every page seen so far, so a header that recurs across
+    batches is found even when no single batch has enough pages to show it.
+    Pages are held back until sample_pages have been seen (or the document
+    ends); after that each batch is cleaned as soon as it is fed. A head that
+    only starts recurring later in the document is removed from the point it
+    is recognized.
+    """
+
+    def __init__(self, sample_pages: int = HEADER_SAMPLE_PAGES):
+        self.sample_pages = sample_pages
+        self._edge_counts = Counter()
+        self._seen = 0
+        self._held = []  # (page_number, lines) not cleaned yet
+
+    def feed(self, pages) -> NormalizedText:
+        """Add the next pages; returns the pages that are ready (possibly none)."""
+        for number, text in pages:
+            lines = _clean_lines(text)
+            _count_edges(self._edge_counts, lines)
+            self._held.append((number, lines))
+            self._seen += 1
+        if self._seen < self.sample_pages:
+            return NormalizedText("", [], [])
+        return self.finish()
+
+    def finish(self) -> NormalizedText:
+        """Clean and return every page held back so far."""
+        held, self._held = self._held, []
+        return _join_lines(held, _running_heads(self._edge_counts, self._seen))
+
+
+def join_pages(pages) -> NormalizedText:
+    """Join already clean (page_number, text) pages, without normalizing them again."""
+    parts, page_starts, page_numbers = [], [], []
+    offset = 0
+    for number, text in pages:
+        if not text:
+            continue
+        page_starts.append(offset)
+        page_numbers.append(number)
+        parts.append(text)
+        offset += len(text) + 1
+    return NormalizedText("\n".join(parts), page_starts, page_numbers)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Clean text that has no page structure, like normalize_pages does a single page.
+    Without pages, running heads cannot be told by their position, so lines that
+    recur too often anywhere in the text (see REPEATED_LINE_SHARE) are dropped instead.
+    """
+    lines = _clean_lines(text)
+    threshold = max(REPEATED_LINE_MIN_COUNT, int(len(text.splitlines()) * REPEATED_LINE_SHARE))
+    counts = Counter(lines)
+    return "\n".join(line for line in lines if counts[line] <= threshold)
+
+
+def _find_cut(text: str, pos: int, limit: int, floor: int) -> int:
+    for sep in SEPARATORS:
+        i = text.rfind(sep, floor, limit)
+        if i != -1:
+            return i + len(sep)
+    return limit
+
+
+def chunk_spans(text: str, chunk_size: int, chunk_overlap: int, start: int = 0, end: int = None):
+    """
+    Return (start, end) offsets of chunks of text[start:end], each at most
+    chunk_size characters, cut at the best separator and without surrounding
+    whitespace. Consecutive chunks overlap by up to chunk_overlap characters,
+    starting at a word boundary.
+    """
+    n = len(text) if end is None else end
+    min_chunk = max(1, int(chunk_size * MIN_CHUNK_SHARE))
+    spans = []
+    match = _NON_SPACE.search(text, start, n)
+    pos = match.start() if match else n
+    while pos < n:
+        limit = pos + chunk_size
+        cut = n if limit >= n else _find_cut(text, pos, limit, pos + min_chunk)
+        stop = cut
+        while stop > pos and text[stop - 1].isspace():
+            stop -= 1
+        if stop > pos:
+            spans.append((pos, stop))
+        if cut >= n:
+            break
+        resume = max(cut - chunk_overlap, pos + 1)
+        if resume < cut:
+            # Start the overlap after a space rather than mid-word
+            space = _WHITESPACE.search(text, resume, cut)
+            resume = space.end() if space else cut
+        match = _NON_SPACE.search(text, resume, n)
+        pos = match.start() if match else n
+    return spans
+
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int):
+    """Chunk strings of text (drop-in for a text splitter's split_text)."""
+    return [text[s:e] for s, e in chunk_spans(text, chunk_size, chunk_overlap)]
+
+
+def chunk_normalized(doc: str, normalized: NormalizedText, chunk_size: int, chunk_overlap: int) -> ChunkedDocument:
+    """Chunk normalized text into spans over its buffer; each chunk gets the page it starts on."""
+    chunks = [
+        Chunk(doc, normalized.page_at(s), s, e)
+        for s, e in chunk_spans(normalized.text, chunk_size, chunk_overlap)
+    ]
+    return ChunkedDocument(doc, normalized.text, chunks)
+
+
+def chunk_document(doc: str, pages, chunk_size: int, chunk_overlap: int) -> ChunkedDocument:
+    """Normalize (page_number, text) pages and chunk them into spans over one buffer."""
+    return chunk_normalized(doc, normalize_pages(pages), chunk_size, chunk_overlap)
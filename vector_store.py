@@ -1,74 +1,898 @@
 # vector_store.py
 
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import faiss
+import hashlib
+import os
+import threading
+import time
+from array import array
 import numpy as np
 import streamlit as st
+from lazy_import import lazy_module
+from telemetry import span
+from text_pipeline import chunk_normalized, join_pages, split_text
+from embedding_backends import EMBEDDING_BACKEND, create_embedder, embedding_id
+from embedding_service import BULK, QUERY, EmbeddingService
+from chunk_store import ChunkStore
+from index_cache import IndexCache, make_cache_key
+from index_bundle import BundleError, bundles, read_bundle, write_bundle
+from dedup import ChunkDeduplicator, fingerprint
+from answer_cache import QueryEmbeddingCache
+from bm25 import BM25Index, has_identifier, reciprocal_rank_fusion
+from index_builder import (build_index, choose_index_spec, estimate_bytes, evaluate_configs,
+                           export_vectors, index_kind, measure_recall, supports_removal, tune_index,
+                           RECALL_SAMPLE_QUERIES)
+
+# Chunking parameters (part of the index cache key)
+CHUNK_SIZE = 500  # slightly larger chunks for better context
+CHUNK_OVERLAP = 50  # reduced overlap since chunks are more meaningful
+# Chunks embedded per slice before they are added to the live index
+EMBED_BATCH_CHUNKS = 256
+# Route encoding through the shared micro-batching worker (0: each caller encodes directly)
+EMBED_SERVICE = os.getenv("DOCTALK_EMBED_SERVICE", "1") == "1"
+# Skip embedding chunks that repeat an indexed chunk exactly or nearly (see dedup.py)
+DEDUP = os.getenv("DOCTALK_DEDUP", "1") == "1"
+
+# Hybrid retrieval: weights of each signal in reciprocal rank fusion
+DENSE_WEIGHT = 1.0
+LEXICAL_WEIGHT = 1.0
+RRF_K = 60
+# Time the lexical (BM25) side may spend per query
+LEXICAL_BUDGET_MS = 20.0
+# A keyword query whose best BM25 hit beats the runner-up by this factor skips dense search
+KEYWORD_SHORT_CIRCUIT_RATIO = 2.0
+
+# Heavy dependencies are imported on first use, so the app renders before they load
+faiss = lazy_module("faiss")
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+_services = {}
+_services_lock = threading.Lock()
+
+def chunk_text(text: str):
+    """Split text into overlapping chunks (offset-based; see text_pipeline.py)."""
+    return split_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+
+def load_embedder(model_name: str):
+    """
+    Return the embedding model, loading it (and torch) on first use.
+    One instance per model name is shared by every store in the process.
+    The backend (torch, torch-int8, onnx, onnx-int8) is chosen with
+    DOCTALK_EMBEDDING_BACKEND; see embedding_backends.py.
+    """
+    embedder = _embedders.get(model_name)
+    if embedder is None:
+        with _embedders_lock:
+            embedder = _embedders.get(model_name)
+            if embedder is None:
+                embedder = create_embedder(model_name, EMBEDDING_BACKEND)
+                _embedders[model_name] = embedder
+    return embedder
+
+def get_embedding_service(model_name: str) -> EmbeddingService:
+    """The process-wide embedding worker for a model, shared by every store."""
+    with _services_lock:
+        service = _services.get(model_name)
+        if service is None:
+            service = _services[model_name] = EmbeddingService(lambda: load_embedder(model_name), name=model_name)
+    return service
+
+def warm_up(model_name: str) -> threading.Thread:
+    """Load the embedder and heavy libraries in a background thread."""
+    def run():
+        load_embedder(model_name)
+        faiss.IndexFlatL2  # Trigger the faiss import
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def text_doc_id(text: str) -> str:
+    """Document id for raw text that did not come from an uploaded file."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 class VectorStore:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        # Load the embedding model
-        self.embedder = SentenceTransformer(model_name)
+    """
+    FAISS vector store over one or more documents.
+
+    Every chunk gets a stable integer id, and the index is an ID-mapped FAISS
+    index, so documents can be added and removed without re-embedding the rest.
+    Document ids are the content hashes of the uploaded files, which also makes
+    the set of document ids the key of the on-disk index cache. Chunk text is kept
+    in a memory-mapped ChunkStore, not in Python strings.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", cache: IndexCache = None, embedder=None,
+                 query_cache: QueryEmbeddingCache = None):
+        # The embedding model is loaded on first use (or an already loaded one is shared)
+        self.model_name = model_name
+        self._embedder = embedder
+        # An explicitly passed embedder is called directly, not through the shared worker
+        self._use_service = EMBED_SERVICE and embedder is None
+        self.cache = cache if cache is not None else IndexCache()
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.cache_key = None
+        # (cache key, path) of the last bundle loaded with load_bundle()
+        self._bundle = None
+        # Guards the index and chunk maps; embedding happens outside of it
+        self._lock = threading.RLock()
+        self.ingesting = False
+        self.reset()
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = load_embedder(self.model_name)
+        return self._embedder
+
+    def reset(self):
+        """Forget all documents and the index."""
         self.index = None
-        self.text_chunks = []
+        if getattr(self, "chunks", None) is not None:
+            self.chunks.close()
+        self.chunks = ChunkStore()  # chunk id -> text (and doc id, page)
+        self.doc_chunks = {}  # doc id -> array of chunk ids
+        self.doc_names = {}  # doc id -> display name
+        # FAISS factory string of the current index (see index_builder.choose_index_spec)
+        self.index_spec = "Flat"
+        self.index_stats = {}
+        self._built_n = 0
+        # Lexical index over the same chunk ids; None means "rebuild on first use"
+        self._bm25 = BM25Index()
+        # Duplicate chunks have no vector of their own; they resolve to a canonical chunk
+        self.dup_of = {}  # duplicate chunk id -> canonical chunk id
+        self.dup_refs = {}  # canonical chunk id -> array of duplicate chunk ids
+        # Near-duplicates differ in wording (a part number, a version), so unlike exact
+        # duplicates they stay in the lexical index and are found under their own text
+        self.near_dups = set()
+        self._dedup = None  # ChunkDeduplicator over canonical chunks; None means "rebuild on first use"
+        self.dedup_stats = {"chunks": 0, "exact": 0, "near": 0}
+        # Indexes loaded from the cache are memory-mapped and must be copied before editing
+        self._index_readonly = False
 
-    def create_index(self, full_text: str):
+    # -------------------------------
+    # On-disk cache
+    # -------------------------------
+    @property
+    def embedding_id(self) -> str:
+        """Model plus backend: vectors from different backends never share a cache entry."""
+        return embedding_id(self.model_name, EMBEDDING_BACKEND)
+
+    def _cache_key(self, doc_ids):
+        return make_cache_key(doc_ids, self.embedding_id, CHUNK_SIZE, CHUNK_OVERLAP)
+
+    def _bundle_path(self, key: str):
+        """Bundle holding the document set with this key: the one loaded last, or a mounted one."""
+        if self._bundle is not None and self._bundle[0] == key:
+            return self._bundle[1]
+        return bundles.find(key)
+
+    def _load_key(self, key: str) -> bool:
         """
-        Create FAISS index with progress tracking
+        Replace the store's contents with the bundle or cache entry for key.
+        Reading the entry and any index rebuild happen outside the lock; searches
+        keep using the current contents until the loaded ones are swapped in.
         """
-        progress_bar = st.progress(0, "Initializing...")
-        
-        try:
-            # 1) Split text into chunks (25%)
-            progress_bar.progress(0.1, "Splitting text into chunks...")
-            splitter = RecursiveCharacterTextSplitter(
-                # Try to split on these characters, in order
-                separators=["\n\n", "\n", ".", "!", "?", " ", ""],
-                chunk_size=500,  # slightly larger chunks for better context
-                chunk_overlap=50,  # reduced overlap since chunks are more meaningful
-                length_function=len,
+        cached = None
+        path = self._bundle_path(key)
+        if path is not None:
+            try:
+                cached = read_bundle(path)
+            except BundleError:
+                path = None  # Fall back to the cache
+        if cached is None:
+            cached = self.cache.get(key)
+        if cached is None:
+            return False
+        records, embeddings, index, meta = cached
+        rebuilt = self._reselect_index(records, embeddings, index, meta)
+        if rebuilt is not None:
+            index, meta = rebuilt
+            if path is None:
+                try:
+                    # Replace the entry before the chunks are shared with writers
+                    self.cache.put(key, records, embeddings, index, meta=meta, replace=True)
+                except OSError:
+                    pass  # Caching is best-effort; the rebuilt index is still usable
+        with self._lock:
+            self._apply_cached(key, records, index, meta)
+            if rebuilt is not None:
+                self._index_readonly = False  # Built in memory, not mapped from the entry
+        return True
+
+    def _reselect_index(self, records: ChunkStore, embeddings, index, meta: dict):
+        """
+        A cached or bundled index was built for the index settings in effect then
+        (size thresholds, quantization). If they now pick another index type, rebuild
+        it from the stored vectors (nothing is re-embedded).
+        Returns (index, meta) for the rebuilt index, or None if the loaded one fits.
+        """
+        n = len(embeddings)
+        if n == 0 or choose_index_spec(n, index.d) == meta.get("index_spec", "Flat"):
+            return None
+        duplicates = {dup for dup, _ in meta.get("duplicates", [])}
+        ids = [cid for cid in records if cid not in duplicates]  # The order the vectors were exported in
+        spec = choose_index_spec(n, index.d)
+        index, stats = self._build(np.ascontiguousarray(embeddings, dtype=np.float32), ids, spec)
+        return index, dict(meta, index_spec=spec, index_stats=stats)
+
+    def _apply_cached(self, key: str, chunks: ChunkStore, index, meta):
+        self.reset()
+        self.chunks.close()
+        self.chunks = chunks
+        self.doc_chunks = chunks.doc_chunk_ids()
+        for doc_id, name in meta.get("doc_names", {}).items():
+            self.doc_names[doc_id] = name
+            self.doc_chunks.setdefault(doc_id, array("q"))
+        for dup, canonical in meta.get("duplicates", []):
+            self.dup_of[dup] = canonical
+            self.dup_refs.setdefault(canonical, array("q")).append(dup)
+        self.near_dups = set(meta.get("near_duplicates", []))
+        self.index = index
+        self.index_spec = meta.get("index_spec", "Flat")
+        self.index_stats = meta.get("index_stats", {})
+        self._built_n = len(self.chunks)
+        tune_index(index, self.index_spec)
+        self._index_readonly = True
+        self._bm25 = None  # Built lazily, so a warm cache load stays fast
+        self.cache_key = key
+
+    def doc_set_key(self) -> str:
+        """Hash identifying the indexed document set (and embedding/chunking settings)."""
+        return self._cache_key(self.doc_chunks)
+
+    def load_from_cache(self, file_hashes) -> bool:
+        """
+        Load a previously built index for the given file hashes.
+        Returns True on a cache hit, so the caller can skip extraction entirely.
+        """
+        if not file_hashes:
+            return False
+        return self._load_key(self._cache_key(file_hashes))
+
+    def save_to_cache(self):
+        """Store the current documents in the on-disk cache (best-effort)."""
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self, replace: bool = False):
+        if self.index is None:
+            return
+        key = self._cache_key(self.doc_chunks)
+        # An unchanged bundle is already on disk; it is not copied into the cache
+        if (replace or not self.cache.contains(key)) and self._bundle_path(key) is None:
+            ids = self._vector_ids()
+            embeddings = export_vectors(self.index, ids) if ids else np.zeros((0, self.index.d), dtype=np.float32)
+            self.cache.put(key, self.chunks, embeddings, self.index, meta={
+                "model": self.model_name,
+                "num_chunks": len(self.chunks),
+                "num_vectors": len(ids),
+                "duplicates": sorted(self.dup_of.items()),
+                "near_duplicates": sorted(self.near_dups),
+                "doc_names": self.doc_names,
+                "index_spec": self.index_spec,
+                "index_stats": self.index_stats,
+            }, replace=replace)
+        self.cache_key = key
+
+    # -------------------------------
+    # Index bundles (see index_bundle.py and batch_ingest.py)
+    # -------------------------------
+    def load_bundle(self, path: str) -> dict:
+        """
+        Replace the store's documents with a prebuilt index bundle. Nothing is
+        re-embedded: chunks, vectors and index are memory-mapped from the bundle.
+        Raises BundleError if the bundle was built with another embedding model,
+        backend or chunking. Returns the bundle's manifest.
+        """
+        chunks, _, index, manifest = read_bundle(path)
+        key = self._cache_key(manifest.get("doc_names", {}))
+        if manifest.get("key") != key:
+            chunks.close()
+            raise BundleError(
+                f"{path} was built with {manifest.get('embedding')} and chunks of "
+                f"{manifest.get('chunk_size')}/{manifest.get('chunk_overlap')}; this store uses "
+                f"{self.embedding_id} and {CHUNK_SIZE}/{CHUNK_OVERLAP}"
             )
-            chunks = splitter.split_text(full_text)
-            self.text_chunks = chunks
-            progress_bar.progress(0.25, "Text splitting complete.")
-
-            # 2) Compute embeddings (50%)
-            progress_bar.progress(0.3, "Computing embeddings...")
-            embeddings = self.embedder.encode(
-                chunks,
-                convert_to_numpy=True,
-                show_progress_bar=False,
-                batch_size=32
+        with self._lock:
+            self._apply_cached(key, chunks, index, manifest)
+            self._bundle = (key, os.path.abspath(path))
+        return manifest
+
+    def save_bundle(self, path: str, files=None, **extra) -> dict:
+        """
+        Write the store's documents as an index bundle at path. files is the
+        per-file metadata to record; extra keys are added to the manifest.
+        Returns the manifest.
+        """
+        with self._lock:
+            if self.index is None:
+                raise BundleError("Nothing is indexed; there is no bundle to write")
+            ids = self._vector_ids()
+            embeddings = export_vectors(self.index, ids) if ids else np.zeros((0, self.index.d), dtype=np.float32)
+            manifest = dict(
+                extra,
+                key=self._cache_key(self.doc_chunks),
+                embedding=self.embedding_id,
+                model=self.model_name,
+                backend=EMBEDDING_BACKEND,
+                chunk_size=CHUNK_SIZE,
+                chunk_overlap=CHUNK_OVERLAP,
+                dim=self.index.d,
+                num_chunks=len(self.chunks),
+                num_vectors=len(ids),
+                num_docs=len(self.doc_chunks),
+                duplicates=sorted(self.dup_of.items()),
+                near_duplicates=sorted(self.near_dups),
+                doc_names=self.doc_names,
+                index_spec=self.index_spec,
+                index_stats=self.index_stats,
+                files=list(files or []),
             )
-            progress_bar.progress(0.75, "Embeddings computed.")            
-            # 3) Build FAISS index (25%)
-            progress_bar.progress(0.8, "Building search index...")
-            d = embeddings.shape[1]
+            write_bundle(path, self.chunks, embeddings, self.index, manifest)
+        return manifest
+
+    # -------------------------------
+    # Pool support (see store_manager.py)
+    # -------------------------------
+    def is_loaded(self) -> bool:
+        return self.index is not None
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate resident size of this store: vectors, ids and the chunk table.
+        Chunk text is memory-mapped and not counted, nor is the shared embedder.
+        """
+        if self.index is None:
+            return 0
+        vectors = estimate_bytes(self.index_spec, self.index.ntotal, self.index.d)
+        return vectors + self.chunks.table_bytes()
+
+    def unload(self):
+        """
+        Drop the index and chunks from memory, making sure they are on disk first.
+        The store can be brought back with reload().
+        """
+        with self._lock:
+            if self.index is None or self.ingesting:
+                return
+            self._save_locked()
+            key = self.cache_key
+            self.reset()
+            self.cache_key = key
+
+    def reload(self) -> bool:
+        """Load the index back from disk after unload(). Returns True on success."""
+        if self.index is not None:
+            return True
+        if self.cache_key is None:
+            return False
+        return self._load_key(self.cache_key)
+
+    # -------------------------------
+    # Building and updating the index
+    # -------------------------------
+    def _encode_texts(self, texts, lane: str = BULK):
+        """Raw embeddings of texts, batched with other sessions' requests in the shared worker."""
+        if self._use_service:
+            return get_embedding_service(self.model_name).encode(texts, lane=lane)
+        return self.embedder.encode(texts, convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+
+    def _encode(self, chunks):
+        with span("embed", chunks=len(chunks)):
+            embeddings = np.array(self._encode_texts(chunks, lane=BULK), dtype=np.float32)
             faiss.normalize_L2(embeddings)  # Normalize vectors for better similarity
-            index = faiss.IndexFlatL2(d)
-            index.add(embeddings)
+        return embeddings
+
+    def _ensure_writable(self, d: int):
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(d))
+        elif self._index_readonly:
+            self.index = faiss.clone_index(self.index)
+            self._index_readonly = False
+
+    def documents(self):
+        """Return the ids of all indexed documents."""
+        return list(self.doc_chunks)
+
+    def num_chunks(self) -> int:
+        return len(self.chunks)
+
+    def num_vectors(self) -> int:
+        """Chunks with a vector of their own (duplicates share their canonical chunk's)."""
+        return len(self.chunks) - len(self.dup_of)
+
+    def _vector_ids(self):
+        return [cid for cid in self.chunks if cid not in self.dup_of]
+
+    def _lexical_member(self, cid: int) -> bool:
+        # Exact duplicates are searched through their canonical chunk; everything else has its own BM25 entry
+        return cid not in self.dup_of or cid in self.near_dups
+
+    def _dedup_index(self) -> ChunkDeduplicator:
+        # Called with the lock held
+        if self._dedup is None:
+            dedup = ChunkDeduplicator()
+            for cid, text in self.chunks.items():
+                if cid not in self.dup_of:
+                    dedup.add(cid, fingerprint(text, dedup.near))
+            self._dedup = dedup
+        return self._dedup
+
+    def _match_duplicates(self, part, fingerprints, first_id: int) -> dict:
+        """
+        Position in part -> (canonical chunk id, "exact" | "near"), for the chunks
+        of part that repeat an indexed chunk or an earlier chunk of part. The others are registered
+        as canonical under the ids they are about to get (first_id + position).
+        Called with the lock held.
+        """
+        dedup = self._dedup_index()
+        duplicates = {}
+        for i, fp in enumerate(fingerprints):
+            match = dedup.find(fp)
+            if match is None:
+                dedup.add(first_id + i, fp)
+            else:
+                duplicates[i] = match
+                self.dedup_stats[match[1]] += 1
+        self.dedup_stats["chunks"] += len(part)
+        return duplicates
+
+    def _add_chunks(self, doc_id: str, chunks, on_chunks=None, pages=None):
+        """
+        Embed chunks in slices and add each slice to the live index as soon as it
+        is ready, so searches see partial results while a document is ingested.
+        pages gives the page each chunk starts on (0 if unknown).
+        Chunks that duplicate an indexed chunk are stored (for their document)
+        but not embedded; they resolve to the canonical chunk's vector.
+        Near-duplicates are still added to the lexical index.
+        Chunks of one store are added by one writer at a time (its ingestion job).
+        """
+        for start in range(0, len(chunks), EMBED_BATCH_CHUNKS):
+            part = chunks[start:start + EMBED_BATCH_CHUNKS]
+            duplicates = {}
+            if DEDUP:
+                with span("dedup", chunks=len(part)) as s:
+                    fingerprints = [fingerprint(text) for text in part]
+                    with self._lock:
+                        first_id = self.chunks.next_id
+                        duplicates = self._match_duplicates(part, fingerprints, first_id)
+                    s["duplicates"] = len(duplicates)
+            unique = [i for i in range(len(part)) if i not in duplicates]
+            try:
+                # Outside the lock: searches keep running
+                embeddings = self._encode([part[i] for i in unique]) if unique else None
+            except BaseException:
+                with self._lock:
+                    self._dedup = None  # Drop the ids registered for this slice
+                raise
+            with self._lock, span("index.add", chunks=len(unique)):
+                ids = self.chunks.add(doc_id, part, pages[start:start + EMBED_BATCH_CHUNKS] if pages else None)
+                if duplicates and ids.start != first_id:
+                    raise RuntimeError("Chunks were added to the store by two writers at once")
+                if unique:
+                    self._ensure_writable(embeddings.shape[1])
+                    self.index.add_with_ids(embeddings, np.array([ids.start + i for i in unique], dtype=np.int64))
+                for i, (canonical, kind) in duplicates.items():
+                    self.dup_of[ids.start + i] = canonical
+                    self.dup_refs.setdefault(canonical, array("q")).append(ids.start + i)
+                    if kind == "near":
+                        self.near_dups.add(ids.start + i)
+                if self._bm25 is not None:
+                    for i in range(len(part)):
+                        if self._lexical_member(ids.start + i):
+                            self._bm25.add(ids.start + i, part[i])
+                self.doc_chunks.setdefault(doc_id, array("q")).extend(ids)
+            if on_chunks:
+                on_chunks(len(part))
+
+    def add_document_batches(self, doc_id: str, batches, name: str = None, on_chunks=None, cancel=None) -> int:
+        """
+        Split, embed and index one document that arrives as a stream of batches:
+        lists of clean (page_number, text) pages, as yielded by
+        pdf_reader.iter_file_section, or plain text strings (page 0).
+        The last chunk of each batch is held back and re-split with the next batch,
+        so chunk boundaries do not depend on where the batches were cut.
+        Documents already in the store are skipped. Returns the number of chunks added.
+        """
+        with self._lock:
+            if doc_id in self.doc_chunks:
+                return 0
+            self.doc_chunks[doc_id] = array("q")
+            self.doc_names[doc_id] = name or doc_id
+            self.cache_key = None
+        carry = None  # (page, text) of the chunk held back from the previous batch
+        for batch in batches:
+            if cancel is not None and cancel.is_set():
+                break
+            pages = [(0, batch)] if isinstance(batch, str) else list(batch)
+            with span("chunk") as s:
+                chunked = chunk_normalized(doc_id, join_pages([carry] + pages if carry else pages),
+                                           CHUNK_SIZE, CHUNK_OVERLAP)
+                s["chunks"] = len(chunked)
+            if not chunked.chunks:
+                continue
+            last = chunked.chunks.pop()
+            carry = (last.page, chunked.text[last.start:last.end])
+            self._add_chunks(doc_id, chunked.texts(), on_chunks, pages=[c.page for c in chunked.chunks])
+        if carry and not (cancel is not None and cancel.is_set()):
+            self._add_chunks(doc_id, [carry[1]], on_chunks, pages=[carry[0]])
+        return len(self.doc_chunks.get(doc_id, []))
+
+    def add_document(self, doc_id: str, text: str, name: str = None, on_chunks=None) -> int:
+        """
+        Split, embed and index one document. Documents already in the store are skipped.
+        Returns the number of chunks added.
+        """
+        return self.add_document_batches(doc_id, [text], name=name, on_chunks=on_chunks)
+
+    def remove_document(self, doc_id: str) -> int:
+        """
+        Drop a document's vectors and chunks from the store.
+        Returns the number of chunks removed.
+        """
+        with self._lock:
+            ids = self.doc_chunks.pop(doc_id, None)
+            self.doc_names.pop(doc_id, None)
+            self.cache_key = None
+            if not ids:
+                return 0
+            heirs = self._release_duplicates(ids)
+            if supports_removal(self.index_spec) or heirs:
+                self._ensure_writable(self.index.d)
+            if supports_removal(self.index_spec):
+                self.index.remove_ids(np.array(ids, dtype=np.int64))
+            # Otherwise (HNSW) the vectors stay in the index but their ids no longer
+            # resolve to chunks; they are dropped at the next rebuild
+            for heir, vector in heirs:
+                self.index.add_with_ids(vector[None, :], np.array([heir], dtype=np.int64))
+            if self._bm25 is not None:
+                for cid in ids:
+                    self._bm25.remove(cid, self.chunks.get(cid))
+                for heir, _ in heirs:
+                    for member in (heir, *self.dup_refs.get(heir, ())):
+                        if self._lexical_member(member) and member not in self._bm25:
+                            self._bm25.add(member, self.chunks.get(member))
+            self.chunks.remove(ids)
+            self._dedup = None
+            return len(ids)
+
+    def _release_duplicates(self, ids):
+        """
+        Unlink the chunks being removed from their duplicates. A removed canonical
+        chunk with surviving duplicates hands its vector to the first of them.
+        Returns (new canonical chunk id, vector) pairs to add to the index.
+        Called with the lock held.
+        """
+        removing = set(ids)
+        heirs = []
+        for cid in ids:
+            self.near_dups.discard(cid)
+            canonical = self.dup_of.pop(cid, None)
+            if canonical is not None:
+                refs = self.dup_refs.get(canonical)
+                if refs is not None:
+                    refs.remove(cid)
+                    if not refs:
+                        del self.dup_refs[canonical]
+                continue
+            refs = [r for r in self.dup_refs.pop(cid, ()) if r not in removing]
+            if not refs:
+                continue
+            heir = refs[0]
+            del self.dup_of[heir]
+            for other in refs[1:]:
+                self.dup_of[other] = heir
+                if heir in self.near_dups:
+                    self.near_dups.add(other)  # Its text no longer matches its canonical chunk's
+            self.near_dups.discard(heir)
+            if len(refs) > 1:
+                self.dup_refs[heir] = array("q", refs[1:])
+            heirs.append((heir, self.index.reconstruct(int(cid))))
+        return heirs
+
+    def optimize_index(self):
+        """
+        Switch to the index type that suits the current corpus size (flat, HNSW or
+        IVF, optionally quantized) and measure its recall against exact search.
+        The new index is built outside the lock and swapped in only if no chunks
+        were added or removed meanwhile.
+        """
+        with self._lock:
+            if self.index is None or not self.chunks:
+                return
+            n, d = self.num_vectors(), self.index.d
+            spec = choose_index_spec(n, d)
+            stale = self.index.ntotal != n or (index_kind(spec) != "Flat" and n >= 2 * max(1, self._built_n))
+            if spec == self.index_spec and not stale:
+                return
+            ids = self._vector_ids()
+            vectors = export_vectors(self.index, ids)
+            version = (self.chunks.next_id, n)
+
+        index, stats = self._build(vectors, ids, spec)
+
+        with self._lock:
+            if (self.chunks.next_id, len(self.chunks)) != version:
+                return
             self.index = index
-            
+            self.index_spec = spec
+            self.index_stats = stats
+            self._built_n = n
+            self._index_readonly = False
+            self.cache_key = None
+
+    @staticmethod
+    def _build(vectors, ids, spec: str):
+        """Build an index of the given type over vectors and measure its recall. Returns (index, stats)."""
+        n = len(vectors)
+        with span("index.build", spec=spec, vectors=n):
+            index = build_index(vectors, ids, spec)
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(n, size=min(RECALL_SAMPLE_QUERIES, n), replace=False)]
+        with span("index.recall", spec=spec):
+            stats = measure_recall(index, vectors, queries, ids=ids)
+        return index, stats
+
+    def index_report(self, specs=None, k: int = 10):
+        """
+        Compare index configurations on this store's vectors: recall@k against the
+        flat baseline, search latency, memory and build time per configuration.
+        """
+        with self._lock:
+            if self.index is None or not self.chunks:
+                return []
+            vectors = export_vectors(self.index, self._vector_ids())
+        return evaluate_configs(vectors, specs=specs, k=k)
+
+    def sync_documents(self, documents, on_progress=None, cancel=None) -> dict:
+        """
+        Make the store hold exactly the given documents.
+
+        documents maps doc id -> (name, load_batches), where load_batches() returns
+        an iterable of batches (see add_document_batches) and is only called for
+        documents that are not indexed yet. The whole set is loaded from the on-disk
+        cache when possible; otherwise only new documents are embedded and removed
+        documents' vectors are dropped. Chunks are searchable as soon as their batch
+        is embedded.
+
+        on_progress(chunks_indexed, docs_done, docs_total, name) is called after
+        every embedded slice; setting the cancel event stops ingestion between batches.
+        Returns a summary: {"cached": bool, "added": int, "removed": int, "cancelled": bool,
+        "duplicates": int}, where duplicates counts the added chunks that were not embedded
+        because they repeat another chunk.
+        """
+        summary = {"cached": False, "added": 0, "removed": 0, "cancelled": False, "duplicates": 0}
+        wanted = set(documents)
+        with self._lock:
+            if wanted == set(self.doc_chunks) and self.index is not None:
+                return summary
+        # Outside the lock: reading the entry (and any index rebuild) does not block searches
+        if self._load_key(self._cache_key(wanted)):
+            summary["cached"] = True
+            return summary
+        with self._lock:
+            removed = [doc_id for doc_id in self.doc_chunks if doc_id not in wanted]
+            for doc_id in removed:
+                self.remove_document(doc_id)
+        summary["removed"] = len(removed)
+
+        added = [doc_id for doc_id in documents if doc_id not in self.doc_chunks]
+        duplicates_before = self.dedup_stats["exact"] + self.dedup_stats["near"]
+        self.ingesting = True
+        try:
+            indexed = 0
+            for i, doc_id in enumerate(added):
+                name, load_batches = documents[doc_id]
+
+                def on_chunks(n, i=i, name=name):
+                    nonlocal indexed
+                    indexed += n
+                    if on_progress:
+                        on_progress(indexed, i, len(added), name)
+
+                self.add_document_batches(doc_id, load_batches(), name=name, on_chunks=on_chunks, cancel=cancel)
+                if cancel is not None and cancel.is_set():
+                    # Drop the half-indexed document so the cache never stores it
+                    self.remove_document(doc_id)
+                    summary["cancelled"] = True
+                    return summary
+                summary["added"] += 1
+                summary["duplicates"] = self.dedup_stats["exact"] + self.dedup_stats["near"] - duplicates_before
+                if on_progress:
+                    on_progress(indexed, i + 1, len(added), name)
+
+            self.optimize_index()
+            try:
+                self.save_to_cache()
+            except OSError:
+                pass  # Caching is best-effort; the in-memory index is still usable
+        finally:
+            self.ingesting = False
+        return summary
+
+    def create_index(self, full_text: str):
+        """
+        Create FAISS index over a single text with progress tracking.
+        Replaces anything that was indexed before.
+        """
+        progress_bar = st.progress(0, "Initializing...")
+
+        try:
+            doc_id = text_doc_id(full_text)
+            if self._load_key(self._cache_key([doc_id])):
+                progress_bar.progress(1.0, "Vector store loaded from cache!")
+                return
+            self.reset()
+
+            # 1) Split text into chunks
+            progress_bar.progress(0, "Splitting text into chunks...")
+            with span("chunk") as s:
+                chunks = chunk_text(full_text)
+                s["chunks"] = len(chunks)
+            total = max(1, len(chunks))
+            indexed = 0
+
+            # 2) Embed and index slice by slice, reporting real chunk counts
+            def on_chunks(n):
+                nonlocal indexed
+                indexed += n
+                progress_bar.progress(indexed / total, f"Embedded {indexed} of {len(chunks)} chunks...")
+
+            with self._lock:
+                self.doc_chunks[doc_id] = array("q")
+                self.doc_names[doc_id] = doc_id
+            self._add_chunks(doc_id, chunks, on_chunks)
+            self.optimize_index()
+
+            # 3) Persist for the next time the same text is indexed
+            try:
+                self.save_to_cache()
+            except OSError:
+                pass  # Caching is best-effort; the in-memory index is still usable
+
             # Done!
             progress_bar.progress(1.0, "Vector store ready!")
-            
+
         except Exception as e:
             progress_bar.empty()
             raise e  # Re-raise to be caught by the app
 
-    def retrieve(self, query: str, k: int = 3):
+    def embed_query(self, query: str):
+        """
+        Return the normalized embedding of a query, shape (1, d).
+        Results are kept in an exact-match LRU cache shared by all stores.
+        """
+        with span("embed_query", cached=True) as s:
+            q_emb = self.query_cache.get(self.embedding_id, query)
+            if q_emb is None:
+                s["cached"] = False
+                q_emb = np.array(self._encode_texts([query], lane=QUERY), dtype=np.float32)
+                faiss.normalize_L2(q_emb)  # Normalize query vector same as index vectors
+                self.query_cache.put(self.embedding_id, query, q_emb)
+        return q_emb
+
+    def _lexical_index(self) -> BM25Index:
+        # Called with the lock held
+        if self._bm25 is None:
+            bm25 = BM25Index()
+            for cid, chunk in self.chunks.items():
+                if self._lexical_member(cid):
+                    bm25.add(cid, chunk)
+            self._bm25 = bm25
+        return self._bm25
+
+    def _dense_search(self, query: str, k: int, q_emb=None):
+        """Return chunk ids of the k nearest chunks, best first."""
+        if q_emb is None:
+            q_emb = self.embed_query(query)
+        # Search FAISS (ids are chunk ids; -1 pads missing results)
+        with self._lock, span("retrieve.dense", k=k):
+            if self.index is None:
+                return []
+            # Over-fetch by the number of removed-but-still-indexed vectors (HNSW)
+            k_search = min(self.index.ntotal, k + self.index.ntotal - self.num_vectors())
+            distances, indices = self.index.search(q_emb, max(1, k_search))
+        return [int(idx) for idx in indices[0] if int(idx) in self.chunks][:k]
+
+    def _lexical_search(self, query: str, k: int, budget_ms: float):
+        """Return (chunk id, score) pairs from BM25, best first."""
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        with self._lock, span("retrieve.lexical", k=k):
+            return self._lexical_index().search(query, k, deadline=deadline)
+
+    def retrieve(self, query: str, k: int = 3, **kwargs):
         """
         Given a query string, return the top-k most relevant text chunks.
+        Accepts the same options as retrieve_ids.
         """
-        if self.index is None:
-            return []        # Embed the query and normalize
-        q_emb = self.embedder.encode([query], convert_to_numpy=True)
-        faiss.normalize_L2(q_emb)  # Normalize query vector same as index vectors
-        # Search FAISS
-        distances, indices = self.index.search(q_emb, k)
-        results = []
-        for idx in indices[0]:
-            if idx < len(self.text_chunks):
-                results.append(self.text_chunks[idx])
-        return results
+        return self._texts(self.retrieve_ids(query, k, **kwargs))
+
+    def retrieve_ids(self, query: str, k: int = 3, q_emb=None, dense_weight: float = DENSE_WEIGHT,
+                     lexical_weight: float = LEXICAL_WEIGHT, budget_ms: float = LEXICAL_BUDGET_MS):
+        """
+        Given a query string, return the chunk ids of the top-k most relevant chunks.
+
+        Dense (FAISS) and lexical (BM25) rankings are fused with reciprocal rank
+        fusion, so exact terms such as part numbers, section ids and acronyms are
+        found even when the embedding misses them. Set a weight to 0 to disable a
+        signal. Queries with identifiers whose best BM25 hit is decisive skip the
+        dense search. While a document is being ingested, this searches whatever
+        is indexed so far. Pass q_emb to reuse a query embedding the caller already has.
+        """
+        with span("retrieve", k=k) as s:
+            ids = self._rank_ids(query, k, q_emb, dense_weight, lexical_weight, budget_ms)
+            s["results"] = len(ids)
+        return ids
+
+    def _rank_ids(self, query, k, q_emb, dense_weight, lexical_weight, budget_ms):
+        if self.index is None or self.index.ntotal == 0:
+            return []
+
+        lexical = []
+        if lexical_weight > 0:
+            lexical = self._lexical_search(query, k, budget_ms)
+            decisive = (
+                len(lexical) == 1
+                or (len(lexical) > 1 and lexical[0][1] >= KEYWORD_SHORT_CIRCUIT_RATIO * lexical[1][1])
+            )
+            if dense_weight <= 0 or (decisive and has_identifier(query)):
+                return [cid for cid, _ in lexical]
+
+        dense = self._dense_search(query, k, q_emb) if dense_weight > 0 else []
+        ranked = reciprocal_rank_fusion(
+            [dense, [cid for cid, _ in lexical]], [dense_weight, lexical_weight], k=RRF_K
+        )
+        return ranked[:k]
+
+    def _texts(self, ids):
+        with self._lock:
+            return [self.chunks.get(cid) for cid in ids if cid in self.chunks]
+
+    def chunk_records(self, ids):
+        """
+        Return (chunk_id, doc_id, text, sources) for the ids that are still indexed;
+        only these chunks are decoded. sources lists every document that contains
+        the chunk or a duplicate of it (see sources()), the chunk's own first.
+        """
+        with self._lock:
+            return [(cid, self.chunks.doc_of(cid), self.chunks.get(cid), self._sources_locked(cid))
+                    for cid in ids if cid in self.chunks]
+
+    def page_of(self, cid: int) -> int:
+        """Page the chunk starts on (0 for text without pages, e.g. DOCX)."""
+        with self._lock:
+            return self.chunks.page_of(cid)
+
+    def chunk_vectors(self, ids):
+        """Return the stored (normalized) embeddings of the given chunk ids, shape (n, d)."""
+        with self._lock:
+            if self.index is None or not ids:
+                return np.zeros((0, 0), dtype=np.float32)
+            return np.stack([self.index.reconstruct(int(self.dup_of.get(cid, cid))) for cid in ids])
+
+    def sources(self, cid: int):
+        """Doc ids of every document that contains the chunk or a duplicate of it."""
+        with self._lock:
+            return list(self._sources_locked(cid))
+
+    def _sources_locked(self, cid: int):
+        docs = [self.chunks.doc_of(cid)] if cid in self.chunks else []
+        canonical = self.dup_of.get(cid, cid)
+        for member in (canonical, *self.dup_refs.get(canonical, ())):
+            if member in self.chunks:
+                doc = self.chunks.doc_of(member)
+                if doc not in docs:
+                    docs.append(doc)
+        return tuple(docs)
+
+    def dedup_report(self) -> dict:
+        """What duplicate elimination saved: chunks stored vs. vectors embedded and indexed."""
+        with self._lock:
+            d = self.index.d if self.index is not None else 0
+            return dict(
+                self.dedup_stats,
+                stored_chunks=len(self.chunks),
+                vectors=self.num_vectors(),
+                duplicates=len(self.dup_of),
+                vector_bytes_saved=len(self.dup_of) * d * 4,
+            )